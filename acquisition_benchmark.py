@@ -0,0 +1,147 @@
+import os
+import csv
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import io
+import numpy as np
+
+from data_transfer import BUFFER_METERS, COLLECTION_IDS, fetch_all_sensors
+from batch_acquisition import run_batch
+from local_backend import DEFAULT_FIXTURE_DIR, LocalBackend
+
+BENCHMARK_DATES = ('2023-01-01', '2023-12-31')
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else float('nan')
+
+
+def _summarize(scenario, latencies, acquisitions, nbytes, retries, failures, elapsed):
+    return {
+        'scenario': scenario,
+        'runs': len(latencies),
+        'latency_mean_s': round(float(np.mean(latencies)), 4) if latencies else float('nan'),
+        'latency_p50_s': round(_percentile(latencies, 50), 4),
+        'latency_p95_s': round(_percentile(latencies, 95), 4),
+        'acquisitions_per_s': round(acquisitions / elapsed, 2) if elapsed > 0 else 0.0,
+        'mib_per_s': round(nbytes / elapsed / 2 ** 20, 3) if elapsed > 0 else 0.0,
+        'retries': retries,
+        'failures': failures,
+    }
+
+
+def _result_stats(results):
+    """Returns (bytes written, retries, failed tasks) of fetch_all_sensors results"""
+    nbytes = retries = failures = 0
+    for result in results.values():
+        retries += max(result.attempts - 1, 0)
+        if result.error is not None:
+            failures += 1
+            continue
+        for path in result.value.values():
+            if os.path.exists(path):
+                nbytes += os.path.getsize(path)
+    return nbytes, retries, failures
+
+
+def bench_sensors(backend, names, repeats, work_dir, retries=2):
+    """Times fetch_all_sensors for the given sensors at `repeats` distinct points"""
+    latencies = []
+    nbytes = total_retries = failures = 0
+    started = time.perf_counter()
+    for run in range(repeats):
+        output_dir = os.path.join(work_dir, f'run_{run}')
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, results = fetch_all_sensors(12.9716 + run * 0.01, 77.5946, *BENCHMARK_DATES, output_dir,
+                                           retries=retries, backoff=0.0, backend=backend, names=names)
+        latencies.append(time.perf_counter() - start)
+        run_bytes, run_retries, run_failures = _result_stats(results)
+        nbytes += run_bytes
+        total_retries += run_retries
+        failures += run_failures
+    return latencies, repeats * len(names), nbytes, total_retries, failures, time.perf_counter() - started
+
+
+def bench_batch(backend, aois, workers, work_dir):
+    """Times run_batch over `aois` well-separated AOIs"""
+    input_path = os.path.join(work_dir, 'aois.csv')
+    with open(input_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['lat', 'lon', 'start_date', 'end_date'])
+        for index in range(aois):
+            writer.writerow([10.0 + index * 0.05, 77.0, *BENCHMARK_DATES])
+
+    def fetch_aoi(lat, lon, start_date, end_date, output_dir):
+        return fetch_all_sensors(lat, lon, start_date, end_date, output_dir, backoff=0.0, backend=backend)
+
+    calls_before = backend.calls
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary = run_batch(input_path, os.path.join(work_dir, 'batch'), fetch_aoi, BUFFER_METERS,
+                            workers=workers)
+    elapsed = time.perf_counter() - start
+    downloads = backend.calls - calls_before
+    # Every download beyond one per sensor and AOI was a retry
+    retries = max(downloads - aois * len(COLLECTION_IDS), 0)
+    return [elapsed], summary['aois_done'] * len(COLLECTION_IDS), summary['bytes'], retries, \
+        summary['aois_failed'], elapsed
+
+
+def run_benchmark(fixture_dir=DEFAULT_FIXTURE_DIR, latency=0.2, jitter=0.1, failure_rate=0.1,
+                  repeats=5, aois=20, workers=4, seed=0):
+    """Runs the single, multi-sensor and batch scenarios against a LocalBackend"""
+    rows = []
+    work_dir = tempfile.mkdtemp(prefix='acquisition_benchmark_')
+    try:
+        scenarios = [
+            ('single', lambda backend: bench_sensors(backend, ('SENTINEL_2',), repeats,
+                                                     os.path.join(work_dir, 'single'))),
+            ('multi-sensor', lambda backend: bench_sensors(backend, tuple(COLLECTION_IDS), repeats,
+                                                           os.path.join(work_dir, 'multi'))),
+            ('batch', lambda backend: bench_batch(backend, aois, workers, work_dir)),
+        ]
+        for scenario, bench in scenarios:
+            backend = LocalBackend(fixture_dir, latency=latency, jitter=jitter,
+                                   failure_rate=failure_rate, seed=seed)
+            rows.append(_summarize(scenario, *bench(backend)))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return rows
+
+
+def print_report(rows):
+    print("\n=== ACQUISITION BENCHMARK ===")
+    print(f"{'scenario':<14}{'runs':>5}{'mean s':>9}{'p50 s':>9}{'p95 s':>9}"
+          f"{'acq/s':>9}{'MiB/s':>9}{'retries':>9}{'failed':>8}")
+    for row in rows:
+        print(f"{row['scenario']:<14}{row['runs']:>5}{row['latency_mean_s']:>9.3f}{row['latency_p50_s']:>9.3f}"
+              f"{row['latency_p95_s']:>9.3f}{row['acquisitions_per_s']:>9.2f}{row['mib_per_s']:>9.3f}"
+              f"{row['retries']:>9}{row['failures']:>8}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline acquisition benchmark against a local Earth Engine stand-in")
+    parser.add_argument('--fixtures', default=DEFAULT_FIXTURE_DIR,
+                        help="Directory with <SENSOR>_*.tif fixtures; 'none' for synthetic rasters")
+    parser.add_argument('--latency', type=float, default=0.2, help="Base latency per backend call in seconds")
+    parser.add_argument('--jitter', type=float, default=0.1, help="Extra random latency per call in seconds")
+    parser.add_argument('--failure-rate', type=float, default=0.1, help="Probability that a download fails")
+    parser.add_argument('--repeats', type=int, default=5, help="Runs of the single and multi-sensor scenarios")
+    parser.add_argument('--aois', type=int, default=20, help="AOIs in the batch scenario")
+    parser.add_argument('--workers', type=int, default=4, help="AOIs fetched in parallel in the batch scenario")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for latency and failure draws")
+    parser.add_argument('--json', metavar='FILE', help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    fixtures = None if args.fixtures.lower() == 'none' else args.fixtures
+    results = run_benchmark(fixtures, args.latency, args.jitter, args.failure_rate,
+                            args.repeats, args.aois, args.workers, args.seed)
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
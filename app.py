@@ -1,93 +1,32 @@
 import streamlit as st
-import ee
 import os
-import geemap
 from datetime import datetime
-from PIL import Image
-import numpy as np
-import tifffile
-import io
 
-# Initialize Earth Engine
-def authenticate_and_initialize():
-    """Handles GEE authentication and initialization"""
-    try:
-        ee.Initialize()
-        print("Earth Engine initialized successfully!")
-    except Exception:
-        ee.Authenticate()
-        ee.Initialize()
-        print("Earth Engine initialized successfully!")
+# Earth Engine is imported and initialized on the first "Process Images" click, once per server process
+from data_transfer import fetch_all_sensors, sensor_files, COMPOSITE_MODES
+from tile_cache import TileCache
+from image_pyramid import DEFAULT_PYRAMID_DIR, DEFAULT_MAX_BYTES, raster_file_pyramid
+from instrumentation import Run
+from cloud_mask import MASKED_CLOUD_THRESHOLD, open_mask, valid_fraction
 
-authenticate_and_initialize()
+# Width of the pyramid level sent to the browser for each sensor image
+DISPLAY_WIDTH = 1024
 
-# Function to process satellite image collections
-def process_collection(collection, name, point, region, start_date, end_date):
-    """Processes an individual collection"""
-    if 'SENTINEL' in name:
-        filtered = collection.filterBounds(point) \
-                             .filterDate(start_date, end_date) \
-                             .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 20)) \
-                             .sort('CLOUDY_PIXEL_PERCENTAGE')
-    else:  # Landsat
-        filtered = collection.filterBounds(point) \
-                             .filterDate(start_date, end_date) \
-                             .filter(ee.Filter.lt('CLOUD_COVER', 20)) \
-                             .sort('CLOUD_COVER')
+SENSOR_LABELS = {
+    "LANDSAT_8": "Landsat 8",
+    "LANDSAT_9": "Landsat 9",
+    "SENTINEL_2": "Sentinel-2",
+}
 
-    image = filtered.first()
-    if not image:
-        st.warning(f"No {name} images found matching the criteria!")
-        return None
+@st.cache_resource
+def get_tile_cache():
+    """Returns the tile cache shared by every session"""
+    return TileCache()
 
-    if 'LANDSAT' in name:
-        image = image.select(['SR_B4', 'SR_B3', 'SR_B2']).multiply(0.0000275).add(-0.2)
-    elif 'SENTINEL' in name:
-        image = image.select(['B4', 'B3', 'B2']).divide(10000)
-
-    return image.clip(region)
-
-# Function to save images locally
-def save_images_locally(image, name, region, lat, lon, output_dir):
-    if not image:
-        return None
-
-    os.makedirs(output_dir, exist_ok=True)
-    base_filename = f"{output_dir}/{name}_{lat:.4f}_{lon:.4f}"
-
-    # Save GeoTIFF
-    geemap.ee_export_image(
-        image,
-        filename=f'{base_filename}.tif',
-        scale=10,
-        region=region,
-        file_per_band=False
-    )
-
-    # Visualization parameters
-    vis_params = {
-        'bands': ['SR_B4', 'SR_B3', 'SR_B2'] if 'LANDSAT' in name.upper() else ['B4', 'B3', 'B2'],
-        'min': 0,
-        'max': 3000,
-        'gamma': 1.4
-    }
-
-    # Visualize RGB image
-    rgb_image = image.visualize(**vis_params)
-    rgb_tif_path = f'{base_filename}_rgb.tif'
-    geemap.ee_export_image(
-        rgb_image,
-        filename=rgb_tif_path,
-        scale=10,
-        region=region
-    )
-
-    # Convert RGB TIF to PNG
-    png_path = f'{base_filename}.png'
-    with Image.open(rgb_tif_path) as img:
-        img.convert('RGB').save(png_path, 'PNG')
-
-    return png_path
+@st.cache_resource
+def get_pyramid_cache():
+    """Returns the on-disk cache of image pyramids shared by every session"""
+    return TileCache(DEFAULT_PYRAMID_DIR, DEFAULT_MAX_BYTES)
 
 # Streamlit interface
 st.title("Satellite Image Viewer and Downloader")
@@ -98,35 +37,75 @@ lat = st.sidebar.number_input("Latitude", value=12.9716, format="%.6f")
 lon = st.sidebar.number_input("Longitude", value=77.5946, format="%.6f")
 start_date = st.sidebar.date_input("Start Date", value=datetime(2023, 1, 1))
 end_date = st.sidebar.date_input("End Date", value=datetime(2023, 12, 31))
+composite = st.sidebar.selectbox("Composite", COMPOSITE_MODES,
+                                 help="least_cloudy keeps one scene; median and mosaic combine every acceptable scene")
+mask_clouds = st.sidebar.checkbox("Mask clouds per pixel",
+                                  help="Download the QA band and mask clouds locally; accepts scenes up to "
+                                       f"{MASKED_CLOUD_THRESHOLD}% cloud cover")
 
 if st.sidebar.button("Process Images"):
-    point = ee.Geometry.Point([lon, lat])
-    region = point.buffer(225).bounds()
-
-    # Get image collections
-    landsat8 = ee.ImageCollection("LANDSAT/LC08/C02/T1_L2")
-    landsat9 = ee.ImageCollection("LANDSAT/LC09/C02/T1_L2")
-    sentinel2 = ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED")
-
-    # Process collections
-    st.write("Processing satellite collections...")
-    l8_image = process_collection(landsat8, "LANDSAT_8", point, region, str(start_date), str(end_date))
-    l9_image = process_collection(landsat9, "LANDSAT_9", point, region, str(start_date), str(end_date))
-    s2_image = process_collection(sentinel2, "SENTINEL_2", point, region, str(start_date), str(end_date))
-
-    # Save images locally
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     output_dir = f"satellite_images_{timestamp}"
-    l8_path = save_images_locally(l8_image, "LANDSAT_8", region, lat, lon, output_dir)
-    l9_path = save_images_locally(l9_image, "LANDSAT_9", region, lat, lon, output_dir)
-    s2_path = save_images_locally(s2_image, "SENTINEL_2", region, lat, lon, output_dir)
 
-    st.success(f"Images saved to: {os.path.abspath(output_dir)}")
+    # One progress bar per sensor, updated as its exports finish
+    st.write("Processing satellite collections...")
+    progress_bars = {name: st.progress(0.0, text=f"{label}: queued") for name, label in SENSOR_LABELS.items()}
+
+    def show_progress(result, done, total):
+        label = SENSOR_LABELS[result.group]
+        if result.error is not None:
+            st.warning(f"{label} export failed after {result.attempts} attempt(s): {result.error}")
+            progress_bars[result.group].progress(1.0, text=f"{label}: failed")
+        elif result.attempts == 0:
+            progress_bars[result.group].progress(1.0, text=f"{label}: cached")
+        else:
+            progress_bars[result.group].progress(1.0, text=f"{label}: done ({result.elapsed:.1f}s)")
+
+    # A single export per sensor: reflectance is downloaded once and RGB/PNG rendered locally
+    with Run('acquisition', profile=st.session_state.get('perf_profile', False),
+             trace_memory=st.session_state.get('perf_trace_memory', False)) as run:
+        rgb_paths, results = fetch_all_sensors(lat, lon, str(start_date), str(end_date), output_dir,
+                                               on_progress=show_progress, cache=get_tile_cache(),
+                                               composite=composite, mask_clouds=mask_clouds)
+    st.session_state['last_run'] = run
+
+    # Sensors without a matching scene had nothing to export
+    reported = {result.group for result in results.values()}
+    for name, label in SENSOR_LABELS.items():
+        if name not in reported:
+            progress_bars[name].progress(1.0, text=f"{label}: no image")
+
+    if not any(rgb_paths.values()):
+        st.error("No images were found for these parameters.")
+    elif all(result.attempts == 0 for result in results.values()):
+        st.success("All images served from the local tile cache")
+    else:
+        st.success(f"Images saved to: {os.path.abspath(output_dir)}")
 
     # Display images
-    if l8_path:
-        st.image(l8_path, caption="Landsat 8 Image", use_column_width=True)
-    if l9_path:
-        st.image(l9_path, caption="Landsat 9 Image", use_column_width=True)
-    if s2_path:
-        st.image(s2_path, caption="Sentinel-2 Image", use_column_width=True)
\ No newline at end of file
+    for name, label in SENSOR_LABELS.items():
+        if rgb_paths.get(name):
+            # Send only the overview level that fits the page, not every exported pixel;
+            # the RGB GeoTIFF is memory-mapped, so there is no PNG to decode
+            pyramid = raster_file_pyramid(rgb_paths[name], get_pyramid_cache())
+            st.image(pyramid.for_display(DISPLAY_WIDTH), caption=f"{label} Image", use_column_width=True)
+            mask_path = sensor_files(results, name).get('mask')
+            if mask_path:
+                st.caption(f"{valid_fraction(open_mask(mask_path)):.0%} of {label} pixels are cloud-free")
+        else:
+            st.warning(f"No {label} image available for these parameters.")
+
+# Stage breakdown of the last "Process Images" run in this session
+with st.expander("Performance"):
+    last_run = st.session_state.get('last_run')
+    if last_run is None:
+        st.caption("Process images to see where the time goes.")
+    else:
+        st.caption(f"Last run took {last_run.elapsed:.2f} s")
+        st.dataframe(last_run.table(), use_container_width=True)
+        if last_run.memory_peak is not None:
+            st.write(f"Peak traced Python memory: {last_run.memory_peak / 2 ** 20:.1f} MiB")
+        if last_run.profile_report:
+            st.code(last_run.profile_report)
+    st.checkbox("Profile the next run with cProfile", key="perf_profile")
+    st.checkbox("Trace memory allocations on the next run", key="perf_trace_memory")
@@ -0,0 +1,187 @@
+import os
+import csv
+import json
+import math
+import time
+from datetime import datetime
+
+from fetch_scheduler import FetchTask, run_tasks
+
+METERS_PER_DEGREE = 111320.0
+
+# Share of an AOI's box that a kept AOI must cover for it to be dropped
+DUPLICATE_OVERLAP = 0.5
+
+
+def _parse_row(row, line_no):
+    """Converts a CSV/JSONL record into an AOI dict"""
+    try:
+        lat = float(row.get('lat', row.get('latitude')))
+        lon = float(row.get('lon', row.get('longitude')))
+        start_date = str(row.get('start_date', row.get('start'))).strip()
+        end_date = str(row.get('end_date', row.get('end'))).strip()
+        datetime.strptime(start_date, '%Y-%m-%d')
+        datetime.strptime(end_date, '%Y-%m-%d')
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid AOI on line {line_no}: {row}") from e
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError(f"Coordinates out of range on line {line_no}: {row}")
+    if end_date < start_date:
+        raise ValueError(f"End date before start date on line {line_no}: {row}")
+    return {'lat': lat, 'lon': lon, 'start_date': start_date, 'end_date': end_date}
+
+
+def read_aois(path):
+    """Reads (lat, lon, start, end) rows from a CSV or JSONL file"""
+    aois = []
+    with open(path, newline='') as f:
+        if path.lower().endswith(('.jsonl', '.ndjson')):
+            for line_no, line in enumerate(f, 1):
+                if line.strip():
+                    aois.append(_parse_row(json.loads(line), line_no))
+        else:
+            for line_no, row in enumerate(csv.DictReader(f), 2):
+                aois.append(_parse_row(row, line_no))
+    return aois
+
+
+def aoi_id(aoi):
+    """Returns a stable identifier for an AOI"""
+    return f"{aoi['lat']:.4f}_{aoi['lon']:.4f}_{aoi['start_date']}_{aoi['end_date']}"
+
+
+def dedupe_aois(aois, buffer_meters):
+    """Drops AOIs whose buffered box mostly overlaps an earlier AOI with the same dates.
+
+    AOIs are squares of half-width `buffer_meters`; a later AOI is a
+    duplicate when it shares more than DUPLICATE_OVERLAP of its area with a
+    kept one. Points are bucketed on a grid of the box size, so only the
+    3x3 neighbouring cells can overlap. Returns (kept AOIs, {dropped AOI id:
+    id of the kept AOI covering it}).
+    """
+    side = 2 * buffer_meters
+    grid = {}
+    kept = []
+    duplicates = {}
+    for aoi in aois:
+        y = aoi['lat'] * METERS_PER_DEGREE
+        x = aoi['lon'] * METERS_PER_DEGREE * math.cos(math.radians(aoi['lat']))
+        cell_y, cell_x = int(y // side), int(x // side)
+        dates = (aoi['start_date'], aoi['end_date'])
+
+        best = None
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                for other_x, other_y, other in grid.get((dates, cell_y + dy, cell_x + dx), ()):
+                    # Shared area of two equal axis-aligned squares, as a fraction of one
+                    overlap = max(side - abs(other_x - x), 0) * max(side - abs(other_y - y), 0) / side ** 2
+                    if overlap > DUPLICATE_OVERLAP and (best is None or overlap > best[0]):
+                        best = (overlap, other)
+        if best is not None:
+            duplicates[aoi_id(aoi)] = aoi_id(best[1])
+            continue
+        grid.setdefault((dates, cell_y, cell_x), []).append((x, y, aoi))
+        kept.append(aoi)
+    return kept, duplicates
+
+
+def load_manifest(manifest_path, status='done'):
+    """Returns the ids of AOIs recorded with `status` ('done' or 'duplicate') in a previous run"""
+    completed = set()
+    if not os.path.exists(manifest_path):
+        return completed
+    with open(manifest_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A crash can leave a partially written last line
+                continue
+            if record.get('status') == status:
+                completed.add(record['aoi_id'])
+    return completed
+
+
+def _downloaded_bytes(results):
+    """Sums the size of files actually downloaded (cache hits excluded)"""
+    total = 0
+    for result in results.values():
+        if result.error is None and result.attempts > 0:
+            for path in result.value.values():
+                if os.path.exists(path):
+                    total += os.path.getsize(path)
+    return total
+
+
+def run_batch(input_path, output_root, fetch_aoi, buffer_meters, workers=4,
+              timeout=1800, retries=1):
+    """Fetches every AOI in a CSV/JSONL file, resuming from the manifest.
+
+    `fetch_aoi(lat, lon, start_date, end_date, output_dir)` must return
+    (image_paths, results) like data_transfer.fetch_all_sensors.
+    """
+    os.makedirs(output_root, exist_ok=True)
+    manifest_path = os.path.join(output_root, 'manifest.jsonl')
+
+    aois = read_aois(input_path)
+    unique, duplicates = dedupe_aois(aois, buffer_meters)
+    completed = load_manifest(manifest_path)
+    recorded = load_manifest(manifest_path, 'duplicate')
+    todo = [aoi for aoi in unique if aoi_id(aoi) not in completed]
+    print(f"\n=== BATCH: {len(aois)} rows, {len(unique)} unique AOIs, {len(duplicates)} duplicates, "
+          f"{len(unique) - len(todo)} already done, {len(todo)} to fetch ===")
+
+    def fetch_one(aoi):
+        output_dir = os.path.join(output_root, aoi_id(aoi))
+        image_paths, results = fetch_aoi(aoi['lat'], aoi['lon'], aoi['start_date'], aoi['end_date'], output_dir)
+        failed = [key for key, result in results.items() if result.error is not None]
+        if failed:
+            raise RuntimeError(f"exports failed: {', '.join(failed)}")
+        return image_paths, _downloaded_bytes(results)
+
+    tasks = [FetchTask(aoi_id(aoi), 'batch', fetch_one, (aoi,)) for aoi in todo]
+    stats = {'done': 0, 'failed': 0, 'bytes': 0}
+    started = time.monotonic()
+
+    with open(manifest_path, 'a') as manifest:
+        # Dropped AOIs point at the kept one whose images cover them
+        for dropped, covering in duplicates.items():
+            if dropped not in recorded:
+                manifest.write(json.dumps({'aoi_id': dropped, 'status': 'duplicate', 'covered_by': covering}) + '\n')
+        manifest.flush()
+
+        def record(result, done, total):
+            entry = {'aoi_id': result.key, 'attempts': result.attempts, 'elapsed': round(result.elapsed, 3)}
+            if result.error is None:
+                image_paths, nbytes = result.value
+                stats['done'] += 1
+                stats['bytes'] += nbytes
+                entry.update(status='done', image_paths=image_paths, bytes=nbytes)
+            else:
+                stats['failed'] += 1
+                entry.update(status='failed', error=str(result.error))
+            # Flush each line so a crash loses at most the AOIs in flight
+            manifest.write(json.dumps(entry) + '\n')
+            manifest.flush()
+
+            elapsed = max(time.monotonic() - started, 1e-9)
+            print(f" [{done}/{total}] {result.key} {entry['status']} | "
+                  f"{stats['done'] * 60 / elapsed:.1f} AOIs/min, {stats['bytes'] / elapsed / 1024:.1f} KiB/s")
+
+        run_tasks(tasks, max_workers=workers, timeout=timeout, retries=retries, on_progress=record)
+
+    elapsed = time.monotonic() - started
+    summary = {
+        'aois_total': len(unique),
+        'aois_done': stats['done'],
+        'aois_failed': stats['failed'],
+        'aois_skipped': len(unique) - len(todo),
+        'aois_duplicate': len(duplicates),
+        'seconds': round(elapsed, 2),
+        'aois_per_min': round(stats['done'] * 60 / elapsed, 2) if elapsed > 0 else 0.0,
+        'bytes': stats['bytes'],
+        'bytes_per_sec': round(stats['bytes'] / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+    print("\n=== BATCH COMPLETE ===")
+    print(json.dumps(summary, indent=2))
+    return summary
@@ -0,0 +1,197 @@
+import os
+import csv
+import math
+import time
+import shutil
+import zipfile
+import argparse
+import tempfile
+from concurrent.futures import as_completed
+import numpy as np
+from PIL import Image
+
+from tiff_reader import read_tiff_info, read_tiff_uint8
+from sr_metrics import compute_metrics
+from coregistration import align_to_reference, read_georeference, scale_georeference
+from worker_pool import process_pool
+
+# Longest side of the preview each SR image is decoded to before alignment
+PREVIEW_SIZE = 2048
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff')
+TIFF_EXTENSIONS = ('.tif', '.tiff')
+
+# Column order of the results table
+RESULT_COLUMNS = ('file', 'bytes', 'width', 'height', 'psnr', 'ssim', 'ms_ssim', 'rmse', 'sam',
+                  'alignment', 'shift_y', 'shift_x', 'decode_s', 'align_s', 'metrics_s', 'total_s', 'error')
+
+# Reference decoded once per worker process by _init_worker
+_reference = None
+
+
+def load_rgb(path, max_size=None):
+    """Decodes an image file to (uint8 RGB array, full (height, width), georeference).
+
+    TIFFs are streamed through read_tiff_uint8; with `max_size` only a
+    subsampled preview is decoded. PNG/JPEG are reduced while decoding.
+    """
+    if path.lower().endswith(TIFF_EXTENSIONS):
+        height, width, _, _ = read_tiff_info(path)
+        arr = read_tiff_uint8(path, max_size=max_size)
+        geo = scale_georeference(read_georeference(path), width / arr.shape[1])
+    else:
+        with Image.open(path) as img:
+            width, height = img.size
+            if max_size is not None and max(width, height) > max_size:
+                # JPEG decodes at 1/2, 1/4 or 1/8 scale directly
+                img.draft('RGB', (max_size, max_size))
+                factor = max(1, math.ceil(max(img.size) / max_size))
+                img = img.reduce(factor) if factor > 1 else img
+            arr = np.asarray(img.convert('RGB'))
+        geo = None
+    if arr.ndim == 2:
+        arr = np.repeat(arr[:, :, np.newaxis], 3, axis=2)
+    elif arr.shape[2] == 1:
+        arr = np.repeat(arr, 3, axis=2)
+    return arr[:, :, :3], (height, width), geo
+
+
+def _init_worker(reference_path):
+    global _reference
+    reference, _, reference_geo = load_rgb(reference_path)
+    _reference = (reference, reference_geo)
+
+
+def score_file(path, preview_size=PREVIEW_SIZE):
+    """Decodes, aligns and scores one SR image against the worker's reference.
+
+    Returns a results row; failures are reported in its 'error' column
+    instead of aborting the batch.
+    """
+    row = {'file': os.path.basename(path), 'bytes': os.path.getsize(path), 'error': ''}
+    started = time.perf_counter()
+    try:
+        reference, reference_geo = _reference
+        arr, (height, width), geo = load_rgb(path, preview_size)
+        row.update(width=width, height=height)
+        decoded = time.perf_counter()
+        aligned, transform = align_to_reference(reference, arr, reference_geo, geo)
+        aligned_at = time.perf_counter()
+        # The pool already runs one image per core
+        metrics = compute_metrics(reference, aligned, workers=1)
+        scored = time.perf_counter()
+    except Exception as e:
+        row['error'] = f'{type(e).__name__}: {e}'
+        row['total_s'] = round(time.perf_counter() - started, 4)
+        return row
+
+    channels = metrics['channels']
+    row.update(
+        psnr=float(np.mean([channel['psnr'] for channel in channels])),
+        ssim=float(np.mean([channel['ssim'] for channel in channels])),
+        ms_ssim=float(np.mean([channel['ms_ssim'] for channel in channels])),
+        rmse=float(np.mean([channel['rmse'] for channel in channels])),
+        sam=metrics['sam'],
+        alignment=transform['method'],
+        shift_y=transform['shift'][0],
+        shift_x=transform['shift'][1],
+        decode_s=round(decoded - started, 4),
+        align_s=round(aligned_at - decoded, 4),
+        metrics_s=round(scored - aligned_at, 4),
+        total_s=round(scored - started, 4),
+    )
+    return row
+
+
+def collect_inputs(source, extract_dir=None):
+    """Returns the image paths in a directory (recursively), a .zip file or a list of paths.
+
+    Zip members are extracted to `extract_dir` (a new temporary directory by
+    default), since workers read images from disk.
+    """
+    if isinstance(source, (list, tuple)):
+        return [path for path in source if path.lower().endswith(IMAGE_EXTENSIONS)]
+    if zipfile.is_zipfile(source):
+        extract_dir = extract_dir or tempfile.mkdtemp(prefix='sr_batch_')
+        with zipfile.ZipFile(source) as archive:
+            members = [member for member in archive.namelist()
+                       if member.lower().endswith(IMAGE_EXTENSIONS) and not member.startswith('__MACOSX/')]
+            archive.extractall(extract_dir, members)
+        return [os.path.join(extract_dir, member) for member in members]
+    paths = []
+    for root, _, files in os.walk(source):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS))
+    return paths
+
+
+def compare_files(paths, reference_path, workers=None, preview_size=PREVIEW_SIZE, on_result=None):
+    """Scores many SR images against one reference in a process pool.
+
+    Files are submitted largest first, so a huge TIFF starts early instead
+    of becoming the straggler that the whole batch waits on. Each worker
+    decodes the reference once. `on_result(row, done, total)` is called from
+    the calling thread as images finish. Returns the rows in completion order.
+    """
+    paths = sorted(paths, key=os.path.getsize, reverse=True)
+    rows = []
+    if not paths:
+        return rows
+    workers = max(1, min(workers or os.cpu_count() or 1, len(paths)))
+    with process_pool(workers, _init_worker, (reference_path,)) as executor:
+        futures = {executor.submit(score_file, path, preview_size): path for path in paths}
+        for future in as_completed(futures):
+            try:
+                row = future.result()
+            except Exception as e:
+                # A worker crash (e.g. out of memory) only fails its own image
+                path = futures[future]
+                row = {'file': os.path.basename(path), 'bytes': os.path.getsize(path),
+                       'error': f'{type(e).__name__}: {e}'}
+            rows.append(row)
+            if on_result is not None:
+                on_result(row, len(rows), len(paths))
+    return rows
+
+
+def write_results(rows, path):
+    """Writes result rows as CSV, or as Parquet when the path ends in .parquet (needs pandas/pyarrow)"""
+    if path.lower().endswith('.parquet'):
+        try:
+            import pandas as pd
+        except ImportError as e:
+            raise RuntimeError("Parquet export needs pandas and pyarrow; use a .csv path instead") from e
+        pd.DataFrame(rows, columns=RESULT_COLUMNS).to_parquet(path, index=False)
+        return path
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({column: row.get(column, '') for column in RESULT_COLUMNS})
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Score a folder or zip of SR images against one reference")
+    parser.add_argument('reference', help="Reference image (e.g. a satellite _rgb.tif)")
+    parser.add_argument('inputs', help="Directory or .zip of SR images")
+    parser.add_argument('--output', default='sr_batch_results.csv', help="Results file (.csv or .parquet)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    extract_dir = tempfile.mkdtemp(prefix='sr_batch_') if zipfile.is_zipfile(args.inputs) else None
+    try:
+        inputs = collect_inputs(args.inputs, extract_dir)
+        started = time.perf_counter()
+
+        def report(row, done, total):
+            status = row['error'] or f"PSNR {row['psnr']:.2f} dB, SSIM {row['ssim']:.4f}"
+            print(f" [{done}/{total}] {row['file']}: {status}")
+
+        results = compare_files(inputs, args.reference, args.workers, on_result=report)
+        elapsed = time.perf_counter() - started
+        write_results(sorted(results, key=lambda row: row['file']), args.output)
+        print(f"\n{len(results)} image(s) in {elapsed:.1f} s ({len(results) / max(elapsed, 1e-9):.2f} images/s)")
+        print(f"Results written to: {os.path.abspath(args.output)}")
+    finally:
+        if extract_dir is not None:
+            shutil.rmtree(extract_dir, ignore_errors=True)
@@ -0,0 +1,105 @@
+import numpy as np
+import tifffile
+
+from raster_store import create_raster, finish_raster, geotiff_extratags, open_raster, read_index
+
+# Per-pixel quality band exported alongside the RGB bands of each sensor
+LANDSAT_QA_BAND = 'QA_PIXEL'
+SENTINEL_QA_BAND = 'SCL'
+
+# Landsat Collection 2 QA_PIXEL bits that make a pixel unusable:
+# 0 fill, 1 dilated cloud, 2 cirrus, 3 cloud, 4 cloud shadow
+LANDSAT_INVALID_BITS = (0, 1, 2, 3, 4)
+
+# Sentinel-2 scene classification values that make a pixel unusable:
+# 0 no data, 1 saturated/defective, 3 cloud shadow, 8/9 cloud medium/high
+# probability, 10 thin cirrus
+SENTINEL_INVALID_CLASSES = (0, 1, 3, 8, 9, 10)
+
+# Scene cloud limit when clouds are masked per pixel; partly cloudy scenes
+# still contribute their clear pixels
+MASKED_CLOUD_THRESHOLD = 60
+
+# Rows decoded per block when writing a mask raster
+BLOCK_ROWS = 1024
+
+
+def qa_band(name):
+    """Returns the quality band name of a sensor"""
+    return LANDSAT_QA_BAND if 'LANDSAT' in name.upper() else SENTINEL_QA_BAND
+
+
+def decode_qa_pixel(qa, invalid_bits=LANDSAT_INVALID_BITS, out=None):
+    """Returns True where a Landsat QA_PIXEL value has none of `invalid_bits` set.
+
+    One bitwise AND against a combined flag word, so any array shape
+    (including float32 exports of the band) is decoded in a single pass.
+    """
+    flags = 0
+    for bit in invalid_bits:
+        flags |= 1 << bit
+    qa = np.asarray(qa)
+    if qa.dtype.kind == 'f':
+        # Exported together with float reflectance; NaN means no data
+        valid = np.isfinite(qa)
+        qa = np.nan_to_num(qa, nan=1.0).astype(np.uint16)
+        return np.logical_and(np.bitwise_and(qa, flags) == 0, valid, out=out)
+    return np.equal(np.bitwise_and(qa, flags), 0, out=out)
+
+
+def decode_scl(scl, invalid_classes=SENTINEL_INVALID_CLASSES, out=None):
+    """Returns True where a Sentinel-2 SCL value is not one of `invalid_classes`.
+
+    Classes are looked up in a 256-entry table, so decoding is one gather.
+    """
+    table = np.ones(256, dtype=bool)
+    table[list(invalid_classes)] = False
+    # NaN (no data) and out-of-range values map to class 0
+    classes = np.asarray(scl)
+    if classes.dtype.kind == 'f':
+        classes = np.nan_to_num(classes, nan=0.0)
+    classes = np.clip(classes, 0, 255).astype(np.uint8, copy=False)
+    return np.take(table, classes, out=out)
+
+
+def decode_mask(qa, name, out=None):
+    """Returns the boolean valid-pixel mask of a sensor's quality band"""
+    if qa_band(name) == LANDSAT_QA_BAND:
+        return decode_qa_pixel(qa, out=out)
+    return decode_scl(qa, out=out)
+
+
+def write_mask_raster(tif_path, name, mask_path):
+    """Decodes the quality band of an exported raster into a uint8 0/1 mask raster.
+
+    The quality band is the band named after the sensor's QA band in the
+    sidecar index (the last band of exports with `mask_clouds`). Blocks are
+    decoded straight from the memory-mapped export into the memory-mapped
+    mask, which keeps the export's georeference. Returns the mask path.
+    """
+    index = read_index(tif_path) or {}
+    bands = index.get('bands', [])
+    if qa_band(name) not in bands:
+        raise ValueError(f"{tif_path} has no {qa_band(name)} band")
+    band = bands.index(qa_band(name))
+    data = open_raster(tif_path)
+    with tifffile.TiffFile(tif_path) as tif:
+        extratags = geotiff_extratags(tif.pages[0])
+
+    mask = create_raster(mask_path, data.shape[:2], np.uint8, extratags)
+    for start in range(0, data.shape[0], BLOCK_ROWS):
+        qa = data[start:start + BLOCK_ROWS, :, band] if data.ndim == 3 else data[start:start + BLOCK_ROWS]
+        mask[start:start + BLOCK_ROWS] = decode_mask(qa, name)
+    finish_raster(mask_path, mask, band_names=('valid',))
+    return mask_path
+
+
+def open_mask(mask_path):
+    """Returns a mask raster as a read-only boolean view of its memory map"""
+    return open_raster(mask_path).view(bool)
+
+
+def valid_fraction(mask):
+    """Returns the share of valid pixels in a mask"""
+    mask = np.asarray(mask)
+    return float(np.count_nonzero(mask)) / mask.size if mask.size else 0.0
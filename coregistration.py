@@ -0,0 +1,217 @@
+import os
+import json
+import threading
+import numpy as np
+import tifffile
+
+DEFAULT_CACHE_PATH = os.path.join('.sr_cache', 'alignment.json')
+
+# Shifts smaller than this (in reference pixels) are not worth a second resample
+MIN_SHIFT = 0.05
+
+
+# Georeference
+# ------------
+
+def read_georeference(fileobj):
+    """Returns {'epsg', 'transform'} from GeoTIFF tags, or None when absent.
+
+    `transform` is the affine (a, b, c, d, e, f) with x = a*col + b*row + c and
+    y = d*col + e*row + f, in the units of the file's CRS.
+    """
+    if hasattr(fileobj, 'seek'):
+        fileobj.seek(0)
+    try:
+        with tifffile.TiffFile(fileobj) as tif:
+            geotiff = tif.pages[0].geotiff_tags
+    except (tifffile.TiffFileError, ValueError):
+        return None
+    if not geotiff:
+        return None
+
+    epsg = geotiff.get('ProjectedCSTypeGeoKey') or geotiff.get('GeographicTypeGeoKey')
+    epsg = int(epsg) if epsg is not None else None
+    if 'ModelTransformation' in geotiff:
+        m = np.asarray(geotiff['ModelTransformation'], dtype=np.float64).reshape(4, 4)
+        transform = (m[0, 0], m[0, 1], m[0, 3], m[1, 0], m[1, 1], m[1, 3])
+    elif 'ModelPixelScale' in geotiff and 'ModelTiepoint' in geotiff:
+        sx, sy = geotiff['ModelPixelScale'][:2]
+        i, j, _, x, y = geotiff['ModelTiepoint'][:5]
+        transform = (sx, 0.0, x - i * sx, 0.0, -sy, y + j * sy)
+    else:
+        return None
+    return {'epsg': epsg, 'transform': tuple(float(v) for v in transform)}
+
+
+def scale_georeference(geo, factor):
+    """Adjusts a georeference for an image resampled by 1/factor (e.g. a preview)"""
+    if geo is None:
+        return None
+    a, b, c, d, e, f = geo['transform']
+    return {'epsg': geo['epsg'], 'transform': (a * factor, b * factor, c, d * factor, e * factor, f)}
+
+
+def georeferenced_window(ref_geo, ref_shape, img_geo):
+    """Returns the (y0, y1, x0, x1) window of the image covering the reference grid.
+
+    Only north-up grids in the same CRS are supported; returns None otherwise.
+    """
+    if ref_geo is None or img_geo is None or ref_geo['epsg'] != img_geo['epsg']:
+        return None
+    ra, rb, rc, rd, re, rf = ref_geo['transform']
+    ia, ib, ic, id_, ie, if_ = img_geo['transform']
+    if rb or rd or ib or id_:
+        return None
+    height, width = ref_shape[:2]
+    x0 = (rc - ic) / ia
+    x1 = (rc + ra * width - ic) / ia
+    y0 = (rf - if_) / ie
+    y1 = (rf + re * height - if_) / ie
+    return (y0, y1, x0, x1)
+
+
+# Resampling
+# ----------
+
+def _area_axis(arr, start, stop, size, axis):
+    """Area-averages `arr` along one axis from the window [start, stop) onto `size` cells.
+
+    Each output cell is the exact mean of the (fractional) source interval it
+    covers: whole source pixels are summed with one contiguous np.add.reduce
+    per cell, then the partial pixels at both ends are added with their
+    fractional weights.
+    """
+    n = arr.shape[axis]
+    edges = np.clip(np.linspace(start, stop, size + 1), 0, n)
+    lengths = np.diff(edges)
+    whole = np.floor(edges).astype(np.intp)
+    frac = edges - whole
+    # The last edge may sit exactly on n; its fractional weight is then 0
+    last = np.minimum(whole, n - 1)
+
+    moved = np.moveaxis(arr, axis, 0)
+    sums = np.zeros((size,) + moved.shape[1:], dtype=np.float64)
+    for i in range(size):
+        if whole[i + 1] > whole[i]:
+            np.add.reduce(moved[whole[i]:whole[i + 1]], axis=0, dtype=np.float64, out=sums[i])
+
+    shape = (size,) + (1,) * (moved.ndim - 1)
+    sums -= moved[last[:-1]] * frac[:-1].reshape(shape)
+    sums += moved[last[1:]] * frac[1:].reshape(shape)
+    lengths = lengths.reshape(shape)
+    # Cells entirely outside the source have zero length and stay 0
+    means = np.divide(sums, lengths, out=np.zeros_like(sums), where=lengths > 0)
+    return np.moveaxis(means, 0, axis)
+
+
+def area_resample(arr, out_shape, window=None):
+    """Resamples a (H, W[, C]) array onto `out_shape` by exact area averaging.
+
+    `window` is the (y0, y1, x0, x1) source region in (fractional) pixel
+    coordinates; it defaults to the whole image. Intended for downsampling;
+    cells falling outside the source are 0. Runs in O(H * W).
+    """
+    if window is None:
+        window = (0.0, arr.shape[0], 0.0, arr.shape[1])
+    y0, y1, x0, x1 = window
+    rows = _area_axis(arr, y0, y1, out_shape[0], 0)
+    return _area_axis(rows, x0, x1, out_shape[1], 1)
+
+
+# Registration
+# ------------
+
+def _gray(arr):
+    arr = np.asarray(arr, dtype=np.float64)
+    return arr.mean(axis=2) if arr.ndim == 3 else arr
+
+
+def phase_correlation(reference, moving):
+    """Returns the (dy, dx) sub-pixel shift that best maps `moving` onto `reference`"""
+    ref = _gray(reference)
+    mov = _gray(moving)
+    window = np.outer(np.hanning(ref.shape[0]), np.hanning(ref.shape[1]))
+    f_ref = np.fft.fft2((ref - ref.mean()) * window)
+    f_mov = np.fft.fft2((mov - mov.mean()) * window)
+    cross = f_ref * np.conj(f_mov)
+    cross /= np.abs(cross) + 1e-12
+    correlation = np.fft.ifft2(cross).real
+
+    peak = np.unravel_index(np.argmax(correlation), correlation.shape)
+    shift = []
+    for axis, size in enumerate(correlation.shape):
+        # Parabolic fit through the peak and its neighbours for sub-pixel accuracy
+        before = list(peak)
+        after = list(peak)
+        before[axis] = (peak[axis] - 1) % size
+        after[axis] = (peak[axis] + 1) % size
+        c0, c1, c2 = correlation[tuple(before)], correlation[peak], correlation[tuple(after)]
+        denom = c0 - 2 * c1 + c2
+        offset = 0.5 * (c0 - c2) / denom if denom != 0 else 0.0
+        value = peak[axis] + offset
+        if value > size / 2:
+            value -= size
+        shift.append(float(value))
+    return tuple(shift)
+
+
+class AlignmentCache:
+    """Persists computed reference/image transforms in a small JSON file"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def put(self, key, transform):
+        with self._lock:
+            self._entries[key] = transform
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+
+
+def align_to_reference(reference, image, ref_geo=None, img_geo=None, cache=None, cache_key=None):
+    """Resamples `image` onto the reference grid and refines it by phase correlation.
+
+    The initial window comes from the GeoTIFF georeferences when both are in
+    the same CRS, otherwise the whole image is assumed to cover the reference.
+    Returns (aligned uint8 array with the reference's height/width, transform).
+    The transform ({'window', 'shift', 'method'}) is stored in `cache` under
+    `cache_key` and reused on the next call.
+    """
+    out_shape = reference.shape[:2]
+    transform = cache.get(cache_key) if cache is not None and cache_key else None
+    if transform is None:
+        window = georeferenced_window(ref_geo, out_shape, img_geo)
+        method = 'georeference' if window is not None else 'extent'
+        if window is None:
+            window = (0.0, float(image.shape[0]), 0.0, float(image.shape[1]))
+
+        resampled = area_resample(image, out_shape, window)
+        dy, dx = phase_correlation(reference, resampled)
+        if abs(dy) >= MIN_SHIFT or abs(dx) >= MIN_SHIFT:
+            # Move the source window instead of shifting the resampled pixels
+            fy = (window[1] - window[0]) / out_shape[0]
+            fx = (window[3] - window[2]) / out_shape[1]
+            window = (window[0] - dy * fy, window[1] - dy * fy, window[2] - dx * fx, window[3] - dx * fx)
+            resampled = None
+        transform = {'window': [float(v) for v in window], 'shift': [dy, dx], 'method': method}
+        if cache is not None and cache_key:
+            cache.put(cache_key, transform)
+    else:
+        resampled = None
+
+    if resampled is None:
+        resampled = area_resample(image, out_shape, transform['window'])
+    aligned = np.clip(np.rint(resampled), 0, 255).astype(np.uint8)
+    return aligned, transform
@@ -1,22 +1,35 @@
-
-import ee
-import folium
-import geemap
 import os
-import webbrowser
-from IPython.display import Image, display
+import uuid
+import shutil
+import argparse
+import tempfile
+import threading
+import contextvars
 from datetime import datetime
-from PIL import Image
+from contextlib import contextmanager
+
+from lazy_import import lazy_import
+
+# Earth Engine and geemap take seconds to import; they are loaded on first use
+ee = lazy_import('ee')
+geemap = lazy_import('geemap')
 
 # 2. AUTHENTICATION & INITIALIZATION
 # ----------------------------------
-def authenticate_and_initialize():
-    """Handles GEE authentication and initialization"""
+def authenticate_and_initialize(interactive=True):
+    """Handles GEE authentication and initialization.
+
+    Without `interactive`, missing credentials raise RuntimeError instead
+    of prompting on stdin.
+    """
     try:
         # Try to initialize (if already authenticated)
         ee.Initialize()
         print("Earth Engine initialized successfully!")
     except Exception as e:
+        if not interactive:
+            raise RuntimeError("Earth Engine is not authenticated; run `earthengine authenticate` "
+                               "or fetch once in the foreground") from e
         print("Authentication needed. Please follow these steps:")
         print("1. A browser window will open")
         print("2. Sign in with your Google account")
@@ -29,8 +42,48 @@ def authenticate_and_initialize():
         ee.Initialize()
         print("\nEarth Engine initialized successfully!")
 
-# Run authentication
-authenticate_and_initialize()
+_initialized = False
+_init_lock = threading.Lock()
+
+# Seconds a non-interactive caller waits for another thread's initialization
+# (which may be waiting for the user to authenticate)
+NON_INTERACTIVE_INIT_WAIT = 30
+
+# False while code must not prompt for authentication, see non_interactive()
+_interactive = contextvars.ContextVar('ee_interactive', default=True)
+
+@contextmanager
+def non_interactive():
+    """Makes Earth Engine initialization inside the block fail fast instead of prompting.
+
+    For background threads (e.g. reference_prefetch), where a prompt would
+    block on stdin while holding the initialization lock. fetch_scheduler
+    copies the context into its worker threads, so whole fetches inherit it.
+    """
+    token = _interactive.set(False)
+    try:
+        yield
+    finally:
+        _interactive.reset(token)
+
+def ensure_initialized():
+    """Initializes Earth Engine once per process, on first use.
+
+    Every thread (fetch pools, Streamlit reruns) shares the session; later
+    calls return immediately.
+    """
+    global _initialized
+    if _initialized:
+        return
+    interactive = _interactive.get()
+    if not _init_lock.acquire(timeout=-1 if interactive else NON_INTERACTIVE_INIT_WAIT):
+        raise RuntimeError("Earth Engine initialization is waiting for authentication in another thread")
+    try:
+        if not _initialized:
+            authenticate_and_initialize(interactive)
+            _initialized = True
+    finally:
+        _init_lock.release()
 
 def get_user_input():
     """Gets user input for coordinates and date range"""
@@ -61,134 +114,521 @@ def get_user_input():
             print("Invalid date format! Please use YYYY-MM-DD.")
     
     return lat, lon, start_date, end_date
-get_user_input()
+
+# Export settings shared by every sensor
+COLLECTION_IDS = {
+    "LANDSAT_8": "LANDSAT/LC08/C02/T1_L2",
+    "LANDSAT_9": "LANDSAT/LC09/C02/T1_L2",
+    "SENTINEL_2": "COPERNICUS/S2_SR_HARMONIZED",
+}
+BUFFER_METERS = 225
+EXPORT_SCALE = 10
+CLOUD_THRESHOLD = 20
+
+# How each collection is reduced to a single image
+COMPOSITE_MODES = ('least_cloudy', 'median', 'mosaic')
+
+# 'single' downloads the reflectance bands once and renders RGB/PNG locally,
+# 'double' also exports the Earth Engine visualize() result
+EXPORT_MODES = ('single', 'double')
+
+# Reference chips for SR comparison, one directory per date range
+REFERENCE_DIR = os.path.join('.sr_cache', 'references')
 
 def get_image_collections():
     """Returns all three image collections"""
-    landsat8 = ee.ImageCollection("LANDSAT/LC08/C02/T1_L2")
-    landsat9 = ee.ImageCollection("LANDSAT/LC09/C02/T1_L2")
-    sentinel2 = ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED")
+    landsat8 = ee.ImageCollection(COLLECTION_IDS["LANDSAT_8"])
+    landsat9 = ee.ImageCollection(COLLECTION_IDS["LANDSAT_9"])
+    sentinel2 = ee.ImageCollection(COLLECTION_IDS["SENTINEL_2"])
     return landsat8, landsat9, sentinel2
-get_image_collections()
 
-def process_collection(collection, name, point, region, start_date, end_date):
-    """Processes an individual collection"""
+def get_vis_params(name):
+    """Returns the RGB visualization parameters for a sensor"""
+    if 'LANDSAT' in name.upper():
+        bands = ['SR_B4', 'SR_B3', 'SR_B2']
+    else:  # Sentinel
+        bands = ['B4', 'B3', 'B2']
+    # process_collection scales both sensors to 0-1 reflectance, so the
+    # stretch range is 0-0.3 (the old 0-3000 DN range rendered all black)
+    return {
+        'bands': bands,
+        'min': 0,
+        'max': 0.3,
+        'gamma': 1.4
+    }
+
+def cloud_property(name):
+    """Returns the scene-level cloud percentage property of a sensor"""
     # Different filtering for Sentinel vs Landsat
-    if 'SENTINEL' in name:
-        filtered = collection.filterBounds(point) \
-                           .filterDate(start_date, end_date) \
-                           .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 20)) \
-                           .sort('CLOUDY_PIXEL_PERCENTAGE')
-    else:  # Landsat
-        filtered = collection.filterBounds(point) \
-                           .filterDate(start_date, end_date) \
-                           .filter(ee.Filter.lt('CLOUD_COVER', 20)) \
-                           .sort('CLOUD_COVER')
-    
-    # Get the least cloudy image
-    image = filtered.first()
+    return 'CLOUDY_PIXEL_PERCENTAGE' if 'SENTINEL' in name else 'CLOUD_COVER'
+
+def filter_collection(collection, name, footprint, start_date, end_date, cloud_threshold=CLOUD_THRESHOLD):
+    """Returns the scenes of a collection intersecting a geometry, date range and cloud limit"""
+    return collection.filterBounds(footprint) \
+                     .filterDate(start_date, end_date) \
+                     .filter(ee.Filter.lt(cloud_property(name), cloud_threshold))
+
+def scale_bands(image, name, qa=False):
+    """Selects the RGB bands of a sensor and scales them to 0-1 reflectance.
+
+    With `qa`, the sensor's quality band (QA_PIXEL or SCL) is appended
+    unscaled. Every band is cast to float32, since exports need one data
+    type and Landsat's scaling otherwise yields float64.
+    """
+    if 'LANDSAT' in name:
+        scaled = image.select(['SR_B4', 'SR_B3', 'SR_B2']).multiply(0.0000275).add(-0.2)
+    else:
+        scaled = image.select(['B4', 'B3', 'B2']).divide(10000)
+    if qa:
+        scaled = scaled.toFloat().addBands(image.select([qa_band(name)]).toFloat())
+    return scaled
+
+def process_collection(collection, name, footprint, region, start_date, end_date,
+                       cloud_threshold=CLOUD_THRESHOLD, composite='least_cloudy', qa=False):
+    """Processes an individual collection"""
+    filtered = filter_collection(collection, name, footprint, start_date, end_date, cloud_threshold)
+
+    if composite == 'median':
+        # Per-pixel median of every acceptable scene
+        image = filtered.median()
+        if qa:
+            # A median of bit flags or class codes is meaningless; keep the most common value
+            image = image.addBands(filtered.select([qa_band(name)]).reduce(ee.Reducer.mode())
+                                   .rename([qa_band(name)]), overwrite=True)
+    elif composite == 'mosaic':
+        # Least cloudy scene on top, gaps filled from the next least cloudy
+        image = filtered.sort(cloud_property(name), False).mosaic()
+    else:
+        # Get the least cloudy image
+        image = filtered.sort(cloud_property(name)).first()
     
     if not image:
         print(f"\nNo {name} images found matching the criteria!")
         return None
     
-    # Process bands
-    if 'LANDSAT' in name:
-        image = image.select(['SR_B4', 'SR_B3', 'SR_B2']).multiply(0.0000275).add(-0.2)
-    elif 'SENTINEL' in name:
-        image = image.select(['B4', 'B3', 'B2']).divide(10000)
-    
-    return image.clip(region)
+    return scale_bands(image, name, qa).clip(region)
 
 
-import geemap
-import ee
-import os
-from PIL import Image
+from cloud_mask import MASKED_CLOUD_THRESHOLD, qa_band, write_mask_raster
+from fetch_scheduler import FetchTask, FetchResult, run_tasks
+from tile_cache import TileCache, make_cache_key
+from local_render import render_rgb_raster
+from raster_store import ingest_geotiff, raster_files
+from image_formats import DEFAULT_PREVIEW_FORMAT, FORMATS, encode_files
+from instrumentation import DEFAULT_EVENT_LOG, Run, file_size, stage
+
+class EarthEngineBackend:
+    """Acquisition backend that filters and exports through Google Earth Engine.
+
+    fetch_all_sensors and the export functions only use `region`,
+    `polygon`, `select_image` and `download`, so another backend (e.g.
+    local_backend.LocalBackend) can stand in for Earth Engine.
+    """
+
+    def region(self, lat, lon):
+        """Returns the export region around a point"""
+        ensure_initialized()
+        return ee.Geometry.Point([lon, lat]).buffer(BUFFER_METERS).bounds()
+
+    def polygon(self, ring):
+        """Returns a region from a [[lon, lat], ...] ring"""
+        ensure_initialized()
+        return ee.Geometry.Polygon([ring])
+
+    def select_image(self, name, lat, lon, region, start_date, end_date,
+                     composite='least_cloudy', cloud_threshold=CLOUD_THRESHOLD, qa=False, footprint=None):
+        """Returns the scaled reflectance image of one sensor (plus its QA band with `qa`), or None.
+
+        Scenes are those intersecting `footprint` (e.g. the region polygon of
+        a large export), or the point (lat, lon) by default.
+        """
+        ensure_initialized()
+        if footprint is None:
+            footprint = ee.Geometry.Point([lon, lat])
+        return process_collection(ee.ImageCollection(COLLECTION_IDS[name]), name, footprint, region,
+                                  start_date, end_date, cloud_threshold, composite, qa)
+
+    def download(self, image, name, region, path, vis_params=None, grid=None):
+        """Downloads an image, or its RGB visualization with vis_params, as a GeoTIFF.
+
+        `grid` ({'crs', 'crs_transform', 'dimensions': (width, height)}) pins
+        the exact output pixel grid instead of `region` and EXPORT_SCALE, so
+        neighbouring tiles line up (see region_export).
+        """
+        ensure_initialized()
+        if vis_params is not None:
+            image = image.visualize(**vis_params)
+        # Written under a unique name and renamed once complete, so an abandoned
+        # attempt never leaves a partial file where a retry reads it
+        part_path = f'{os.path.splitext(path)[0]}.{uuid.uuid4().hex[:8]}.part.tif'
+        if grid is not None:
+            width, height = grid['dimensions']
+            geemap.ee_export_image(
+                image,
+                filename=part_path,
+                crs=grid['crs'],
+                crs_transform=list(grid['crs_transform']),
+                dimensions=f'{width}x{height}',
+                file_per_band=False
+            )
+        else:
+            geemap.ee_export_image(
+                image,
+                filename=part_path,
+                scale=EXPORT_SCALE,
+                region=region,
+                file_per_band=False
+            )
+        # geemap prints download errors instead of raising them
+        if not os.path.exists(part_path):
+            raise RuntimeError(f"{name} export failed")
+        os.replace(part_path, path)
+
+EARTH_ENGINE = EarthEngineBackend()
+
+def export_geotiff(image, name, region, base_filename, backend=EARTH_ENGINE, qa=False):
+    """Exports the scaled reflectance bands as a memory-mappable GeoTIFF.
+
+    With `qa`, the image carries the sensor's quality band as its last band,
+    which is decoded locally into a `<base>_mask.tif` valid-pixel mask.
+    """
+    print(f" Saving {name} GeoTIFF...")
+    with stage('download', sensor=name) as info:
+        backend.download(image, name, region, f'{base_filename}.tif')
+        info['bytes'] = file_size(f'{base_filename}.tif')
+    band_names = get_vis_params(name)['bands'] + ([qa_band(name)] if qa else [])
+    # Decode the download once; every later reader maps the file instead
+    with stage('ingest', info['bytes'], sensor=name):
+        ingest_geotiff(f'{base_filename}.tif', band_names=band_names)
+    files = raster_files('tif', f'{base_filename}.tif')
+    if qa:
+        with stage('cloud_mask', info['bytes'], sensor=name):
+            files.update(raster_files('mask', write_mask_raster(files['tif'], name, f'{base_filename}_mask.tif')))
+    return files
+
+def export_rgb(image, name, region, base_filename, backend=EARTH_ENGINE):
+    """Exports the Earth Engine RGB visualization as a memory-mappable GeoTIFF"""
+    rgb_tif_path = f'{base_filename}_rgb.tif'
+    print(f" Exporting RGB TIF for {name}...")
+    with stage('download_rgb', sensor=name) as info:
+        backend.download(image, name, region, rgb_tif_path, vis_params=get_vis_params(name))
+        info['bytes'] = file_size(rgb_tif_path)
+
+    # Previews are only written on request (image_formats.ensure_encoded)
+    with stage('ingest', info['bytes'], sensor=name):
+        ingest_geotiff(rgb_tif_path, band_names=('red', 'green', 'blue'))
+    return raster_files('rgb', rgb_tif_path)
+
+def export_and_render(image, name, region, base_filename, backend=EARTH_ENGINE, qa=False):
+    """Downloads the reflectance bands once and renders the RGB GeoTIFF locally"""
+    files = export_geotiff(image, name, region, base_filename, backend, qa)
+    print(f" Rendering {name} RGB locally...")
+    with stage('render_rgb', file_size(files['tif']), sensor=name):
+        files.update(raster_files('rgb', render_rgb_raster(files['tif'], get_vis_params(name),
+                                                           f'{base_filename}_rgb.tif')))
+    return files
+
+def staged_export(export, image, name, region, base_filename, backend=EARTH_ENGINE, *args):
+    """Runs an export in a private staging directory and moves its files into place once it succeeds.
+
+    A timed-out attempt that finishes later (see fetch_scheduler.run_tasks)
+    then never writes into the files its retry is writing, and readers only
+    see complete files. Returns the export's files at their final paths.
+    """
+    output_dir, base = os.path.split(base_filename)
+    staging = tempfile.mkdtemp(prefix='.attempt_', dir=output_dir or '.')
+    try:
+        files = export(image, name, region, os.path.join(staging, base), backend, *args)
+        placed = {}
+        # Rasters before their sidecar indexes
+        for kind, path in sorted(files.items(), key=lambda item: item[0].endswith('_index')):
+            placed[kind] = os.path.join(output_dir, os.path.basename(path))
+            os.replace(path, placed[kind])
+        return placed
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
 
-def save_images_locally(image, name, region, lat, lon, output_dir):
+def save_images_locally(image, name, region, lat, lon, output_dir, backend=EARTH_ENGINE):
     if not image:
         print(" No image found.")
-        return
-    
+        return None
+
     os.makedirs(output_dir, exist_ok=True)
     base_filename = f"{output_dir}/{name}_{lat:.4f}_{lon:.4f}"
 
-    # Save GeoTIFF
-    print(f" Saving {name} GeoTIFF...")
-    geemap.ee_export_image(
-        image,
-        filename=f'{base_filename}.tif',
-        scale=10,
-        region=region,
-        file_per_band=False
-    )
+    try:
+        return export_and_render(image, name, region, base_filename, backend)['rgb']
+    except Exception as e:
+        print(f" Error saving {name}:", e)
+        return None
 
-    # Visualization parameters
-    print(f" Creating {name} RGB visualization...")
-    if 'LANDSAT' in name.upper():
-        vis_params = {
-            'bands': ['SR_B4', 'SR_B3', 'SR_B2'],
-            'min': 0,
-            'max': 3000,
-            'gamma': 1.4
-        }
-    else:  # Sentinel
-        vis_params = {
-            'bands': ['B4', 'B3', 'B2'],
-            'min': 0,
-            'max': 3000,
-            'gamma': 1.4
-        }
+def build_fetch_tasks(images, region, lat, lon, output_dir, export_mode='single', backend=EARTH_ENGINE,
+                      qa=False):
+    """Builds the export tasks for every available sensor image.
 
-    # Visualize RGB image
-    rgb_image = image.visualize(**vis_params)
+    Each task returns a dict of the files it wrote, keyed by kind ('tif', 'rgb',
+    'mask' with `qa`, and their sidecar indexes).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = []
+    for name, image in images.items():
+        if not image:
+            continue
+        base_filename = f"{output_dir}/{name}_{lat:.4f}_{lon:.4f}"
+        args = (image, name, region, base_filename, backend)
+        if export_mode == 'double':
+            tasks.append(FetchTask(f'{name}/tif', name, staged_export, (export_geotiff,) + args + (qa,)))
+            tasks.append(FetchTask(f'{name}/rgb', name, staged_export, (export_rgb,) + args))
+        else:
+            tasks.append(FetchTask(f'{name}/tif+rgb', name, staged_export, (export_and_render,) + args + (qa,)))
+    return tasks
 
-    # Save as temporary RGB TIF
-    rgb_tif_path = f'{base_filename}_rgb.tif'
-    print(f" Exporting RGB TIF for {name}...")
-    geemap.ee_export_image(
-        rgb_image,
-        filename=rgb_tif_path,
-        scale=10,
-        region=region
+def sensor_cache_key(name, lat, lon, start_date, end_date, composite='least_cloudy', mask_clouds=False):
+    """Returns the tile cache key for one sensor export"""
+    # Only masked exports carry the extra field, so existing cache entries stay valid
+    masking = {'mask_clouds': True} if mask_clouds else {}
+    return make_cache_key(
+        collection=COLLECTION_IDS[name],
+        lat=round(lat, 6),
+        lon=round(lon, 6),
+        buffer=BUFFER_METERS,
+        scale=EXPORT_SCALE,
+        start_date=str(start_date),
+        end_date=str(end_date),
+        cloud_threshold=MASKED_CLOUD_THRESHOLD if mask_clouds else CLOUD_THRESHOLD,
+        vis_params=get_vis_params(name),
+        composite=composite,
+        # Bumped whenever the cached file layout changes
+        layout='raster-store-v1',
+        **masking,
     )
 
-    # Convert RGB TIF to PNG
-    png_path = f'{base_filename}.png'
-    print(f" Converting to PNG: {png_path}")
-    try:
-        with Image.open(rgb_tif_path) as img:
-            img.convert('RGB').save(png_path, 'PNG')
-        print(" PNG saved successfully!")
-    except Exception as e:
-        print(" Error converting to PNG:", e)
+def fetch_all_sensors(lat, lon, start_date, end_date, output_dir,
+                      max_workers=6, timeout=300, retries=2, backoff=1.0, on_progress=None, cache=None,
+                      composite='least_cloudy', export_mode='single', backend=EARTH_ENGINE,
+                      names=tuple(COLLECTION_IDS), mask_clouds=False):
+    """Processes every sensor in `names` and runs all exports concurrently.
+
+    Sensors already in `cache` (a TileCache) are served from disk without any
+    backend call. With `mask_clouds`, the quality band is downloaded with the
+    reflectance and decoded into per-pixel masks, so the scene filter is
+    relaxed to MASKED_CLOUD_THRESHOLD. Returns (rgb_paths, results) where
+    rgb_paths maps sensor name to its memory-mappable RGB GeoTIFF (or None)
+    and results holds the FetchResult of every task (see sensor_files()).
+    """
+    rgb_paths = {}
+    results = {}
+    keys = {name: sensor_cache_key(name, lat, lon, start_date, end_date, composite, mask_clouds)
+            for name in names}
+    cloud_threshold = MASKED_CLOUD_THRESHOLD if mask_clouds else CLOUD_THRESHOLD
+
+    missing = []
+    for name in names:
+        cached = cache.get(keys[name]) if cache is not None else None
+        if cached is None:
+            missing.append(name)
+            continue
+        rgb_paths[name] = cached['rgb']
+        result = FetchResult(f'{name}/cached', name, cached, None, 0, 0.0)
+        results[result.key] = result
+        if on_progress is not None:
+            on_progress(result, len(results), len(names))
+
+    if not missing:
+        return rgb_paths, results
+
+    region = backend.region(lat, lon)
+    images = {}
+    for name in missing:
+        # Filtering and sorting the collection is a server round trip per sensor
+        with stage('select_image', sensor=name):
+            images[name] = backend.select_image(name, lat, lon, region, start_date, end_date, composite,
+                                                cloud_threshold, qa=mask_clouds)
+
+    tasks = build_fetch_tasks(images, region, lat, lon, output_dir, export_mode, backend, mask_clouds)
+    results.update(run_tasks(tasks, max_workers=max_workers, timeout=timeout,
+                             retries=retries, backoff=backoff, on_progress=on_progress))
+
+    for name in missing:
+        sensor_results = [results[task.key] for task in tasks if task.group == name]
+        files = {}
+        for result in sensor_results:
+            if result.error is None:
+                files.update(result.value)
+        rgb_paths[name] = files.get('rgb')
+        ok = sensor_results and all(result.error is None for result in sensor_results)
+        if cache is not None and ok:
+            cache.put(keys[name], files)
+    return rgb_paths, results
+
+def sensor_files(results, name):
+    """Returns every file written (or served from cache) for one sensor, keyed by kind"""
+    files = {}
+    for result in results.values():
+        if result.group == name and result.error is None:
+            files.update(result.value)
+    return files
+
+def fetch_reference(lat, lon, start_date, end_date, sensor='SENTINEL_2', output_dir=REFERENCE_DIR, cache=None,
+                    backend=EARTH_ENGINE):
+    """Fetches one sensor's RGB chip and cloud mask for SR comparison.
+
+    Returns the sensor's files ('rgb', 'mask', ...); raises RuntimeError
+    when no scene matches the coordinates and dates.
+    """
+    output_dir = os.path.join(output_dir, f'{start_date}_{end_date}')
+    _, results = fetch_all_sensors(lat, lon, start_date, end_date, output_dir, cache=cache, backend=backend,
+                                   names=(sensor,), mask_clouds=True)
+    files = sensor_files(results, sensor)
+    if not files.get('rgb'):
+        errors = [str(result.error) for result in results.values() if result.error is not None]
+        raise RuntimeError(f"No {sensor} scene for these coordinates and dates" +
+                           (f": {errors[0]}" if errors else ""))
+    return files
 
-def main_processing():
+def write_previews(rgb_paths, output_dir, fmt=DEFAULT_PREVIEW_FORMAT):
+    """Encodes the RGB GeoTIFFs of {sensor: path} into output_dir as `fmt` (also for cache hits).
+
+    Sensors are encoded in parallel threads; missing images stay None.
+    """
+    names = [name for name, path in rgb_paths.items() if path]
+    outputs = encode_files([rgb_paths[name] for name in names], fmt, output_dir)
+    return {**rgb_paths, **dict(zip(names, outputs))}
+
+def main_processing(composite='least_cloudy', export_mode='single', preview_format=None, mask_clouds=False):
     lat, lon, start_date, end_date = get_user_input()
-    point = ee.Geometry.Point([lon, lat])
-    region = point.buffer(225).bounds()
-    
-    landsat8, landsat9, sentinel2 = get_image_collections()
-    
-    print("\nProcessing satellite collections...")
-    l8_image = process_collection(landsat8, "LANDSAT_8", point, region, start_date, end_date)
-    l9_image = process_collection(landsat9, "LANDSAT_9", point, region, start_date, end_date)
-    s2_image = process_collection(sentinel2, "SENTINEL_2", point, region, start_date, end_date)
-    
+
     # Create output directory with timestamp
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     output_dir = f"satellite_images_{timestamp}"
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # Save all available images
-    save_images_locally(l8_image, "LANDSAT_8", region, lat, lon, output_dir)
-    save_images_locally(l9_image, "LANDSAT_9", region, lat, lon, output_dir)
-    save_images_locally(s2_image, "SENTINEL_2", region, lat, lon, output_dir)
+
+    def report(result, done, total):
+        status = "failed: " + str(result.error) if result.error is not None else "done"
+        print(f" [{done}/{total}] {result.key} {status} ({result.elapsed:.1f}s, {result.attempts} attempt(s))")
+
+    print("\nProcessing satellite collections...")
+    rgb_paths, _ = fetch_all_sensors(lat, lon, start_date, end_date, output_dir,
+                                     on_progress=report, cache=TileCache(),
+                                     composite=composite, export_mode=export_mode, mask_clouds=mask_clouds)
+    if preview_format:
+        rgb_paths = write_previews(rgb_paths, output_dir, preview_format)
+    for name, path in rgb_paths.items():
+        print(f" {name}: {path}")
     
     print("\n=== PROCESSING COMPLETE ===")
     print(f"All images saved to: {os.path.abspath(output_dir)}")
+
+def parse_args(argv=None):
+    """Parses command line options"""
+    parser = argparse.ArgumentParser(description="Download Landsat/Sentinel-2 imagery from Earth Engine")
+    parser.add_argument('--batch', metavar='FILE',
+                        help="CSV or JSONL file with lat, lon, start_date, end_date rows (non-interactive)")
+    parser.add_argument('--output', default='satellite_batch',
+                        help="Output directory for batch runs; holds the resumable manifest")
+    parser.add_argument('--workers', type=int, default=4, help="Number of AOIs fetched in parallel")
+    parser.add_argument('--composite', choices=COMPOSITE_MODES, default='least_cloudy',
+                        help="How each collection is reduced to one image")
+    parser.add_argument('--export-mode', choices=EXPORT_MODES, default='single',
+                        help="'single' downloads reflectance once and renders RGB locally")
+    parser.add_argument('--time-series', action='store_true',
+                        help="Download every acceptable scene in the date range into a stacked array")
+    parser.add_argument('--series-output', default='satellite_series',
+                        help="Output directory for --time-series; re-runs only fetch newer scenes")
+    parser.add_argument('--region', nargs=4, type=float, metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'),
+                        help="Export a large lon/lat box as a tiled mosaic instead of a point buffer")
+    parser.add_argument('--polygon', metavar='GEOJSON',
+                        help="Export the area of a GeoJSON Polygon (file) as a tiled mosaic")
+    parser.add_argument('--dates', nargs=2, metavar=('START', 'END'),
+                        help="Date range (YYYY-MM-DD) for --region/--polygon")
+    parser.add_argument('--sensor', choices=list(COLLECTION_IDS), default='SENTINEL_2',
+                        help="Sensor exported by --region/--polygon")
+    parser.add_argument('--preview', dest='preview_format', choices=list(FORMATS), default=None,
+                        help="Also write previews or archives in this format: fast PNG, lossless WebP, JPEG, "
+                             "or zstd/LZW tiled GeoTIFF (RGB GeoTIFFs are always written)")
+    parser.add_argument('--png', dest='preview_format', action='store_const', const='png',
+                        help="Same as --preview png")
+    parser.add_argument('--mask-clouds', action='store_true',
+                        help="Download the QA_PIXEL/SCL band, write per-pixel cloud masks and relax the "
+                             f"scene cloud filter to {MASKED_CLOUD_THRESHOLD}%%")
+    parser.add_argument('--event-log', metavar='FILE',
+                        help="Append a JSON line per pipeline stage to FILE (default: $SR_HUB_EVENT_LOG)")
+    parser.add_argument('--profile', action='store_true',
+                        help="Profile the run with cProfile and print the slowest functions")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Report the peak Python memory allocation with tracemalloc")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    run = Run('data_transfer', args.event_log or DEFAULT_EVENT_LOG, args.profile, args.trace_memory)
+    with run:
+        run_command(args)
+    print()
+    print(run.format_summary())
+    if run.profile_report:
+        print(run.profile_report)
+
+def run_command(args):
+    """Runs the batch, region, time series or interactive mode selected by `args`"""
+    # Earth Engine is initialized by the backend on the first request
+    if args.batch:
+        from batch_acquisition import run_batch
+
+        cache = TileCache()
+
+        def fetch_aoi(lat, lon, start_date, end_date, output_dir):
+            rgb_paths, results = fetch_all_sensors(lat, lon, start_date, end_date, output_dir, cache=cache,
+                                                   composite=args.composite, export_mode=args.export_mode,
+                                                   mask_clouds=args.mask_clouds)
+            if args.preview_format:
+                rgb_paths = write_previews(rgb_paths, output_dir, args.preview_format)
+            return rgb_paths, results
+
+        run_batch(args.batch, args.output, fetch_aoi, BUFFER_METERS, workers=args.workers)
+    elif args.region or args.polygon:
+        import json
+        from region_export import fetch_region
+
+        if not args.dates:
+            raise SystemExit("--region/--polygon need --dates START END")
+        ring = None
+        if args.polygon:
+            with open(args.polygon) as f:
+                geometry = json.load(f)
+            # Accept a bare geometry, a Feature or the first Feature of a FeatureCollection
+            if geometry.get('type') == 'FeatureCollection':
+                geometry = geometry['features'][0]
+            geometry = geometry.get('geometry', geometry)
+            ring = [list(point[:2]) for point in geometry['coordinates'][0]]
+
+        def report(result, done, total):
+            status = "failed: " + str(result.error) if result.error is not None else "stitched"
+            print(f" [{done}/{total}] tile {result.key} {status} ({result.elapsed:.1f}s)")
+
+        composite = 'mosaic' if args.composite == 'least_cloudy' else args.composite
+        path, results = fetch_region(args.sensor, args.dates[0], args.dates[1], args.output,
+                                     bounds=args.region, ring=ring, composite=composite,
+                                     max_workers=args.workers, on_progress=report)
+        failed = sum(result.error is not None for result in results.values())
+        print(f"Mosaic saved to: {os.path.abspath(path)} ({len(results) - failed}/{len(results)} tiles)")
+    elif args.time_series:
+        from time_series import fetch_time_series
+
+        lat, lon, start_date, end_date = get_user_input()
+
+        def report(result, done, total):
+            status = "failed: " + str(result.error) if result.error is not None else "done"
+            print(f" [{done}/{total}] {result.key} {status} ({result.elapsed:.1f}s)")
+
+        added = fetch_time_series(lat, lon, start_date, end_date, args.series_output,
+                                  max_workers=args.workers, on_progress=report)
+        for name, count in added.items():
+            print(f" {name}: {count} new scene(s)")
+        print(f"Time series stored in: {os.path.abspath(args.series_output)}")
+    else:
+        main_processing(args.composite, args.export_mode, args.preview_format, args.mask_clouds)
+
 # 6. RUN THE MAIN PROCESSING
 # --------------------------
 if __name__ == '__main__':
-    main_processing()
\ No newline at end of file
+    main()
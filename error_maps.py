@@ -0,0 +1,140 @@
+import numpy as np
+
+from raster import as_channels_last
+from sr_metrics import SSIM_WINDOW, ssim_terms
+from image_pyramid import get_pyramid
+
+KINDS = ('abs_error', 'signed_error', 'ssim')
+
+# Absolute (or signed) errors at this share of the data range and above get the
+# hottest (or the most saturated) colour
+ERROR_SATURATION = 0.25
+
+# Rows of the aligned pair turned into map pixels per block
+BLOCK_ROWS = 512
+
+# Colour ramp from good (dark blue) to bad (bright yellow), interpolated to 256 entries
+RAMP_COLORS = ((13, 8, 135), (126, 3, 168), (204, 71, 120), (248, 149, 64), (240, 249, 33))
+
+# Diverging ramp for signed errors: SR darker than the reference (blue) through
+# no error (white, the middle entry) to SR brighter (red)
+DIVERGING_COLORS = ((5, 48, 97), (67, 147, 195), (247, 247, 247), (214, 96, 77), (103, 0, 31))
+
+# Map colour of pixels outside the mask (e.g. cloudy reference pixels)
+MASKED_COLOR = (96, 96, 96)
+
+
+def _ramp_lut(colors=RAMP_COLORS):
+    """Returns a (256, 3) uint8 colour table interpolating `colors` evenly"""
+    anchors = np.linspace(0, 255, len(colors))
+    colors = np.asarray(colors, dtype=np.float32)
+    return np.stack([np.rint(np.interp(np.arange(256), anchors, colors[:, c])) for c in range(3)],
+                    axis=1).astype(np.uint8)
+
+
+COLOR_LUT = _ramp_lut()
+DIVERGING_LUT = _ramp_lut(DIVERGING_COLORS)
+
+
+def _lut(kind):
+    return DIVERGING_LUT if kind == 'signed_error' else COLOR_LUT
+
+
+def legend(kind='abs_error'):
+    """Returns the colour ramp of a map kind as a (16, 256, 3) uint8 strip for st.image"""
+    return np.broadcast_to(_lut(kind), (16, 256, 3))
+
+
+def _abs_error_block(reference, test, rows, band):
+    """Returns the absolute error of one row block, averaged over bands when `band` is None"""
+    x = reference[rows].astype(np.float32)
+    y = test[rows].astype(np.float32)
+    error = np.abs(x - y, out=x)
+    return error[:, :, band] if band is not None else error.mean(axis=2)
+
+
+def _signed_error_block(reference, test, rows, band):
+    """Returns test - reference of one row block, averaged over bands when `band` is None"""
+    x = reference[rows].astype(np.float32)
+    y = test[rows].astype(np.float32)
+    error = np.subtract(y, x, out=y)
+    return error[:, :, band] if band is not None else error.mean(axis=2)
+
+
+def _ssim_block(reference, test, rows, band, data_range):
+    """Returns 1 - SSIM of one row block, with reflected halos so the map keeps the image size"""
+    height = reference.shape[0]
+    margin = (SSIM_WINDOW - 1) // 2
+    lo, hi = max(rows.start - margin, 0), min(rows.stop + margin, height)
+    pad = ((margin - (rows.start - lo), margin - (hi - rows.stop)), (margin, margin))
+    bands = [band] if band is not None else range(reference.shape[2])
+    total = None
+    for b in bands:
+        x = np.pad(reference[lo:hi, :, b].astype(np.float32), pad, mode='reflect')
+        y = np.pad(test[lo:hi, :, b].astype(np.float32), pad, mode='reflect')
+        ssim_map, _ = ssim_terms(x, y, data_range)
+        total = ssim_map if total is None else total + ssim_map
+    return 1.0 - total / len(bands)
+
+
+def render_error_map(reference, test, out, kind='abs_error', band=None, mask=None, data_range=None):
+    """Writes a colour-mapped uint8 error map of an aligned pair into `out`, block by block.
+
+    `kind` is 'abs_error' (|reference - test|, saturating at ERROR_SATURATION
+    of the data range), 'signed_error' (test - reference, saturating at
+    +-ERROR_SATURATION, zero in the middle of DIVERGING_LUT) or 'ssim'
+    (1 - local SSIM). Maps are quantized to 256 levels; the absolute and SSIM
+    maps are looked up in COLOR_LUT, so hot colours are bad for either.
+    `band=None` averages the bands. Pixels outside an (H, W) boolean `mask`
+    are painted MASKED_COLOR. Only one float32 block is held at a time, and
+    `out` may be an (H, W, 3) memory map (e.g. a pyramid's level 0).
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown error map {kind!r}")
+    reference = as_channels_last(reference)
+    test = as_channels_last(test)
+    if reference.shape != test.shape:
+        raise ValueError(f"Shape mismatch: reference {reference.shape} vs test {test.shape}")
+    if reference.ndim == 2:
+        reference = reference[:, :, np.newaxis]
+        test = test[:, :, np.newaxis]
+    if data_range is None:
+        data_range = 255.0 if reference.dtype == np.uint8 else float(reference.max() - reference.min()) or 1.0
+    if kind == 'abs_error':
+        levels, offset = 255.0 / (ERROR_SATURATION * data_range), 0.0
+    elif kind == 'signed_error':
+        levels, offset = 127.5 / (ERROR_SATURATION * data_range), 127.5
+    else:
+        levels, offset = 255.0, 0.0
+    lut = _lut(kind)
+
+    for start in range(0, reference.shape[0], BLOCK_ROWS):
+        rows = slice(start, min(start + BLOCK_ROWS, reference.shape[0]))
+        if kind == 'abs_error':
+            error = _abs_error_block(reference, test, rows, band)
+        elif kind == 'signed_error':
+            error = _signed_error_block(reference, test, rows, band)
+        else:
+            error = _ssim_block(reference, test, rows, band, data_range)
+        error *= levels
+        error += offset
+        index = np.clip(np.rint(error, out=error), 0, 255).astype(np.uint8)
+        target = out[rows]
+        np.take(lut, index, axis=0, out=target)
+        if mask is not None:
+            target[~mask[rows]] = MASKED_COLOR
+    return out
+
+
+def error_map_pyramid(key, shape, load_pair, kind='abs_error', band=None, mask=None, cache=None):
+    """Returns the cached pyramid of an error map, rendering it on the first request.
+
+    `load_pair()` returns the aligned (reference, test) pair of `shape`
+    (H, W); it is only called when the map is not cached yet. Tiles are then
+    read from the pyramid, so panning and zooming never recompute the map.
+    """
+    def fill(out):
+        reference, test = load_pair()
+        render_error_map(reference, test, out, kind, band, mask)
+
+    return get_pyramid(key, tuple(shape[:2]) + (3,), fill, cache)
@@ -0,0 +1,104 @@
+import math
+import time
+import heapq
+import logging
+import queue
+import itertools
+import threading
+import contextvars
+from collections import namedtuple
+
+# A unit of download work. `group` is used for progress reporting (e.g. the sensor name).
+FetchTask = namedtuple('FetchTask', ['key', 'group', 'func', 'args'])
+
+# Outcome of a task after all of its attempts
+FetchResult = namedtuple('FetchResult', ['key', 'group', 'value', 'error', 'attempts', 'elapsed'])
+
+logger = logging.getLogger(__name__)
+
+
+def run_tasks(tasks, max_workers=6, timeout=300, retries=2, backoff=1.0, on_progress=None):
+    """Runs tasks with at most `max_workers` attempts in flight, with per-attempt timeouts and retries.
+
+    Every attempt runs on a fresh daemon thread and is timed from its start.
+    An attempt that raises or runs longer than `timeout` seconds is retried
+    up to `retries` more times, after waiting `backoff`, 2 * `backoff`, ...
+    seconds. A timed-out attempt is abandoned: it gives up its slot, so
+    retries never queue behind hung threads, and whatever it returns later
+    is ignored (tasks that write files should write them atomically, see
+    data_transfer.staged_export). `on_progress(result, done, total)` is
+    called from the calling thread whenever a task finishes, so it is safe
+    to update Streamlit elements from it. Returns a dict of key -> FetchResult.
+    """
+    tasks = list(tasks)
+    total = len(tasks)
+    results = {}
+    if not tasks:
+        return results
+
+    max_workers = max(1, max_workers)
+    timeout = math.inf if timeout is None else timeout
+    finished = queue.Queue()
+    # Attempts waiting for a slot: (not before, order, task, attempt number)
+    order = itertools.count()
+    ready = [(0.0, next(order), task, 1) for task in tasks]
+    # Attempts in flight: attempt id -> (task, attempt number, deadline)
+    running = {}
+    attempt_ids = itertools.count()
+    first_start = {}
+
+    def launch(task, attempt):
+        attempt_id = next(attempt_ids)
+        # Workers see the caller's context, e.g. the instrumentation run
+        context = contextvars.copy_context()
+
+        def target():
+            try:
+                value, error = context.run(task.func, *task.args), None
+            except Exception as e:
+                value, error = None, e
+            finished.put((attempt_id, value, error))
+
+        now = time.monotonic()
+        first_start.setdefault(task.key, now)
+        running[attempt_id] = (task, attempt, now + timeout)
+        threading.Thread(target=target, name=f'fetch-{task.key}', daemon=True).start()
+
+    def finish(task, attempt, value=None, error=None):
+        if error is not None and attempt <= retries:
+            logger.warning("Retrying %s after error: %s", task.key, error)
+            heapq.heappush(ready, (time.monotonic() + backoff * 2 ** (attempt - 1), next(order), task, attempt + 1))
+            return
+        result = FetchResult(task.key, task.group, value, error, attempt,
+                             time.monotonic() - first_start[task.key])
+        results[task.key] = result
+        if on_progress is not None:
+            on_progress(result, len(results), total)
+
+    while ready or running:
+        while ready and ready[0][0] <= time.monotonic() and len(running) < max_workers:
+            _, _, task, attempt = heapq.heappop(ready)
+            launch(task, attempt)
+
+        # Sleep until an attempt finishes, the next deadline passes or a retry is due
+        wake = [deadline for _, _, deadline in running.values()]
+        if ready and len(running) < max_workers:
+            wake.append(ready[0][0])
+        wait = min(wake, default=math.inf) - time.monotonic()
+        try:
+            attempt_id, value, error = finished.get(timeout=None if wait == math.inf else max(wait, 0.0))
+        except queue.Empty:
+            pass
+        else:
+            entry = running.pop(attempt_id, None)
+            # None: the attempt was abandoned after timing out
+            if entry is not None:
+                finish(entry[0], entry[1], value, error)
+
+        now = time.monotonic()
+        for attempt_id, (task, attempt, deadline) in list(running.items()):
+            if now >= deadline:
+                del running[attempt_id]
+                finish(task, attempt, error=TimeoutError(f"{task.key} timed out after {timeout}s"))
+
+    return results
@@ -0,0 +1,193 @@
+import io
+import os
+import glob
+import time
+import argparse
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import tifffile
+from PIL import Image, features
+
+from raster_store import geotiff_extratags, open_raster
+from instrumentation import file_size, stage
+
+# zlib level of fast PNGs: level 1 encodes several times faster than PIL's
+# default 6 for a few percent more bytes
+PNG_COMPRESS_LEVEL = 1
+
+# libwebp effort, 0 (fastest) to 6 (smallest); lossless either way
+WEBP_METHOD = 0
+
+JPEG_QUALITY = 90
+
+# Tile side and zstd level of archive GeoTIFFs
+ARCHIVE_TILE = 256
+ZSTD_LEVEL = 3
+
+# File extension of every output format; 'png-default' is PIL's default
+# PNG, kept as the benchmark baseline
+FORMATS = {
+    'png': '.png',
+    'png-default': '.png',
+    'webp': '.webp',
+    'jpeg': '.jpg',
+    'tiff-zstd': '.tif',
+    'tiff-lzw': '.tif',
+}
+PREVIEW_FORMATS = ('png', 'webp', 'jpeg')
+ARCHIVE_FORMATS = ('tiff-zstd', 'tiff-lzw')
+LOSSY_FORMATS = ('jpeg',)
+DEFAULT_PREVIEW_FORMAT = 'png'
+
+SAMPLE_DIR = 'satellite_images_20250408_220231'
+
+
+def available_formats():
+    """Returns the formats this installation can encode.
+
+    WebP needs Pillow built with libwebp; compressed GeoTIFFs need imagecodecs.
+    """
+    formats = ['png', 'png-default', 'jpeg']
+    if features.check('webp'):
+        formats.append('webp')
+    if importlib.util.find_spec('imagecodecs') is not None:
+        formats.extend(ARCHIVE_FORMATS)
+    return formats
+
+
+def read_raster(path):
+    """Returns (uint8 array, GeoTIFF extratags) of an RGB raster, mapped when possible"""
+    with tifffile.TiffFile(path) as tif:
+        extratags = geotiff_extratags(tif.pages[0])
+    try:
+        array = open_raster(path)
+    except ValueError:
+        # Compressed (e.g. not yet ingested) rasters are decoded instead
+        array = tifffile.imread(path)
+    return array, extratags
+
+
+def encode_array(array, fmt, target, extratags=()):
+    """Encodes an (H, W) or (H, W, 3) uint8 array to `target`, a path or binary file object.
+
+    The codecs (zlib, libwebp, libjpeg, zstd) run with the GIL released, so
+    several images encode in parallel threads.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; choose from {', '.join(FORMATS)}")
+    if fmt in ARCHIVE_FORMATS:
+        if importlib.util.find_spec('imagecodecs') is None:
+            raise ValueError(f"{fmt} needs the imagecodecs package")
+        compression, args = ('zstd', {'level': ZSTD_LEVEL}) if fmt == 'tiff-zstd' else ('lzw', None)
+        # Horizontal differencing makes neighbouring pixels cheap to compress
+        tifffile.imwrite(target, array, photometric='rgb' if array.ndim == 3 else 'minisblack',
+                         tile=(ARCHIVE_TILE, ARCHIVE_TILE), compression=compression, compressionargs=args,
+                         predictor=True, extratags=list(extratags), metadata=None)
+        return target
+    image = Image.fromarray(np.ascontiguousarray(array))
+    if fmt == 'png':
+        image.save(target, 'PNG', compress_level=PNG_COMPRESS_LEVEL)
+    elif fmt == 'png-default':
+        image.save(target, 'PNG')
+    elif fmt == 'webp':
+        image.save(target, 'WEBP', lossless=True, method=WEBP_METHOD)
+    else:
+        image.save(target, 'JPEG', quality=JPEG_QUALITY)
+    return target
+
+
+def decode_bytes(data, fmt):
+    """Decodes an encoded image back to an array (for benchmarks and round-trip checks)"""
+    if fmt in ARCHIVE_FORMATS:
+        return tifffile.imread(io.BytesIO(data))
+    with Image.open(io.BytesIO(data)) as image:
+        return np.asarray(image)
+
+
+def output_path(path, fmt, output_dir=None):
+    """Returns the default output of a raster: `<name>.png`, `<name>.webp`, `<name>_zstd.tif`, ..."""
+    base = os.path.splitext(os.path.basename(path))[0]
+    if base.endswith('_rgb'):
+        base = base[:-len('_rgb')]
+    if fmt in ARCHIVE_FORMATS:
+        base += '_' + fmt.split('-')[1]
+    return os.path.join(output_dir or os.path.dirname(path), base + FORMATS[fmt])
+
+
+def ensure_encoded(path, fmt=DEFAULT_PREVIEW_FORMAT, out_path=None):
+    """Returns `path` encoded as `fmt`, writing it only when missing or older than the raster"""
+    out_path = out_path or output_path(path, fmt)
+    if not os.path.exists(out_path) or os.path.getmtime(out_path) < os.path.getmtime(path):
+        array, extratags = read_raster(path)
+        tmp_path = out_path + '.tmp'
+        with stage('encode', file_size(path), format=fmt):
+            encode_array(np.asarray(array), fmt, tmp_path, extratags)
+        os.replace(tmp_path, out_path)
+    return out_path
+
+
+def encode_files(paths, fmt=DEFAULT_PREVIEW_FORMAT, output_dir=None, workers=None):
+    """Encodes many rasters in a thread pool; returns the output paths in input order"""
+    if not paths:
+        return []
+    with ThreadPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(paths))) as executor:
+        return list(executor.map(lambda path: ensure_encoded(path, fmt, output_path(path, fmt, output_dir)),
+                                 paths))
+
+
+def _tile_to(array, size):
+    """Repeats a small sample into a size x size image so timings are measurable"""
+    reps = (-(-size // array.shape[0]), -(-size // array.shape[1])) + (1,) * (array.ndim - 2)
+    return np.ascontiguousarray(np.tile(array, reps)[:size, :size])
+
+
+def run_benchmark(paths, formats, size=None, repeat=3, workers=None):
+    """Prints size, encode and decode time per format, plus thread pool throughput"""
+    workers = workers or os.cpu_count() or 1
+    images = []
+    for path in paths:
+        array, _ = read_raster(path)
+        array = np.asarray(array)
+        images.append((os.path.basename(path), _tile_to(array, size) if size else array))
+
+    print(f"{'image':<36}{'format':<13}{'bytes':>11}{'ratio':>8}{'enc ms':>9}{'dec ms':>9}"
+          f"{'pool MB/s':>11}{'exact':>7}")
+    for name, array in images:
+        for fmt in formats:
+            encode_times, decode_times = [], []
+            for _ in range(repeat):
+                buffer = io.BytesIO()
+                started = time.perf_counter()
+                encode_array(array, fmt, buffer)
+                encode_times.append(time.perf_counter() - started)
+                data = buffer.getvalue()
+                started = time.perf_counter()
+                decoded = decode_bytes(data, fmt)
+                decode_times.append(time.perf_counter() - started)
+            exact = decoded.shape == array.shape and np.array_equal(decoded, array)
+
+            # The same image encoded by every worker at once shows how well the codec releases the GIL
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(lambda _: encode_array(array, fmt, io.BytesIO()), range(workers)))
+            pool_rate = workers * array.nbytes / (time.perf_counter() - started) / 2 ** 20
+
+            print(f"{name[:35]:<36}{fmt:<13}{len(data):>11}{array.nbytes / len(data):>8.2f}"
+                  f"{min(encode_times) * 1e3:>9.1f}{min(decode_times) * 1e3:>9.1f}{pool_rate:>11.1f}"
+                  f"{'yes' if exact else 'no':>7}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare output formats by size, encode and decode time")
+    parser.add_argument('inputs', nargs='*', help=f"RGB rasters (default: {SAMPLE_DIR}/*_rgb.tif)")
+    parser.add_argument('--formats', nargs='+', choices=list(FORMATS), default=None,
+                        help="Formats to compare (default: every available one)")
+    parser.add_argument('--size', type=int, default=2048,
+                        help="Tile each sample up to SIZE x SIZE pixels (0 keeps the original size)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per measurement; the fastest is reported")
+    parser.add_argument('--workers', type=int, default=None, help="Threads for the pool throughput column")
+    args = parser.parse_args()
+
+    inputs = args.inputs or sorted(glob.glob(os.path.join(SAMPLE_DIR, '*_rgb.tif')))
+    run_benchmark(inputs, args.formats or available_formats(), args.size or None, args.repeat, args.workers)
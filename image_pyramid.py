@@ -0,0 +1,163 @@
+import io
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+from PIL import Image
+
+from tile_cache import TileCache, content_hash, make_cache_key
+from raster_store import open_raster
+
+DEFAULT_PYRAMID_DIR = os.path.join('.sr_cache', 'pyramids')
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+
+# Levels stop once the longest side fits in this many pixels
+MIN_LEVEL_SIZE = 256
+
+# Side length of the tiles served by the zoomable view
+TILE_SIZE = 512
+
+# Rows of the source level processed per block while downsampling
+BLOCK_ROWS = 1024
+
+
+def _downsample2_into(src, dst):
+    """2x2 box-downsamples `src` into `dst` row block by row block.
+
+    An odd last row or column is averaged with itself, so every output pixel
+    covers the same footprint as in the source.
+    """
+    height, width = src.shape[:2]
+    for start in range(0, height, BLOCK_ROWS):
+        block = np.asarray(src[start:start + BLOCK_ROWS], dtype=np.float32)
+        if block.shape[0] % 2:
+            block = np.concatenate([block, block[-1:]], axis=0)
+        if width % 2:
+            block = np.concatenate([block, block[:, -1:]], axis=1)
+        pooled = (block[0::2, 0::2] + block[1::2, 0::2] + block[0::2, 1::2] + block[1::2, 1::2])
+        pooled *= 0.25
+        np.rint(pooled, out=pooled)
+        dst[start // 2:start // 2 + pooled.shape[0]] = pooled
+
+
+def build_pyramid(shape, fill_level0, directory):
+    """Writes every pyramid level of an image as a memory-mappable .npy file.
+
+    `fill_level0(out)` must write the full-resolution uint8 image into the
+    (H, W, C) array it is given, which is backed by the level-0 file, so the
+    image never has to fit in RAM twice. Returns {level name: path}.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    path = os.path.join(directory, 'level_0.npy')
+    level = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=shape)
+    fill_level0(level)
+    level.flush()
+    paths['level_0'] = path
+
+    index = 0
+    while max(level.shape[:2]) > MIN_LEVEL_SIZE:
+        index += 1
+        next_shape = (-(-level.shape[0] // 2), -(-level.shape[1] // 2)) + level.shape[2:]
+        path = os.path.join(directory, f'level_{index}.npy')
+        next_level = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=next_shape)
+        _downsample2_into(level, next_level)
+        next_level.flush()
+        paths[f'level_{index}'] = path
+        level = next_level
+
+    meta_path = os.path.join(directory, 'pyramid.json')
+    with open(meta_path, 'w') as f:
+        json.dump({'levels': [list(np.load(paths[f'level_{i}'], mmap_mode='r').shape)
+                              for i in range(index + 1)]}, f)
+    paths['meta'] = meta_path
+    return paths
+
+
+class ImagePyramid:
+    """Read-only view over the levels of a cached pyramid (level 0 = full resolution)"""
+
+    def __init__(self, paths):
+        self.paths = paths
+        with open(paths['meta']) as f:
+            self.shapes = [tuple(shape) for shape in json.load(f)['levels']]
+
+    @property
+    def num_levels(self):
+        return len(self.shapes)
+
+    def level(self, index):
+        """Returns a level as a read-only memory map"""
+        return np.load(self.paths[f'level_{index}'], mmap_mode='r')
+
+    def level_for_width(self, display_width):
+        """Returns the smallest level that is still at least display_width wide"""
+        for index in range(self.num_levels - 1, -1, -1):
+            if self.shapes[index][1] >= display_width:
+                return index
+        return 0
+
+    def for_display(self, display_width):
+        """Returns the level array that matches a display width"""
+        return np.asarray(self.level(self.level_for_width(display_width)))
+
+    def tile_grid(self, index):
+        """Returns the (rows, cols) of tiles at a level"""
+        height, width = self.shapes[index][:2]
+        return -(-height // TILE_SIZE), -(-width // TILE_SIZE)
+
+    def tile(self, index, row, col):
+        """Returns one TILE_SIZE tile of a level; only that window is read from disk"""
+        level = self.level(index)
+        return np.asarray(level[row * TILE_SIZE:(row + 1) * TILE_SIZE, col * TILE_SIZE:(col + 1) * TILE_SIZE])
+
+
+def get_pyramid(key, shape, fill_level0, cache=None):
+    """Returns the cached pyramid for `key`, building it on the first request"""
+    transient = cache is None
+    if transient:
+        cache = TileCache(DEFAULT_PYRAMID_DIR, DEFAULT_MAX_BYTES)
+    paths = cache.get(key)
+    if paths is None:
+        build_dir = tempfile.mkdtemp(dir=cache.root)
+        try:
+            paths = cache.put(key, build_pyramid(shape, fill_level0, build_dir))
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+    elif transient:
+        # Nobody else holds this cache to flush the hit later
+        cache.flush()
+    return ImagePyramid(paths)
+
+
+def image_file_pyramid(data, cache=None, key=None):
+    """Returns the pyramid of a PNG/JPEG given as bytes, keyed by its content hash.
+
+    `key` may pass an already computed content hash of `data`.
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        width, height = img.size
+
+    def fill(out):
+        with Image.open(io.BytesIO(data)) as img:
+            out[...] = np.asarray(img.convert('RGB'))
+
+    return get_pyramid(key or content_hash(data), (height, width, 3), fill, cache)
+
+
+def raster_file_pyramid(path, cache=None):
+    """Returns the pyramid of a memory-mappable uint8 raster, keyed by its path and mtime.
+
+    Level 0 is copied from the mapped file block by block; nothing is decoded.
+    """
+    raster = open_raster(path)
+    stat = os.stat(path)
+    key = make_cache_key(raster=os.path.abspath(path), size=stat.st_size, mtime=stat.st_mtime)
+    shape = raster.shape if raster.ndim == 3 else raster.shape + (1,)
+
+    def fill(out):
+        for start in range(0, shape[0], BLOCK_ROWS):
+            out[start:start + BLOCK_ROWS] = raster[start:start + BLOCK_ROWS].reshape((-1,) + shape[1:])
+
+    return get_pyramid(key, shape, fill, cache)
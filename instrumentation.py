@@ -0,0 +1,197 @@
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import threading
+import contextlib
+import contextvars
+import tracemalloc
+
+# JSON-lines event log used when a run is started without an explicit path
+DEFAULT_EVENT_LOG = os.environ.get('SR_HUB_EVENT_LOG')
+
+# Functions listed in a run's cProfile report
+PROFILE_TOP = 25
+
+# Run that stage() records into; worker threads inherit it through
+# contextvars.copy_context() (see fetch_scheduler.run_tasks)
+_current_run = contextvars.ContextVar('sr_hub_run', default=None)
+
+# Most recently finished run, for dashboards and CLI summaries
+_last_run = None
+
+
+class Run:
+    """Collects stage timings and byte counts of one pipeline run.
+
+    Stages are recorded from any thread that runs in the run's context.
+    Every event is also appended to `log_path` as one JSON line when given.
+    With `profile`, the starting thread is profiled with cProfile; with
+    `trace_memory`, tracemalloc reports the peak Python allocation.
+    Use as a context manager, or call start() and stop().
+    """
+
+    def __init__(self, name, log_path=DEFAULT_EVENT_LOG, profile=False, trace_memory=False):
+        self.name = name
+        self.log_path = log_path
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.events = []
+        self.started = None
+        self.elapsed = None
+        self.profile_report = None
+        self.memory_peak = None
+        self._lock = threading.Lock()
+        self._token = None
+        self._profiler = None
+        self._owns_tracemalloc = False
+
+    def start(self):
+        self.started = time.time()
+        self._token = _current_run.set(self)
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracemalloc = True
+        if self.profile:
+            self._profiler = cProfile.Profile()
+            try:
+                self._profiler.enable()
+            except ValueError:
+                # Only one profiler may be active at a time (e.g. another session's run)
+                self._profiler = None
+                self.profile_report = "Profiling skipped: another profiler is active."
+        self._log({'event': 'run_start', 'run': self.name, 'time': self.started})
+        return self
+
+    def stop(self):
+        global _last_run
+        if self._profiler is not None:
+            self._profiler.disable()
+            stream = io.StringIO()
+            pstats.Stats(self._profiler, stream=stream).sort_stats('cumulative').print_stats(PROFILE_TOP)
+            self.profile_report = stream.getvalue()
+            self._profiler = None
+        if self.trace_memory and tracemalloc.is_tracing():
+            _, self.memory_peak = tracemalloc.get_traced_memory()
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+                self._owns_tracemalloc = False
+        self.elapsed = time.time() - self.started
+        if self._token is not None:
+            try:
+                _current_run.reset(self._token)
+            except ValueError:
+                # Stopped from another context (e.g. a later rerun cleaning up); the
+                # starting context is gone or keeps its own value
+                pass
+            self._token = None
+        self._log({'event': 'run_end', 'run': self.name, 'elapsed_s': self.elapsed,
+                   'memory_peak_bytes': self.memory_peak})
+        _last_run = self
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _log(self, event):
+        if self.log_path is None:
+            return
+        line = json.dumps(event, default=str)
+        with self._lock:
+            with open(self.log_path, 'a') as f:
+                f.write(line + '\n')
+
+    def record(self, stage, elapsed, nbytes=0, **fields):
+        """Adds one finished stage; extra fields (e.g. sensor, path) go to the event log"""
+        event = {'event': 'stage', 'run': self.name, 'stage': stage, 'elapsed_s': elapsed,
+                 'bytes': nbytes, 'thread': threading.current_thread().name, **fields}
+        with self._lock:
+            self.events.append(event)
+        self._log(event)
+
+    def summary(self):
+        """Returns per-stage totals, slowest first.
+
+        Rows are {'stage', 'calls', 'total_s', 'mean_s', 'max_s', 'bytes',
+        'mib_per_s', 'share'}; `share` is the stage's total over the run's
+        wall time, which exceeds 1 for stages that run in parallel.
+        """
+        with self._lock:
+            events = list(self.events)
+        stages = {}
+        for event in events:
+            row = stages.setdefault(event['stage'], {'stage': event['stage'], 'calls': 0, 'total_s': 0.0,
+                                                     'max_s': 0.0, 'bytes': 0})
+            row['calls'] += 1
+            row['total_s'] += event['elapsed_s']
+            row['max_s'] = max(row['max_s'], event['elapsed_s'])
+            row['bytes'] += event['bytes']
+        wall = self.elapsed if self.elapsed is not None else time.time() - self.started
+        rows = sorted(stages.values(), key=lambda row: row['total_s'], reverse=True)
+        for row in rows:
+            row['mean_s'] = row['total_s'] / row['calls']
+            row['mib_per_s'] = row['bytes'] / row['total_s'] / 2 ** 20 if row['bytes'] and row['total_s'] else 0.0
+            row['share'] = row['total_s'] / wall if wall else 0.0
+        return rows
+
+    def table(self):
+        """Returns summary() as rounded, labelled rows for st.dataframe"""
+        return [
+            {"Stage": row['stage'], "Calls": row['calls'], "Total (s)": round(row['total_s'], 3),
+             "Max (s)": round(row['max_s'], 3), "MiB": round(row['bytes'] / 2 ** 20, 2),
+             "MiB/s": round(row['mib_per_s'], 1), "Share of run": f"{row['share']:.0%}"}
+            for row in self.summary()
+        ]
+
+    def format_summary(self):
+        """Returns the stage breakdown as a fixed-width text table"""
+        lines = [f"=== {self.name}: {self.elapsed or 0.0:.2f} s ===",
+                 f"{'stage':<24}{'calls':>6}{'total s':>10}{'mean s':>10}{'max s':>10}{'MiB':>10}{'MiB/s':>9}"]
+        for row in self.summary():
+            lines.append(f"{row['stage']:<24}{row['calls']:>6}{row['total_s']:>10.3f}{row['mean_s']:>10.3f}"
+                         f"{row['max_s']:>10.3f}{row['bytes'] / 2 ** 20:>10.2f}{row['mib_per_s']:>9.1f}")
+        if self.memory_peak is not None:
+            lines.append(f"Peak traced memory: {self.memory_peak / 2 ** 20:.1f} MiB")
+        return '\n'.join(lines)
+
+
+def current_run():
+    """Returns the run stages are recorded into, or None"""
+    return _current_run.get()
+
+
+def last_run():
+    """Returns the most recently finished run, or None"""
+    return _last_run
+
+
+@contextlib.contextmanager
+def stage(name, nbytes=0, **fields):
+    """Times a block as one stage of the current run.
+
+    Yields a dict; set its 'bytes' entry inside the block when the size is
+    only known afterwards (e.g. a download). Without a current run this
+    only costs two clock reads.
+    """
+    info = {'bytes': nbytes}
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        run = _current_run.get()
+        if run is not None:
+            run.record(name, time.perf_counter() - start, info['bytes'], **fields)
+
+
+def file_size(path):
+    """Returns the size of a file, or 0 when it does not exist"""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
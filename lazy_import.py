@@ -0,0 +1,90 @@
+import os
+import re
+import sys
+import argparse
+import subprocess
+import importlib.util
+from types import ModuleType
+
+
+class _MissingModule(ModuleType):
+    """Placeholder for an optional module that is not installed"""
+
+    def __getattr__(self, attr):
+        raise ModuleNotFoundError(f"No module named '{self.__name__}'")
+
+
+def lazy_import(name):
+    """Returns a module that is only executed on first attribute access.
+
+    Heavy dependencies such as `ee` and `geemap` can be bound at module level
+    without slowing down every import of the module that uses them. A
+    missing module only raises once it is actually used, so offline code
+    paths (e.g. local_backend) work without it.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return _MissingModule(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+# `python -X importtime` lines: "import time: self [us] | cumulative | imported package"
+_IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def profile_import(module, python=sys.executable):
+    """Imports `module` in a fresh interpreter under -X importtime.
+
+    Returns (total seconds, [(cumulative seconds, module name), ...]) with
+    the direct and nested imports sorted slowest first.
+    """
+    proc = subprocess.run([python, '-X', 'importtime', '-c', f'import {module}'],
+                          capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr.strip().splitlines()[-1]}")
+    entries = []
+    total = 0.0
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match is None:
+            continue
+        cumulative = int(match.group(2)) / 1e6
+        name = match.group(4)
+        entries.append((cumulative, name))
+        if name == module:
+            total = cumulative
+    entries.sort(reverse=True)
+    return total, entries
+
+
+def report_startup(modules, top=10, budget=None):
+    """Prints the import-time profile of each module; returns False if one exceeds `budget` seconds"""
+    ok = True
+    for module in modules:
+        total, entries = profile_import(module)
+        status = ''
+        if budget is not None and total > budget:
+            status = f'  OVER BUDGET ({budget:.2f} s)'
+            ok = False
+        print(f"\n{module}: {total:.3f} s{status}")
+        for cumulative, name in entries[1:top + 1]:
+            print(f"  {cumulative:8.3f} s  {name}")
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Report the import-time profile of SR Hub modules")
+    parser.add_argument('modules', nargs='*', default=['data_transfer', 'time_series', 'local_backend'],
+                        help="Modules to import in a fresh interpreter")
+    parser.add_argument('--top', type=int, default=10, help="Slowest nested imports to list per module")
+    parser.add_argument('--budget', type=float, default=None,
+                        help="Exit with status 1 if a module takes longer than this many seconds to import")
+    args = parser.parse_args()
+    sys.exit(0 if report_startup(args.modules, args.top, args.budget) else 1)
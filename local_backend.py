@@ -0,0 +1,142 @@
+import os
+import glob
+import time
+import random
+import threading
+import zlib
+import numpy as np
+import tifffile
+
+from local_render import stretch_to_uint8
+from raster_store import geographic_extratags
+from cloud_mask import qa_band
+
+# Sample exports checked into the repository, one reflectance GeoTIFF per sensor
+DEFAULT_FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   'satellite_images_20250408_220231')
+
+METERS_PER_DEGREE = 111320.0
+
+# Quality band values of clear and cloudy pixels in synthetic QA bands:
+# QA_PIXEL "clear, low confidence" / "cloud, high confidence"; SCL vegetation / cloud high probability
+CLEAR_QA = {'QA_PIXEL': 21824, 'SCL': 4}
+CLOUDY_QA = {'QA_PIXEL': 22280, 'SCL': 9}
+
+# Share of pixels covered by synthetic clouds
+CLOUD_FRACTION = 0.2
+
+
+class LocalBackend:
+    """Offline stand-in for data_transfer.EarthEngineBackend.
+
+    Serves the reflectance GeoTIFF of each sensor from `fixture_dir` (files
+    named `<SENSOR>_*.tif`) or, without fixtures, a synthetic `size` x `size`
+    raster, plus a synthetic QA_PIXEL/SCL band with patchy clouds when the
+    image was selected with `qa`. Every call sleeps `latency` seconds plus up to `jitter`, and each
+    download fails with a ConnectionError with probability `failure_rate`, so
+    fetch, retry and batch paths can be measured and tested without Google
+    services. Downloads are written zlib-compressed, like real exports, so
+    local decode and ingest costs are included. `calls` and `failures`
+    count download attempts.
+    """
+
+    def __init__(self, fixture_dir=None, size=46, latency=0.0, jitter=0.0, failure_rate=0.0,
+                 scale=10.0, seed=0):
+        self.fixture_dir = fixture_dir
+        self.size = size
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.scale = scale
+        self.calls = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._fixtures = {}
+
+    def _wait(self):
+        with self._lock:
+            delay = self.latency + self._random.random() * self.jitter
+        if delay > 0:
+            time.sleep(delay)
+
+    def region(self, lat, lon):
+        return (lat, lon)
+
+    def polygon(self, ring):
+        return ring
+
+    def select_image(self, name, lat, lon, region, start_date, end_date,
+                     composite='least_cloudy', cloud_threshold=None, qa=False, footprint=None):
+        self._wait()
+        return {'name': name, 'lat': lat, 'lon': lon, 'start_date': str(start_date),
+                'end_date': str(end_date), 'composite': composite, 'qa': qa}
+
+    def _fixture(self, name):
+        """Returns the channels-last fixture raster of a sensor, or None"""
+        if self.fixture_dir is None:
+            return None
+        if name not in self._fixtures:
+            paths = sorted(path for path in glob.glob(os.path.join(self.fixture_dir, f'{name}_*.tif'))
+                           if not path.endswith('_rgb.tif'))
+            data = tifffile.imread(paths[0]).astype(np.float32) if paths else None
+            if data is not None and data.ndim == 2:
+                data = data[:, :, np.newaxis]
+            self._fixtures[name] = data
+        return self._fixtures[name]
+
+    def _synthetic(self, image, height, width, salt=''):
+        """Returns a smooth random 0-0.3 reflectance raster, stable per request"""
+        seed = zlib.crc32((repr(sorted(image.items())) + salt).encode('utf-8'))
+        rng = np.random.default_rng(seed)
+        coarse = rng.random((height // 8 + 2, width // 8 + 2, 3), dtype=np.float32)
+        smooth = np.repeat(np.repeat(coarse, 8, axis=0), 8, axis=1)[:height, :width]
+        noise = rng.normal(0.0, 0.01, smooth.shape).astype(np.float32)
+        return smooth * 0.3 + noise
+
+    def _quality(self, image, name, height, width, salt=''):
+        """Returns a (H, W, 1) float32 QA band with smooth cloud patches"""
+        band = qa_band(name)
+        clouds = self._synthetic(image, height, width, salt + 'clouds')[:, :, 0]
+        cloudy = clouds > np.quantile(clouds, 1.0 - CLOUD_FRACTION)
+        quality = np.where(cloudy, CLOUDY_QA[band], CLEAR_QA[band]).astype(np.float32)
+        return quality[:, :, np.newaxis]
+
+    def download(self, image, name, region, path, vis_params=None, grid=None):
+        self._wait()
+        with self._lock:
+            self.calls += 1
+            failed = self._random.random() < self.failure_rate
+            if failed:
+                self.failures += 1
+        if failed:
+            raise ConnectionError(f"Simulated {name} download failure")
+
+        data = self._fixture(name)
+        if grid is not None:
+            # Tiled exports get exactly the requested grid, repeating the fixture if needed
+            width, height = grid['dimensions']
+            step_x, _, west, _, step_y, north = grid['crs_transform']
+            if data is None:
+                data = self._synthetic(image, height, width, salt=repr(grid['crs_transform']))
+            else:
+                data = np.tile(data, (-(-height // data.shape[0]), -(-width // data.shape[1]), 1))[:height, :width]
+            extratags = geographic_extratags(west, north, step_x, -step_y)
+        else:
+            if data is None:
+                data = self._synthetic(image, self.size, self.size)
+            step = self.scale / METERS_PER_DEGREE
+            extratags = geographic_extratags(image['lon'] - step * data.shape[1] / 2,
+                                             image['lat'] + step * data.shape[0] / 2, step, step)
+        if vis_params is None and image.get('qa'):
+            data = np.concatenate([data[:, :, :3], self._quality(image, name, data.shape[0], data.shape[1],
+                                                                 repr(grid and grid['crs_transform']))], axis=2)
+        elif vis_params is not None:
+            data = stretch_to_uint8(data[:, :, :3], vis_params['min'], vis_params['max'],
+                                    vis_params.get('gamma', 1.0))
+        # Renamed once complete, like EarthEngineBackend.download
+        part_path = f'{os.path.splitext(path)[0]}.{threading.get_ident()}.part.tif'
+        tifffile.imwrite(part_path, data, compression='zlib',
+                         photometric='rgb' if data.dtype == np.uint8 and data.shape[2] == 3 else 'minisblack',
+                         planarconfig='contig', extratags=extratags)
+        os.replace(part_path, path)
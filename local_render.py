@@ -0,0 +1,83 @@
+import numpy as np
+import tifffile
+
+from raster_store import create_raster, finish_raster, geotiff_extratags, open_raster
+from image_formats import encode_array
+
+# Rows stretched per block when rendering from a memory-mapped raster
+BLOCK_ROWS = 1024
+
+
+def stretch_to_uint8(bands, vmin, vmax, gamma=1.0, out=None):
+    """Applies Earth Engine's visualize() min/max/gamma stretch locally.
+
+    Matches `image.visualize(min=vmin, max=vmax, gamma=gamma)`: values are
+    scaled to 0-1, clamped, raised to 1/gamma and rounded (halves up) to
+    0-255. `vmin` and `vmax` may be scalars or per-band sequences. NaNs
+    (masked pixels) become 0. Uses a single float32 working buffer.
+    """
+    bands = np.asarray(bands)
+    vmin = np.asarray(vmin, dtype=np.float32)
+    vmax = np.asarray(vmax, dtype=np.float32)
+    if out is None:
+        out = np.empty(bands.shape, dtype=np.uint8)
+
+    scaled = np.subtract(bands, vmin, dtype=np.float32)
+    scaled *= 255.0 / (vmax - vmin)
+    np.nan_to_num(scaled, copy=False, nan=0.0)
+    np.clip(scaled, 0.0, 255.0, out=scaled)
+    if gamma != 1.0:
+        scaled *= 1.0 / 255.0
+        np.power(scaled, 1.0 / gamma, out=scaled)
+        scaled *= 255.0
+    # Earth Engine rounds halves up, np.rint would round them to even
+    scaled += 0.5
+    np.floor(scaled, out=scaled)
+    np.copyto(out, scaled, casting='unsafe')
+    return out
+
+
+def render_rgb_from_geotiff(tif_path, vis_params, rgb_tif_path=None, png_path=None):
+    """Builds the RGB GeoTIFF and/or PNG from a downloaded reflectance GeoTIFF"""
+    with tifffile.TiffFile(tif_path) as tif:
+        page = tif.pages[0]
+        bands = page.asarray()
+        extratags = geotiff_extratags(page)
+
+    # EE exports are channels-last; keep the first three (R, G, B) bands
+    if bands.ndim == 2:
+        bands = bands[:, :, np.newaxis]
+    rgb = stretch_to_uint8(bands[:, :, :3], vis_params['min'], vis_params['max'], vis_params.get('gamma', 1.0))
+    if rgb.shape[2] == 1:
+        rgb = np.repeat(rgb, 3, axis=2)
+
+    if rgb_tif_path is not None:
+        tifffile.imwrite(rgb_tif_path, rgb, photometric='rgb', extratags=extratags)
+    if png_path is not None:
+        encode_array(rgb, 'png', png_path)
+    return rgb
+
+
+def render_rgb_raster(tif_path, vis_params, rgb_tif_path):
+    """Renders the RGB of a memory-mappable reflectance raster into another one.
+
+    Bands are stretched row block by row block straight from the mapped
+    input into the mapped output, so neither image is held in memory and
+    no PNG is written (see image_formats.ensure_encoded).
+    """
+    bands = open_raster(tif_path)
+    with tifffile.TiffFile(tif_path) as tif:
+        extratags = geotiff_extratags(tif.pages[0])
+    if bands.ndim == 2:
+        bands = bands[:, :, np.newaxis]
+
+    rgb = create_raster(rgb_tif_path, bands.shape[:2] + (3,), np.uint8, extratags)
+    for start in range(0, bands.shape[0], BLOCK_ROWS):
+        block = bands[start:start + BLOCK_ROWS, :, :3]
+        target = rgb[start:start + BLOCK_ROWS]
+        if block.shape[2] == 1:
+            target[...] = stretch_to_uint8(block, vis_params['min'], vis_params['max'], vis_params.get('gamma', 1.0))
+        else:
+            stretch_to_uint8(block, vis_params['min'], vis_params['max'], vis_params.get('gamma', 1.0), out=target)
+    finish_raster(rgb_tif_path, rgb, band_names=('red', 'green', 'blue'))
+    return rgb_tif_path
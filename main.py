@@ -1,10 +1,55 @@
 import streamlit as st
 import numpy as np
 from PIL import Image
-import io
 import os
-import base64
-import tifffile
+import shutil
+import tempfile
+from datetime import date, timedelta
+from tiff_reader import read_tiff_info, read_tiff_uint8
+from sr_metrics import CHANNEL_NAMES, compute_metrics
+from histograms import compute_histograms, histograms_of_file
+from coregistration import AlignmentCache, align_to_reference, read_georeference, scale_georeference
+from tile_cache import TileCache, content_hash, make_cache_key
+from image_pyramid import DEFAULT_PYRAMID_DIR, DEFAULT_MAX_BYTES, TILE_SIZE, get_pyramid, image_file_pyramid
+from session_cache import MemoryCache, static_asset_url, upload_hash
+from raster import Raster
+from instrumentation import Run, stage
+from data_transfer import COLLECTION_IDS, fetch_reference, non_interactive
+from raster_store import open_raster, read_index
+from cloud_mask import open_mask
+from reference_prefetch import Prefetcher
+from sr_inference import DEFAULT_SCALE, METHODS as SR_METHODS, make_upscaler, upscale_file
+from error_maps import KINDS as ERROR_MAP_KINDS, error_map_pyramid, legend
+from batch_compare import RESULT_COLUMNS, collect_inputs, compare_files, write_results
+from worker_pool import skip_main_in_workers
+
+# Histogram, batch comparison and SR inference workers must not re-run this page
+skip_main_in_workers(globals())
+
+# Width of the pyramid level used for metrics and alignment
+PREVIEW_SIZE = 2048
+
+# Width of the pyramid level sent to the browser for the overview
+DISPLAY_WIDTH = 1024
+
+# SR images generated from references, named by their input and settings
+GENERATED_DIR = os.path.join('.sr_cache', 'generated')
+
+# Seconds the "Load Original Image" button waits for a reference download
+REFERENCE_TIMEOUT = 600
+
+PREFETCH_LABELS = {
+    'queued': "Reference queued for prefetch…",
+    'running': "Fetching the reference in the background…",
+    'done': "Reference ready",
+    'failed': "Reference prefetch failed; click the button to retry",
+}
+
+ERROR_MAP_LABELS = {
+    'abs_error': "Absolute error",
+    'signed_error': "Signed error",
+    'ssim': "1 − SSIM",
+}
 
 # Set page configuration
 st.set_page_config(
@@ -13,24 +58,26 @@ st.set_page_config(
     layout="wide"
 )
 
-# Function to encode video to base64
-def get_base64_video(video_path):
-    with open(video_path, "rb") as video_file:
-        return base64.b64encode(video_file.read()).decode()
+# A rerun cut short by st.stop(), st.rerun() or an error never reaches the stop()
+# at the bottom; stop it here so its profiler and tracemalloc do not keep running
+unfinished_run = st.session_state.pop('perf_run', None)
+if unfinished_run is not None:
+    unfinished_run.stop()
+
+# Stage timings of this rerun, shown in the Performance panel at the bottom.
+# The profiling toggles there apply from the next rerun on.
+perf_run = Run('dashboard rerun', profile=st.session_state.get('perf_profile', False),
+               trace_memory=st.session_state.get('perf_trace_memory', False)).start()
+st.session_state['perf_run'] = perf_run
 
 # Copy video to current directory if it doesn't exist
 video_path = "background.mp4"
 if not os.path.exists(video_path):
-    import shutil
-<<<<<<< HEAD
     original_video = r"90877-629483574_small.mp4"
-=======
-    original_video = r"C:\Users\user\Downloads\90877-629483574_small.mp4"
->>>>>>> 13446651b3807f28190e75168da0d59fcf0bff21
     shutil.copy2(original_video, video_path)
 
-# Get base64 encoded video
-video_base64 = get_base64_video(video_path)
+# Serve the video as a static file the browser caches, not as an inline data URI
+video_url = static_asset_url(video_path)
 
 # Add custom CSS and HTML for video background
 background_style = f"""
@@ -63,7 +110,7 @@ background_style = f"""
     </style>
 
     <video autoplay muted loop playsinline class="video-background">
-        <source src="data:video/mp4;base64,{video_base64}" type="video/mp4">
+        <source src="{video_url}" type="video/mp4">
     </video>
 
     <div class="content-overlay">
@@ -170,69 +217,203 @@ st.markdown("### Super Resolution Image Comparison Dashboard")
 # Create two columns for image upload
 col1, col2 = st.columns(2)
 
+@st.cache_resource
+def get_alignment_cache():
+    """Returns the reference/SR transform cache shared by every session"""
+    return AlignmentCache()
+
+@st.cache_resource
+def get_pyramid_cache():
+    """Returns the on-disk cache of upload pyramids shared by every session"""
+    return TileCache(DEFAULT_PYRAMID_DIR, DEFAULT_MAX_BYTES)
+
+@st.cache_resource
+def get_session_cache():
+    """Returns the in-memory cache of decoded previews and metrics shared by every session"""
+    return MemoryCache()
+
+@st.cache_resource
+def get_reference_prefetcher():
+    """Returns the background reference fetcher shared by every session"""
+    cache = TileCache()
+
+    def fetch(*args):
+        # The worker thread must never wait for an authentication prompt
+        with non_interactive():
+            return fetch_reference(*args, cache=cache)
+    return Prefetcher(fetch)
+
+def display_array(arr, bands=None):
+    """Returns a 2-D or RGB composite view of a (H, W, C) pyramid level for st.image"""
+    raster = Raster(arr)
+    if raster.bands == 1:
+        return raster.band(0)
+    return raster.rgb(bands)
+
 # Initialize variables to store images
 img1_array = None
 img2_array = None
-
-def normalize_array(arr):
-    """Normalize array to 0-255 range and convert to uint8"""
-    if arr.dtype == np.float64 or arr.dtype == np.float32:
-        # Normalize float arrays to 0-255 range
-        arr_min = arr.min()
-        arr_max = arr.max()
-        if arr_max != arr_min:
-            arr = ((arr - arr_min) * 255 / (arr_max - arr_min))
-        else:
-            arr = arr - arr_min
-        arr = arr.astype(np.uint8)
-    return arr
+img1_geo = None
+img2_geo = None
+# Valid (cloud-free) pixels of the reference grid, from its QA band when downloaded
+img1_mask = None
+reference_files = None
 
 with col1:
     st.header("Original Image")
     st.markdown("### Enter Coordinates")
     lat1 = st.number_input("Latitude", value=31.7075, min_value=-90.0, max_value=90.0, step=0.0001, key="lat1", format="%.4f")
     lon1 = st.number_input("Longitude", value=76.5275, min_value=-180.0, max_value=180.0, step=0.0001, key="lon1", format="%.4f")
-    
-    # Add a button to load the image
-    if st.button("Load Original Image", key="load1"):
+    ref_start = st.date_input("Start date", value=date.today() - timedelta(days=365), key="ref_start")
+    ref_end = st.date_input("End date", value=date.today(), key="ref_end")
+    ref_sensor = st.selectbox("Sensor", list(COLLECTION_IDS), index=list(COLLECTION_IDS).index('SENTINEL_2'),
+                              key="ref_sensor")
+
+    # Start fetching as soon as the inputs settle (debounced), so the reference
+    # is usually local by the time the button is clicked
+    reference_args = (round(lat1, 4), round(lon1, 4), str(ref_start), str(ref_end), ref_sensor)
+    prefetcher = get_reference_prefetcher()
+    st.caption(PREFETCH_LABELS[prefetcher.request(reference_args, *reference_args)])
+
+    # Add a button to load the image; clicking it also retries a failed fetch
+    load_clicked = st.button("Load Original Image", key="load1")
+    if load_clicked:
+        st.session_state['reference_args'] = reference_args
+
+    # The loaded reference stays until the button is clicked for other inputs
+    if 'reference_args' in st.session_state:
+        loaded_args = st.session_state['reference_args']
         try:
-            st.info(f"Selected coordinates: {lat1}°N, {lon1}°E")
+            st.info(f"Selected coordinates: {loaded_args[0]}°N, {loaded_args[1]}°E")
+            with st.spinner("Loading the satellite reference…"), stage('reference'):
+                reference_files = prefetcher.get(loaded_args, *loaded_args, timeout=REFERENCE_TIMEOUT,
+                                                 retry=load_clicked)
+                img1_array = get_session_cache().get_or_compute(
+                    ('reference', reference_files['rgb']), lambda: np.array(open_raster(reference_files['rgb'])))
+                img1_geo = read_georeference(reference_files['rgb'])
+                if reference_files.get('mask'):
+                    img1_mask = get_session_cache().get_or_compute(
+                        ('reference_mask', reference_files['mask']), lambda: np.array(open_mask(reference_files['mask'])))
+            st.image(img1_array, use_container_width=True,
+                     caption=f"{loaded_args[4]} reference, {loaded_args[2]} to {loaded_args[3]}")
+            if loaded_args != reference_args:
+                st.caption("Inputs changed; click the button to load the new reference.")
             img1_loaded = True
         except Exception as e:
-            st.error(f"Error with coordinates: {str(e)}")
+            st.error(f"Error loading the reference: {str(e)}")
             img1_loaded = False
 
 with col2:
     st.header("Super Resolution Result")
-    st.markdown("### Upload Drone Image")
-    image2 = st.file_uploader("Upload high-resolution drone image", type=['png', 'jpg', 'jpeg', 'tif', 'tiff'], key="img2")
-    st.markdown('<p class="file-limitation-text">Limit 200MB per file • PNG, JPG, JPEG, TIF, TIFF</p>', unsafe_allow_html=True)
+    sr_origin = st.radio("SR image", ["Upload", "Generate from reference"], horizontal=True, key="sr_origin")
+    image2 = None
+    sr_source = None
+    if sr_origin == "Upload":
+        st.markdown("### Upload Drone Image")
+        image2 = st.file_uploader("Upload high-resolution drone image", type=['png', 'jpg', 'jpeg', 'tif', 'tiff'], key="img2")
+        st.markdown('<p class="file-limitation-text">Limit 200MB per file • PNG, JPG, JPEG, TIF, TIFF</p>', unsafe_allow_html=True)
+        sr_source = image2
+    elif reference_files is None:
+        st.info("Load the original image first; it is the low-resolution input.")
+    else:
+        # Upscale the loaded reference chip in-process, tile by tile
+        method_col, scale_col = st.columns(2)
+        sr_method = method_col.selectbox("Method", SR_METHODS, key="sr_method",
+                                         format_func=lambda method: "ONNX model" if method == 'onnx' else method.title())
+        sr_scale = scale_col.selectbox("Scale", [2, 3, 4], index=[2, 3, 4].index(DEFAULT_SCALE), key="sr_scale")
+        sr_model = st.text_input("ONNX model path", key="sr_model") if sr_method == 'onnx' else None
+        generated_path = os.path.join(GENERATED_DIR, make_cache_key(
+            source=reference_files['rgb'], mtime=os.path.getmtime(reference_files['rgb']),
+            method=sr_method, scale=sr_scale, model=sr_model) + '.tif')
+        if st.button("Generate SR image", key="generate_sr"):
+            try:
+                # The sidecar index is written last, so a file without one is incomplete
+                if read_index(generated_path) is None:
+                    os.makedirs(GENERATED_DIR, exist_ok=True)
+                    sr_progress = st.progress(0.0, text="Upscaling tiles…")
+                    upscale_file(reference_files['rgb'], generated_path,
+                                 make_upscaler(sr_method, sr_scale, sr_model),
+                                 on_progress=lambda done, total: sr_progress.progress(
+                                     done / total, text=f"Upscaling tiles: batch {done}/{total}"))
+                st.session_state['generated_sr'] = generated_path
+            except Exception as e:
+                st.error(f"Error generating the SR image: {str(e)}")
+        if st.session_state.get('generated_sr') == generated_path:
+            sr_source = generated_path
+    stretch_mode = st.radio("TIFF stretch", ["minmax", "percentile"], horizontal=True, key="stretch_mode",
+                            format_func=lambda mode: "Min/Max" if mode == "minmax" else "Percentile 2–98%")
+    stretch_per_band = st.checkbox("Stretch each band separately", key="stretch_per_band")
     
-    if image2 is not None:
+    if sr_source is not None:
         try:
+            # Reruns reuse everything derived from the same upload bytes
+            session_cache = get_session_cache()
+            if image2 is not None:
+                upload_key = upload_hash(image2, session_cache)
+                sr_type, sr_size = image2.type, image2.size
+            else:
+                # Generated files are named by their inputs, so the path is a content key
+                upload_key = make_cache_key(generated=sr_source)
+                sr_type, sr_size = 'image/tiff', os.path.getsize(sr_source)
             # Check if it's a TIFF file
-            if image2.type == 'image/tiff':
-                # Read TIFF file
-                tiff_bytes = image2.read()
-                img2_array = tifffile.imread(io.BytesIO(tiff_bytes))
-                # Normalize and convert the array
-                img2_array = normalize_array(img2_array)
-                # Convert to PIL Image
-                if img2_array.ndim == 2:  # If grayscale
-                    img2 = Image.fromarray(img2_array, mode='L')
-                elif img2_array.ndim == 3:  # If RGB/RGBA
-                    if img2_array.shape[2] > 3:  # If more than 3 channels
-                        img2_array = img2_array[:,:,:3]  # Take only RGB channels
-                    img2 = Image.fromarray(img2_array, mode='RGB')
+            if sr_type == 'image/tiff':
+                # Stream the normalized full-resolution image into the level-0 file
+                # of a cached pyramid instead of holding it in memory
+                height, width, samples, _ = session_cache.get_or_compute(('tiff_info', upload_key),
+                                                                         lambda: read_tiff_info(sr_source))
+                pyramid_key = make_cache_key(upload=upload_key, stretch=stretch_mode, per_band=stretch_per_band)
+                with stage('pyramid', sr_size):
+                    pyramid = get_pyramid(pyramid_key, (height, width, samples),
+                                          lambda out: read_tiff_uint8(sr_source, mode=stretch_mode,
+                                                                      per_band=stretch_per_band, out=out),
+                                          get_pyramid_cache())
+                color_mode = {1: 'L', 3: 'RGB'}.get(samples, f'{samples} bands')
+                img2_array = session_cache.get_or_compute(
+                    ('preview', pyramid_key),
+                    lambda: np.array(pyramid.level(pyramid.level_for_width(PREVIEW_SIZE))))
+                # Georeference of the preview grid, used to align with the reference
+                img2_geo = scale_georeference(
+                    session_cache.get_or_compute(('georeference', upload_key), lambda: read_georeference(sr_source)),
+                    width / img2_array.shape[1])
             else:
-                img2 = Image.open(image2)
-            
-            st.image(img2, use_container_width=True)
+                pyramid_key = upload_key
+                with stage('pyramid', sr_size):
+                    pyramid = image_file_pyramid(image2.getbuffer(), get_pyramid_cache(), key=upload_key)
+                height, width = pyramid.shapes[0][:2]
+                color_mode = Image.open(image2).mode
+                img2_array = session_cache.get_or_compute(
+                    ('preview', pyramid_key),
+                    lambda: np.array(pyramid.level(pyramid.level_for_width(PREVIEW_SIZE))))
+            # Every band is kept; the analysed composite is a view of the chosen three
+            sr_raster = Raster(img2_array)
+            composite = None
+            if sr_raster.bands > 3:
+                default_bands = sr_raster.rgb_bands()
+                composite = [
+                    composite_col.selectbox(f"{channel} band", list(range(sr_raster.bands)), index=default_bands[i],
+                                            key=f"composite_{channel.lower()}",
+                                            format_func=lambda band: sr_raster.band_names[band])
+                    for i, (composite_col, channel) in enumerate(zip(st.columns(3), CHANNEL_NAMES))
+                ]
+            img2_array = sr_raster.band(0) if sr_raster.bands == 1 else sr_raster.rgb(composite)
+
+            # Only the level matching the column width is sent to the browser
+            overview = session_cache.get_or_compute(('display', pyramid_key, DISPLAY_WIDTH),
+                                                    lambda: pyramid.for_display(DISPLAY_WIDTH))
+            st.image(display_array(overview, composite), use_container_width=True)
+            with st.expander("Inspect detail"):
+                zoom = st.select_slider("Zoom", options=list(range(pyramid.num_levels - 1, -1, -1)),
+                                        value=0, format_func=lambda level: f"1:{2 ** level}", key="zoom")
+                tile_rows, tile_cols = pyramid.tile_grid(zoom)
+                tile_row = st.slider("Tile row", 0, tile_rows - 1, 0, key="tile_row") if tile_rows > 1 else 0
+                tile_col = st.slider("Tile column", 0, tile_cols - 1, 0, key="tile_col") if tile_cols > 1 else 0
+                st.image(display_array(pyramid.tile(zoom, tile_row, tile_col), composite),
+                         caption=f"{TILE_SIZE} px tile ({tile_row}, {tile_col}) at 1:{2 ** zoom}")
             # Image details
             st.markdown("### SR Image Details")
-            st.write(f"Resolution: {img2.size[0]} × {img2.size[1]} pixels")
-            st.write(f"Color Mode: {img2.mode}")
-            st.write(f"File Format: {image2.type}")
+            st.write(f"Resolution: {width} × {height} pixels")
+            st.write(f"Color Mode: {color_mode}")
+            st.write(f"File Format: {sr_type}")
             img2_loaded = True
         except Exception as e:
             st.error(f"Error loading image: {str(e)}")
@@ -254,36 +435,75 @@ st.markdown('<h2 class="rgb-title">SR Analysis Metrics</h2>', unsafe_allow_html=
 
 # Check if both images are loaded
 if 'img1_loaded' in locals() and 'img2_loaded' in locals() and img1_loaded and img2_loaded:
+    # Score the SR image against the satellite reference once it is available
+    metrics = None
+    pair_histograms = None
+    if img1_array is not None:
+        try:
+            # The chosen bands are the image that gets aligned, scored and mapped
+            bands_key = 'default' if composite is None else '-'.join(map(str, composite))
+            alignment_key = f"{content_hash(img1_array.tobytes())}:{upload_key}:{bands_key}"
+
+            def align_pair():
+                # Grayscale uploads are broadcast to three channels without copying
+                sr_array = img2_array if img2_array.ndim == 3 else Raster(img2_array).rgb()
+                # Area-downsample the SR image onto the reference grid and register it
+                return align_to_reference(img1_array[:, :, :3], sr_array,
+                                          img1_geo, img2_geo, get_alignment_cache(), alignment_key)
+
+            def score():
+                sr_array, alignment = align_pair()
+                # Joint histograms need the aligned pair, so they are counted alongside the scores
+                # Cloudy reference pixels are skipped by both, not cut out of the images
+                return (compute_metrics(img1_array[:, :, :3], sr_array, mask=img1_mask), alignment,
+                        compute_histograms(sr_array, img1_array[:, :, :3], mask=img1_mask))
+
+            # Widget changes that do not touch either image reuse the scores
+            with stage('metrics'):
+                metrics, alignment, pair_histograms = session_cache.get_or_compute(
+                    ('metrics', alignment_key, pyramid_key), score)
+        except Exception as e:
+            st.error(f"Error computing metrics: {str(e)}")
+
     # Create three columns for RGB metrics
-    metric_col1, metric_col2, metric_col3 = st.columns(3)
-    
-    # Placeholder metrics for now
-    with metric_col1:
-        st.markdown('<div class="metric-card red-metric">', unsafe_allow_html=True)
-        st.metric(
-            label="Red Channel",
-            value="Pending",
-            delta="Pending"
-        )
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    with metric_col2:
-        st.markdown('<div class="metric-card green-metric">', unsafe_allow_html=True)
-        st.metric(
-            label="Green Channel",
-            value="Pending",
-            delta="Pending"
-        )
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    with metric_col3:
-        st.markdown('<div class="metric-card blue-metric">', unsafe_allow_html=True)
-        st.metric(
-            label="Blue Channel",
-            value="Pending",
-            delta="Pending"
-        )
-        st.markdown('</div>', unsafe_allow_html=True)
+    metric_cols = st.columns(3)
+    for index, (metric_col, channel) in enumerate(zip(metric_cols, ["red", "green", "blue"])):
+        with metric_col:
+            st.markdown(f'<div class="metric-card {channel}-metric">', unsafe_allow_html=True)
+            if metrics is not None:
+                channel_metrics = metrics['channels'][index]
+                st.metric(
+                    label=f"{channel_metrics['name']} Channel",
+                    value=f"{channel_metrics['psnr']:.2f} dB PSNR",
+                    delta=f"SSIM {channel_metrics['ssim']:.4f}",
+                    delta_color="off"
+                )
+            else:
+                st.metric(
+                    label=f"{channel.capitalize()} Channel",
+                    value="Pending",
+                    delta="Pending"
+                )
+            st.markdown('</div>', unsafe_allow_html=True)
+
+    if metrics is not None:
+        with st.expander("All quality metrics"):
+            st.table([
+                {
+                    "Channel": channel_metrics['name'],
+                    "PSNR (dB)": round(channel_metrics['psnr'], 3),
+                    "SSIM": round(channel_metrics['ssim'], 4),
+                    "MS-SSIM": round(channel_metrics['ms_ssim'], 4),
+                    "RMSE": round(channel_metrics['rmse'], 3),
+                }
+                for channel_metrics in metrics['channels']
+            ])
+            st.write(f"Spectral angle: {metrics['sam']:.3f}°")
+            if img1_mask is not None:
+                st.write(f"Scored pixels: {metrics['valid_pixels']:,} of {img1_mask.size:,} "
+                         f"({metrics['valid_pixels'] / img1_mask.size:.0%} cloud-free)")
+            st.write(f"Alignment: {alignment['method']}, residual shift "
+                     f"{alignment['shift'][0]:+.2f} / {alignment['shift'][1]:+.2f} px (row / col)")
 
     # Additional analysis options
     st.markdown("### Detailed Analysis")
@@ -292,14 +512,151 @@ if 'img1_loaded' in locals() and 'img2_loaded' in locals() and img1_loaded and i
         ["RGB Distribution", "Color Histogram", "Channel Comparison"]
     )
 
+    # Charts are drawn from compact histogram summaries, never from the pixels.
+    # The full-resolution level is counted once per upload, split across processes.
+    with stage('histograms'):
+        sr_histograms = session_cache.get_or_compute(('histograms', pyramid_key),
+                                                     lambda: histograms_of_file(pyramid.paths['level_0']))
+    band_names = [CHANNEL_NAMES[band] if band < len(CHANNEL_NAMES) else f'Band {band + 1}'
+                  for band in range(sr_histograms.bands)]
+
     if analysis_type == "RGB Distribution":
-        st.info("Image analysis will be available once the satellite imagery is loaded.")
+        st.line_chart({name: counts for name, counts in zip(band_names, sr_histograms.coarse())})
+        st.table([
+            {"Channel": name, "Min": band_stats['min'], "Max": band_stats['max'],
+             "Mean": round(band_stats['mean'], 2), "Std": round(band_stats['std'], 2)}
+            for name, band_stats in zip(band_names, sr_histograms.stats())
+        ])
     elif analysis_type == "Color Histogram":
-        st.info("Histogram analysis will be available once the satellite imagery is loaded.")
+        hist_col, cdf_col = st.columns(2)
+        with hist_col:
+            st.markdown("#### Histogram")
+            st.bar_chart({name: counts for name, counts in zip(band_names, sr_histograms.coarse())})
+        with cdf_col:
+            st.markdown("#### Cumulative distribution")
+            st.line_chart({name: cdf for name, cdf in zip(band_names, sr_histograms.cdf())})
     elif analysis_type == "Channel Comparison":
-        st.info("Channel comparison will be available once the satellite imagery is loaded.")
+        if pair_histograms is None:
+            st.info("Channel comparison will be available once the satellite imagery is loaded.")
+        else:
+            comparison_cols = st.columns(pair_histograms.bands)
+            for band, comparison_col in enumerate(comparison_cols):
+                with comparison_col:
+                    st.markdown(f"#### {band_names[band]}")
+                    st.line_chart({"Reference": pair_histograms.coarse(reference=True)[band],
+                                   "SR": pair_histograms.coarse()[band]})
+                    st.image(pair_histograms.joint_image(band), use_container_width=True,
+                             caption="Joint histogram (rows: reference, columns: SR)")
+
+            # Maps are rendered once into a cached pyramid next to the upload's; reruns only read tiles
+            st.markdown("#### Error map")
+            kind_col, map_band_col = st.columns(2)
+            error_kind = kind_col.radio("Map", ERROR_MAP_KINDS, horizontal=True, key="error_kind",
+                                        format_func=lambda kind: ERROR_MAP_LABELS[kind])
+            error_band = map_band_col.selectbox("Band", [None] + list(range(pair_histograms.bands)), key="error_band",
+                                                format_func=lambda band: "Mean of bands" if band is None else band_names[band])
+            try:
+                with stage('error_map'):
+                    error_pyramid = error_map_pyramid(
+                        make_cache_key(pair=alignment_key, sr=pyramid_key, kind=error_kind, band=error_band,
+                                       masked=img1_mask is not None),
+                        img1_array.shape, lambda: (img1_array[:, :, :3], align_pair()[0]),
+                        error_kind, error_band, img1_mask, get_pyramid_cache())
+                error_zoom = st.select_slider("Map zoom", options=list(range(error_pyramid.num_levels - 1, -1, -1)),
+                                              value=error_pyramid.num_levels - 1,
+                                              format_func=lambda level: f"1:{2 ** level}", key="error_zoom")
+                map_rows, map_cols = error_pyramid.tile_grid(error_zoom)
+                map_row = st.slider("Map tile row", 0, map_rows - 1, 0, key="error_tile_row") if map_rows > 1 else 0
+                map_col = st.slider("Map tile column", 0, map_cols - 1, 0, key="error_tile_col") if map_cols > 1 else 0
+                st.image(error_pyramid.tile(error_zoom, map_row, map_col), use_container_width=True,
+                         caption=f"{TILE_SIZE} px tile ({map_row}, {map_col}) at 1:{2 ** error_zoom}" +
+                                 ("; grey pixels are masked as cloudy" if img1_mask is not None else ""))
+                st.image(legend(error_kind), use_container_width=True,
+                         caption="SR darker → SR brighter" if error_kind == 'signed_error' else "Low error → high error")
+            except Exception as e:
+                st.error(f"Error rendering the error map: {str(e)}")
 else:
     st.info("Please load both the original image and its super resolution result to see RGB analysis metrics")
 
+# Score many SR tiles against one reference in a process pool
+st.markdown("---")
+st.markdown("### Batch Comparison")
+with st.expander("Compare a folder or zip of SR images"):
+    batch_reference = st.file_uploader("Reference image", type=['png', 'jpg', 'jpeg', 'tif', 'tiff'],
+                                       key="batch_reference")
+    batch_uploads = st.file_uploader("SR images or .zip archives", accept_multiple_files=True,
+                                     type=['png', 'jpg', 'jpeg', 'tif', 'tiff', 'zip'], key="batch_uploads")
+    batch_dir = st.text_input("…or a directory on the server", key="batch_dir")
+    batch_workers = st.slider("Worker processes", 1, os.cpu_count() or 1, os.cpu_count() or 1, key="batch_workers")
+
+    run_batch = st.button("Run batch comparison", key="run_batch")
+    if run_batch and batch_reference is None:
+        st.warning("Upload a reference image first")
+    elif run_batch:
+        work_dir = tempfile.mkdtemp(prefix='sr_batch_')
+        try:
+            # Workers read from disk, so uploads are written out once
+            reference_path = os.path.join(work_dir, 'reference_' + os.path.basename(batch_reference.name))
+            with open(reference_path, 'wb') as f:
+                f.write(batch_reference.getbuffer())
+            inputs = []
+            for index, upload in enumerate(batch_uploads or []):
+                upload_path = os.path.join(work_dir, f'{index}_{os.path.basename(upload.name)}')
+                with open(upload_path, 'wb') as f:
+                    f.write(upload.getbuffer())
+                if upload.name.lower().endswith('.zip'):
+                    inputs.extend(collect_inputs(upload_path, os.path.join(work_dir, f'zip_{index}')))
+                else:
+                    inputs.append(upload_path)
+            if batch_dir:
+                inputs.extend(collect_inputs(batch_dir))
+
+            progress = st.progress(0.0, text=f"0/{len(inputs)} images scored")
+
+            def show_batch_progress(row, done, total):
+                progress.progress(done / total, text=f"{done}/{total} images scored")
+
+            with stage('batch_compare', sum(os.path.getsize(path) for path in inputs)):
+                st.session_state['batch_results'] = compare_files(inputs, reference_path, batch_workers,
+                                                                  on_result=show_batch_progress)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    batch_results = st.session_state.get('batch_results')
+    if batch_results:
+        # st.dataframe columns are sortable by clicking their header
+        st.dataframe([{column: row.get(column) for column in RESULT_COLUMNS} for row in batch_results],
+                     use_container_width=True)
+        export_dir = tempfile.mkdtemp(prefix='sr_batch_export_')
+        try:
+            csv_path = write_results(batch_results, os.path.join(export_dir, 'sr_batch_results.csv'))
+            with open(csv_path, 'rb') as f:
+                st.download_button("Download CSV", f.read(), file_name='sr_batch_results.csv', mime='text/csv')
+            try:
+                parquet_path = write_results(batch_results, os.path.join(export_dir, 'sr_batch_results.parquet'))
+                with open(parquet_path, 'rb') as f:
+                    st.download_button("Download Parquet", f.read(), file_name='sr_batch_results.parquet',
+                                       mime='application/octet-stream')
+            except Exception as e:
+                st.caption(f"Parquet export unavailable: {e}")
+        finally:
+            shutil.rmtree(export_dir, ignore_errors=True)
+
+# Where the time of this rerun went
+perf_run.stop()
+del st.session_state['perf_run']
+
+with st.expander("Performance"):
+    st.caption(f"Last rerun took {perf_run.elapsed:.2f} s. Cached steps take (almost) no time.")
+    perf_rows = perf_run.table()
+    if perf_rows:
+        st.dataframe(perf_rows, use_container_width=True)
+    if perf_run.memory_peak is not None:
+        st.write(f"Peak traced Python memory: {perf_run.memory_peak / 2 ** 20:.1f} MiB")
+    if perf_run.profile_report:
+        st.code(perf_run.profile_report)
+    st.checkbox("Profile the next rerun with cProfile", key="perf_profile")
+    st.checkbox("Trace memory allocations on the next rerun", key="perf_trace_memory")
+
 # Close the content-overlay div
 st.markdown(end_div, unsafe_allow_html=True) 
\ No newline at end of file
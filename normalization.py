@@ -0,0 +1,412 @@
+import time
+import argparse
+import tracemalloc
+import numpy as np
+
+# Rows processed per block; bounds the size of float32 temporaries
+BLOCK_ROWS = 512
+
+# Histogram resolution used for float percentiles
+FLOAT_BINS = 65536
+
+# Integer dtypes whose full value range can be histogrammed exactly
+EXACT_INT_DTYPES = (np.uint8, np.int8, np.uint16, np.int16)
+
+# Bins per axis of joint reference/test histograms
+JOINT_BINS = 256
+
+
+def iter_row_blocks(arr, block_rows=BLOCK_ROWS):
+    """Yields (first band, row block view) pairs of a channels-last or 2-D array"""
+    for start in range(0, arr.shape[0], block_rows):
+        yield 0, arr[start:start + block_rows]
+
+
+def iter_raster_blocks(raster, block_rows=BLOCK_ROWS):
+    """Yields (first band, row block view) pairs of a Raster in its own layout.
+
+    Planar rasters yield one 2-D block per band, so they are never transposed.
+    """
+    if raster.layout == 'yxb':
+        yield from iter_row_blocks(raster.data, block_rows)
+        return
+    for band in range(raster.bands):
+        for start in range(0, raster.height, block_rows):
+            yield band, raster.data[band, start:start + block_rows]
+
+
+def _as_bands(block):
+    """Reshapes a block to (pixels, bands) without copying when possible"""
+    if block.ndim == 2:
+        return block.reshape(-1, 1)
+    return block.reshape(-1, block.shape[-1])
+
+
+def _valid(values, nodata):
+    """Returns the values of one band that are not NaN or nodata"""
+    if values.dtype.kind == 'f':
+        values = values[np.isfinite(values)]
+    if nodata is not None:
+        values = values[values != nodata]
+    return values
+
+
+class HistogramAccumulator:
+    """Accumulates per-band value histograms over blocks.
+
+    uint8/int8/uint16/int16 data is counted exactly with np.bincount over
+    the dtype's full range (256 bins for uint8, 65536 for uint16). Other
+    dtypes need `value_range` (e.g. from a min/max pass) and are binned into
+    FLOAT_BINS bins, which is enough for 2-98% stretches. Paired
+    accumulators (exact dtypes only) also count a reference image block by
+    block and the joint (reference, value) distribution, with both axes
+    quantized to JOINT_BINS levels. Partial results from blocks, tiles or
+    worker processes are combined with merge(); percentiles, CDFs and
+    statistics are derived from the counts, so charts never touch the pixels.
+    """
+
+    def __init__(self, dtype, bands, value_range=None, nodata=None, paired=False):
+        self.dtype = np.dtype(dtype)
+        self.nodata = nodata
+        self.exact = self.dtype.type in EXACT_INT_DTYPES
+        if self.exact:
+            info = np.iinfo(self.dtype)
+            self.offset = int(info.min)
+            nbins = int(info.max) - int(info.min) + 1
+        else:
+            if value_range is None or paired:
+                raise ValueError(f"{self.dtype} data needs a value range and cannot be paired; "
+                                 f"exact histograms take 8 or 16-bit integers")
+            self.offset = None
+            nbins = FLOAT_BINS
+        self.value_range = value_range
+        self.counts = np.zeros((bands, nbins), dtype=np.int64)
+        self.reference_counts = np.zeros_like(self.counts) if paired else None
+        self.joint = np.zeros((bands, JOINT_BINS, JOINT_BINS), dtype=np.int64) if paired else None
+        # Right shift that maps an exact bin index to a joint-histogram bin
+        self.shift = (nbins // JOINT_BINS).bit_length() - 1
+
+    @property
+    def bands(self):
+        return self.counts.shape[0]
+
+    @property
+    def nbins(self):
+        return self.counts.shape[1]
+
+    @property
+    def paired(self):
+        return self.joint is not None
+
+    @property
+    def bin_values(self):
+        """Returns the value counted by each bin (the lower edge for float bins)"""
+        if self.exact:
+            return np.arange(self.nbins) + self.offset
+        lo, hi = self.value_range
+        return lo + (hi - lo) * np.arange(self.nbins) / self.nbins
+
+    def _indices(self, values):
+        if self.offset:
+            return values.astype(np.int32) - self.offset
+        return values
+
+    def update(self, block, band_start=0, reference=None, mask=None):
+        """Adds a block whose last axis holds bands band_start, band_start + 1, ...
+
+        Paired accumulators need `reference`, the matching block of the
+        reference image. Pixels where the (rows, cols) boolean `mask` block
+        is False (e.g. clouds) are not counted.
+        """
+        if (reference is not None) != self.paired:
+            raise ValueError("Paired histograms need a reference block, unpaired ones must not get one")
+        flat = _as_bands(block)
+        reference_flat = _as_bands(reference) if reference is not None else None
+        if mask is not None:
+            # Gathers the valid pixels of this block only
+            keep = mask.reshape(-1)
+            flat = flat[keep]
+            reference_flat = reference_flat[keep] if reference_flat is not None else None
+        for band in range(flat.shape[1]):
+            if reference_flat is not None:
+                self._update_pair(band_start + band, flat[:, band], reference_flat[:, band])
+                continue
+            values = _valid(flat[:, band], self.nodata)
+            if values.size == 0:
+                continue
+            if self.exact:
+                counts = np.bincount(self._indices(values), minlength=self.nbins)
+            else:
+                lo, hi = self.value_range
+                counts, _ = np.histogram(values, bins=self.nbins, range=(lo, hi if hi > lo else lo + 1))
+            self.counts[band_start + band] += counts
+        return self
+
+    def _update_pair(self, band, values, reference_values):
+        if self.nodata is not None:
+            # A pixel counts only when both images have data there
+            keep = (values != self.nodata) & (reference_values != self.nodata)
+            values, reference_values = values[keep], reference_values[keep]
+        values = self._indices(values)
+        reference_values = self._indices(reference_values)
+        self.counts[band] += np.bincount(values, minlength=self.nbins)
+        self.reference_counts[band] += np.bincount(reference_values, minlength=self.nbins)
+        joint_index = (reference_values.astype(np.intp) >> self.shift) * JOINT_BINS
+        joint_index += values.astype(np.intp) >> self.shift
+        self.joint[band] += np.bincount(joint_index, minlength=JOINT_BINS * JOINT_BINS).reshape(JOINT_BINS,
+                                                                                                JOINT_BINS)
+
+    def merge(self, other):
+        """Adds the counts of another accumulator (e.g. from a tile or a worker)"""
+        self.counts += other.counts
+        if self.paired:
+            self.reference_counts += other.reference_counts
+            self.joint += other.joint
+        return self
+
+    def _bin_value(self, index):
+        if self.exact:
+            return float(index + self.offset)
+        lo, hi = self.value_range
+        return lo + (hi - lo) * index / self.counts.shape[1]
+
+    def _select(self, reference):
+        if reference and not self.paired:
+            raise ValueError("No reference histogram was accumulated")
+        return self.reference_counts if reference else self.counts
+
+    def percentiles(self, low, high, per_band=False):
+        """Returns (lo, hi) at the given percentiles, per band or over all bands"""
+        counts = self.counts if per_band else self.counts.sum(axis=0, keepdims=True)
+        lows, highs = [], []
+        for band_counts in counts:
+            cdf = np.cumsum(band_counts)
+            total = cdf[-1]
+            if total == 0:
+                lows.append(0.0)
+                highs.append(0.0)
+                continue
+            lows.append(self._bin_value(np.searchsorted(cdf, total * low / 100.0, side='right')))
+            # The upper edge of the bin holding the high percentile
+            highs.append(self._bin_value(np.searchsorted(cdf, total * high / 100.0, side='left') + (0 if self.exact else 1)))
+        if per_band:
+            return np.array(lows), np.array(highs)
+        return lows[0], highs[0]
+
+    def coarse(self, bins=256, reference=False):
+        """Returns (bands, bins) counts summed into fewer bins for charts"""
+        counts = self._select(reference)
+        if self.nbins <= bins:
+            return counts
+        return counts.reshape(self.bands, bins, self.nbins // bins).sum(axis=2)
+
+    def cdf(self, reference=False):
+        """Returns the (bands, nbins) cumulative distribution, scaled to 0-1"""
+        cdf = np.cumsum(self._select(reference), axis=1, dtype=np.float64)
+        totals = cdf[:, -1:]
+        return np.divide(cdf, totals, out=np.zeros_like(cdf), where=totals > 0)
+
+    def stats(self, reference=False):
+        """Returns per-band {'min', 'max', 'mean', 'std', 'pixels'} computed from the counts"""
+        values = self.bin_values.astype(np.float64)
+        cast = int if self.exact else float
+        result = []
+        for band_counts in self._select(reference):
+            total = int(band_counts.sum())
+            if total == 0:
+                result.append({'min': 0, 'max': 0, 'mean': 0.0, 'std': 0.0, 'pixels': 0})
+                continue
+            nonzero = np.flatnonzero(band_counts)
+            mean = float(band_counts @ values) / total
+            variance = float(band_counts @ (values - mean) ** 2) / total
+            result.append({
+                'min': cast(values[nonzero[0]]),
+                'max': cast(values[nonzero[-1]]),
+                'mean': mean,
+                'std': variance ** 0.5,
+                'pixels': total,
+            })
+        return result
+
+    def joint_image(self, band):
+        """Returns the joint histogram of a band as a log-scaled uint8 image.
+
+        Rows are reference levels and columns test levels, so a perfect match
+        is a bright diagonal.
+        """
+        density = np.log1p(self.joint[band].astype(np.float64))
+        peak = density.max()
+        if peak > 0:
+            density *= 255.0 / peak
+        return density.astype(np.uint8)
+
+
+def _minmax(blocks, bands, nodata):
+    """Per-band min/max over an iterable of blocks, ignoring NaN/nodata"""
+    lo = np.full(bands, np.inf)
+    hi = np.full(bands, -np.inf)
+    for band_start, block in blocks:
+        flat = _as_bands(block)
+        for band in range(flat.shape[1]):
+            values = flat[:, band]
+            if nodata is not None:
+                values = _valid(values, nodata)
+            if values.size == 0:
+                continue
+            # fmin/fmax skip NaNs without building a filtered copy
+            band_lo = np.fmin.reduce(values)
+            band_hi = np.fmax.reduce(values)
+            if np.isinf(band_lo) or np.isinf(band_hi):
+                values = _valid(values, nodata)
+                if values.size == 0:
+                    continue
+                band_lo, band_hi = values.min(), values.max()
+            if np.isnan(band_lo):
+                continue
+            lo[band_start + band] = min(lo[band_start + band], band_lo)
+            hi[band_start + band] = max(hi[band_start + band], band_hi)
+    empty = lo > hi
+    lo[empty] = 0.0
+    hi[empty] = 0.0
+    return lo, hi
+
+
+def compute_range_blocks(make_blocks, dtype, bands, mode='minmax', low=2.0, high=98.0,
+                         per_band=False, nodata=None):
+    """Computes the stretch range over blocks produced by `make_blocks()`.
+
+    `make_blocks` is called once per pass and must return a fresh iterable of
+    (first band, block) pairs, where each block is channels-last or 2-D, so
+    the data can be streamed from disk.
+    Returns (lo, hi) as scalars, or per-band arrays when per_band is set.
+    """
+    dtype = np.dtype(dtype)
+    if mode == 'minmax' or (mode == 'percentile' and dtype.type not in EXACT_INT_DTYPES):
+        lo, hi = _minmax(make_blocks(), bands, nodata)
+        if mode == 'minmax':
+            return (lo, hi) if per_band else (float(lo.min()), float(hi.max()))
+        value_range = (float(lo.min()), float(hi.max()))
+    elif mode == 'percentile':
+        value_range = None
+    else:
+        raise ValueError(f"Unknown normalization mode: {mode}")
+
+    accumulator = HistogramAccumulator(dtype, bands, value_range, nodata)
+    for band_start, block in make_blocks():
+        accumulator.update(block, band_start)
+    return accumulator.percentiles(low, high, per_band)
+
+
+def normalize_block(block, lo, hi, out, nodata=None):
+    """Linearly maps [lo, hi] of one block to 0-255 into the uint8 `out` view"""
+    lo = np.asarray(lo, dtype=np.float32)
+    hi = np.asarray(hi, dtype=np.float32)
+    span = hi - lo
+    scale = np.divide(255.0, span, out=np.zeros_like(span), where=span != 0)
+
+    chunk = np.subtract(block, lo, dtype=np.float32)
+    chunk *= scale
+    np.nan_to_num(chunk, copy=False, nan=0.0)
+    np.clip(chunk, 0, 255, out=chunk)
+    if nodata is not None:
+        chunk[block == nodata] = 0
+    np.copyto(out, chunk, casting='unsafe')
+    return out
+
+
+def normalize_array(arr, mode='minmax', low=2.0, high=98.0, per_band=False, nodata=None,
+                    out=None, block_rows=BLOCK_ROWS):
+    """Normalize array to 0-255 range and convert to uint8.
+
+    Handles uint8/uint16/int16 and float data in 2-D or channels-last layout.
+    `mode` is 'minmax' or 'percentile' (a low-high% stretch computed from a
+    histogram, not a sort). NaN and `nodata` pixels are ignored when computing
+    the range and written as 0. Works through row blocks, so the only
+    full-size allocation is the uint8 output (which may be passed as `out`).
+    uint8 input is returned unchanged in minmax mode.
+    """
+    arr = np.asarray(arr)
+    if arr.dtype == np.uint8 and mode == 'minmax' and nodata is None and out is None:
+        return arr
+
+    bands = 1 if arr.ndim == 2 else arr.shape[-1]
+    lo, hi = compute_range_blocks(lambda: iter_row_blocks(arr, block_rows), arr.dtype, bands,
+                                  mode, low, high, per_band, nodata)
+    if out is None:
+        out = np.empty(arr.shape, dtype=np.uint8)
+    for start in range(0, arr.shape[0], block_rows):
+        normalize_block(arr[start:start + block_rows], lo, hi, out[start:start + block_rows], nodata)
+    return out
+
+
+def normalize_raster(raster, mode='minmax', low=2.0, high=98.0, per_band=False, out=None,
+                     block_rows=BLOCK_ROWS):
+    """Normalizes a Raster of any layout to a channels-last uint8 Raster.
+
+    Like normalize_array, with the raster's own nodata value, and planar
+    rasters read band plane by band plane. The result keeps the band names
+    and georeference; a channels-last uint8 raster is returned as is in
+    minmax mode.
+    """
+    if raster.dtype == np.uint8 and raster.layout == 'yxb' and mode == 'minmax' and raster.nodata is None \
+            and out is None:
+        return raster
+    if raster.layout == 'yxb':
+        data = normalize_array(raster.data, mode, low, high, per_band, raster.nodata, out, block_rows)
+        return raster.replace(data, 'yxb')
+
+    lo, hi = compute_range_blocks(lambda: iter_raster_blocks(raster, block_rows), raster.dtype, raster.bands,
+                                  mode, low, high, per_band, raster.nodata)
+    lo = np.broadcast_to(np.asarray(lo, dtype=np.float32), (raster.bands,))
+    hi = np.broadcast_to(np.asarray(hi, dtype=np.float32), (raster.bands,))
+    if out is None:
+        out = np.empty(raster.shape, dtype=np.uint8)
+    for band in range(raster.bands):
+        plane = raster.band(band)
+        for start in range(0, raster.height, block_rows):
+            normalize_block(plane[start:start + block_rows], lo[band], hi[band],
+                            out[start:start + block_rows, :, band], raster.nodata)
+    return raster.replace(out, 'yxb')
+
+
+def _naive_normalize(arr):
+    """The previous whole-array float implementation, kept for the benchmark"""
+    arr_min = arr.min()
+    arr_max = arr.max()
+    return ((arr - arr_min) * 255 / (arr_max - arr_min)).astype(np.uint8)
+
+
+def _measure(func, *args, **kwargs):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def run_benchmark(size=10000):
+    """Reports time and peak extra memory for normalizing size x size rasters"""
+    rng = np.random.default_rng(0)
+    rasters = {
+        'uint16': rng.integers(0, 10000, (size, size), dtype=np.uint16),
+        'float32': rng.random((size, size), dtype=np.float32),
+    }
+    cases = [
+        ('naive minmax', _naive_normalize, {}),
+        ('minmax', normalize_array, {}),
+        ('percentile 2-98', normalize_array, {'mode': 'percentile'}),
+    ]
+    print(f"\n=== NORMALIZATION BENCHMARK ({size} x {size}) ===")
+    for dtype, arr in rasters.items():
+        print(f"{dtype}: input {arr.nbytes / 2 ** 20:.0f} MiB, output {arr.size / 2 ** 20:.0f} MiB")
+        for label, func, kwargs in cases:
+            elapsed, peak = _measure(func, arr, **kwargs)
+            print(f"  {label:<16} {elapsed:7.2f} s  peak {peak / 2 ** 20:8.0f} MiB")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Micro-benchmark for normalize_array")
+    parser.add_argument('--size', type=int, default=10000, help="Raster side length in pixels")
+    run_benchmark(parser.parse_args().size)
@@ -0,0 +1,172 @@
+import numpy as np
+
+# Storage orders of the pixel array: channels-last (pixel-interleaved) or planar
+LAYOUTS = ('yxb', 'byx')
+
+# Band names looked up, in order, for the default RGB composite
+RGB_BAND_NAMES = (
+    ('red', 'green', 'blue'),
+    ('B4', 'B3', 'B2'),            # Sentinel-2
+    ('SR_B4', 'SR_B3', 'SR_B2'),   # Landsat 8/9 Collection 2
+)
+
+
+class Raster:
+    """A multi-band image: one pixel array plus its band metadata.
+
+    `data` is a single buffer (a contiguous array or memory map, or a strided
+    view of one after select()). `layout` is 'yxb' (H, W, bands) or 'byx'
+    (bands, H, W), matching how the file stores its samples, so mapped data
+    is never reordered. Band, RGB and channels-last accessors return NumPy
+    views wherever the layout allows; copies are only made for band
+    selections a slice cannot express.
+    `scale`/`offset` convert stored values to physical units per band.
+    """
+
+    __slots__ = ('data', 'layout', 'band_names', 'nodata', 'scale', 'offset', 'georeference')
+
+    def __init__(self, data, layout='yxb', band_names=None, nodata=None, scale=None, offset=None,
+                 georeference=None):
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown raster layout: {layout}")
+        if data.ndim == 2:
+            # One band, added as a view
+            data = data[:, :, np.newaxis] if layout == 'yxb' else data[np.newaxis]
+        elif data.ndim != 3:
+            raise ValueError(f"Expected a 2-D or 3-D array, got shape {data.shape}")
+        self.data = data
+        self.layout = layout
+        bands = data.shape[2] if layout == 'yxb' else data.shape[0]
+        self.band_names = tuple(band_names) if band_names is not None else \
+            tuple(f'band_{i + 1}' for i in range(bands))
+        if len(self.band_names) != bands:
+            raise ValueError(f"{len(self.band_names)} band names for {bands} bands")
+        self.nodata = nodata
+        self.scale = None if scale is None else tuple(np.broadcast_to(np.asarray(scale, dtype=float), (bands,)))
+        self.offset = None if offset is None else tuple(np.broadcast_to(np.asarray(offset, dtype=float), (bands,)))
+        self.georeference = georeference
+
+    def __repr__(self):
+        return (f"Raster({self.height}x{self.width}, bands={list(self.band_names)}, "
+                f"dtype={self.dtype}, layout='{self.layout}')")
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def bands(self):
+        return len(self.band_names)
+
+    @property
+    def height(self):
+        return self.data.shape[0] if self.layout == 'yxb' else self.data.shape[1]
+
+    @property
+    def width(self):
+        return self.data.shape[1] if self.layout == 'yxb' else self.data.shape[2]
+
+    @property
+    def shape(self):
+        """(height, width, bands) regardless of layout"""
+        return self.height, self.width, self.bands
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def band_index(self, band):
+        """Returns the index of a band given by index or name"""
+        if isinstance(band, str):
+            try:
+                return self.band_names.index(band)
+            except ValueError:
+                raise KeyError(f"No band named {band!r}; bands are {list(self.band_names)}") from None
+        if not -self.bands <= band < self.bands:
+            raise IndexError(f"Band {band} out of range for {self.bands} bands")
+        return band % self.bands
+
+    def band(self, band):
+        """Returns one band as a 2-D view"""
+        index = self.band_index(band)
+        return self.data[:, :, index] if self.layout == 'yxb' else self.data[index]
+
+    def _band_slice(self, indices):
+        """Returns a slice selecting `indices`, or None when they are not evenly spaced"""
+        if len(indices) == 1:
+            return slice(indices[0], indices[0] + 1)
+        step = indices[1] - indices[0]
+        if step == 0 or any(b - a != step for a, b in zip(indices, indices[1:])):
+            return None
+        stop = indices[-1] + step
+        return slice(indices[0], stop if stop >= 0 else None, step)
+
+    def channels_last(self, bands=None):
+        """Returns the selected bands (default: all) as an (H, W, bands) array.
+
+        This is a view unless the selection is not evenly spaced; planar
+        rasters give a strided view whose band planes stay contiguous.
+        """
+        if bands is None:
+            data = self.data
+        else:
+            indices = [self.band_index(band) for band in bands]
+            selection = self._band_slice(indices)
+            if selection is None:
+                selection = indices
+            data = self.data[:, :, selection] if self.layout == 'yxb' else self.data[selection]
+        return data if self.layout == 'yxb' else np.moveaxis(data, 0, 2)
+
+    def rgb_bands(self):
+        """Returns the indices of the bands of the default RGB composite"""
+        names = [name.lower() for name in self.band_names]
+        for candidate in RGB_BAND_NAMES:
+            wanted = [name.lower() for name in candidate]
+            if all(name in names for name in wanted):
+                return [names.index(name) for name in wanted]
+        if self.bands >= 3:
+            return [0, 1, 2]
+        return [0, 0, 0]
+
+    def rgb(self, bands=None):
+        """Returns an (H, W, 3) composite of three bands (default: rgb_bands()).
+
+        A single-band raster is broadcast to three channels as a read-only view.
+        """
+        indices = [self.band_index(band) for band in (bands if bands is not None else self.rgb_bands())]
+        if len(set(indices)) == 1:
+            plane = self.band(indices[0])
+            return np.broadcast_to(plane[:, :, np.newaxis], plane.shape + (3,))
+        return self.channels_last(indices)
+
+    def select(self, bands):
+        """Returns a Raster of a subset of bands sharing this one's pixels where possible"""
+        indices = [self.band_index(band) for band in bands]
+        data = self.channels_last(indices)
+        if self.layout == 'byx':
+            data = np.moveaxis(data, 2, 0)
+        return Raster(data, self.layout, [self.band_names[i] for i in indices], self.nodata,
+                      None if self.scale is None else [self.scale[i] for i in indices],
+                      None if self.offset is None else [self.offset[i] for i in indices],
+                      self.georeference)
+
+    def replace(self, data, layout=None, nodata=None, scale=None, offset=None):
+        """Returns a Raster of new pixels (e.g. a normalized copy) with this one's bands and georeference"""
+        return Raster(data, layout or self.layout, self.band_names, nodata, scale, offset, self.georeference)
+
+    def physical(self, band):
+        """Returns one band in physical units (float32), applying scale/offset"""
+        index = self.band_index(band)
+        values = self.band(index).astype(np.float32)
+        if self.scale is not None:
+            values *= self.scale[index]
+        if self.offset is not None:
+            values += self.offset[index]
+        return values
+
+
+def as_channels_last(image):
+    """Returns the (H, W, C) or (H, W) array of a Raster or array, without copying"""
+    if isinstance(image, Raster):
+        return image.channels_last()
+    return image
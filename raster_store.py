@@ -0,0 +1,154 @@
+import os
+import json
+import numpy as np
+import tifffile
+
+from coregistration import read_georeference
+
+# Each raster's description lives next to it in `<raster>.tif.json`
+INDEX_SUFFIX = '.json'
+
+# Rows copied per block when rewriting a compressed download
+BLOCK_ROWS = 1024
+
+# GeoTIFF tags carried over when a raster is rewritten or rendered
+GEOTIFF_TAGS = (33550, 33922, 34264, 34735, 34736, 34737)
+
+
+def index_path(path):
+    """Returns the sidecar index path of a raster"""
+    return path + INDEX_SUFFIX
+
+
+def geotiff_extratags(page):
+    """Returns the georeference tags of a TIFF page in tifffile's extratags format"""
+    extratags = []
+    for code in GEOTIFF_TAGS:
+        tag = page.tags.get(code)
+        if tag is not None:
+            extratags.append((code, tag.dtype, tag.count, tag.value, True))
+    return extratags
+
+
+def geographic_extratags(west, north, step_x, step_y):
+    """Returns EPSG:4326 ModelPixelScale/ModelTiepoint/GeoKeyDirectory tags for a north-up grid"""
+    geokeys = (1, 1, 0, 3, 1024, 0, 1, 2, 1025, 0, 1, 1, 2048, 0, 1, 4326)
+    return [
+        (33550, 'd', 3, (step_x, step_y, 0.0), True),
+        (33922, 'd', 6, (0.0, 0.0, 0.0, west, north, 0.0), True),
+        (34735, 'H', len(geokeys), geokeys, True),
+    ]
+
+
+def raster_files(kind, path):
+    """Returns {kind: raster, kind_index: sidecar}, e.g. for TileCache.put"""
+    return {kind: path, f'{kind}_index': index_path(path)}
+
+
+def _write_index(path, array, band_names, scale, offset, nodata):
+    bands = 1 if array.ndim == 2 else array.shape[2]
+    index = {
+        'shape': list(array.shape),
+        'dtype': array.dtype.name,
+        # Pixel-interleaved, so a row window is one contiguous byte range
+        'layout': 'yx' if array.ndim == 2 else 'yxb',
+        'bands': list(band_names) if band_names is not None else [f'band_{i + 1}' for i in range(bands)],
+        'scale': np.broadcast_to(np.asarray(1.0 if scale is None else scale, dtype=float), (bands,)).tolist(),
+        'offset': np.broadcast_to(np.asarray(0.0 if offset is None else offset, dtype=float), (bands,)).tolist(),
+        'nodata': nodata,
+        'georeference': read_georeference(path),
+    }
+    tmp_path = index_path(path) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, index_path(path))
+    return index
+
+
+def create_raster(path, shape, dtype, extratags=()):
+    """Creates an uncompressed, contiguous GeoTIFF and returns it as a writable memory map.
+
+    `extratags` are written as-is (e.g. the GeoTIFF tags of a download), so
+    GIS tools still read the file, while NumPy can map its pixels directly.
+    """
+    dtype = np.dtype(dtype)
+    photometric = 'rgb' if len(shape) == 3 and shape[2] == 3 and dtype == np.uint8 else 'minisblack'
+    return tifffile.memmap(path, shape=shape, dtype=dtype, photometric=photometric,
+                           planarconfig='contig' if len(shape) == 3 else None,
+                           extratags=list(extratags), metadata=None)
+
+
+def finish_raster(path, array, band_names=None, scale=None, offset=None, nodata=None):
+    """Flushes a raster created by create_raster() and writes its sidecar index"""
+    array.flush()
+    return _write_index(path, array, band_names, scale, offset, nodata)
+
+
+def ingest_geotiff(path, band_names=None, scale=None, offset=None, nodata=None):
+    """Rewrites a (compressed) GeoTIFF in place as a memory-mappable one.
+
+    The download is decoded exactly once; every later reader maps the file
+    instead. Georeference tags are kept. Returns the read-only memory map.
+    """
+    with tifffile.TiffFile(path) as tif:
+        page = tif.pages[0]
+        extratags = geotiff_extratags(page)
+        if nodata is None and page.tags.get(42113) is not None:
+            nodata = page.nodata
+    try:
+        # Already mappable, only the index is missing
+        array = tifffile.memmap(path, mode='r')
+    except ValueError:
+        array = None
+
+    if array is None:
+        data = tifffile.imread(path)
+        tmp_path = path + '.tmp.tif'
+        out = create_raster(tmp_path, data.shape, data.dtype, extratags)
+        for start in range(0, data.shape[0], BLOCK_ROWS):
+            out[start:start + BLOCK_ROWS] = data[start:start + BLOCK_ROWS]
+        out.flush()
+        del out, data
+        os.replace(tmp_path, path)
+        array = tifffile.memmap(path, mode='r')
+    _write_index(path, array, band_names, scale, offset, nodata)
+    return array
+
+
+def read_index(path):
+    """Returns the sidecar index of a raster, or None when it has none"""
+    try:
+        with open(index_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def open_raster(path):
+    """Returns a raster as a read-only (H, W[, bands]) memory map.
+
+    Slicing it reads only the requested window; nothing is decoded.
+    """
+    return tifffile.memmap(path, mode='r')
+
+
+def read_window(path, rows, cols, bands=None):
+    """Returns a copy of raster[rows, cols, bands] read straight from the file"""
+    array = open_raster(path)
+    if bands is None or array.ndim == 2:
+        return np.array(array[rows, cols])
+    return np.array(array[rows, cols, bands])
+
+
+def reflectance(path, rows=slice(None), cols=slice(None)):
+    """Returns a window in physical units, applying the indexed scale/offset"""
+    index = read_index(path) or {}
+    window = open_raster(path)[rows, cols].astype(np.float32)
+    scale = np.asarray(index.get('scale', [1.0]), dtype=np.float32)
+    offset = np.asarray(index.get('offset', [0.0]), dtype=np.float32)
+    if window.ndim == 2:
+        scale, offset = scale[0], offset[0]
+    window *= scale
+    window += offset
+    return window
+
@@ -0,0 +1,156 @@
+import time
+import threading
+from collections import OrderedDict, deque
+
+# Seconds without a new request before the latest one is fetched
+DEFAULT_DEBOUNCE = 0.75
+
+# Finished fetches kept in memory; older ones are usually still in the tile cache
+DEFAULT_MAX_ENTRIES = 32
+
+
+class _Entry:
+    """State of one fetch: 'queued', 'running', 'done' or 'failed'"""
+
+    __slots__ = ('status', 'value', 'error', 'elapsed')
+
+    def __init__(self):
+        self.status = 'queued'
+        self.value = None
+        self.error = None
+        self.elapsed = None
+
+
+class Prefetcher:
+    """Fetches speculatively in a background thread, keeping only the latest request.
+
+    request() is cheap and may be called on every Streamlit rerun: the
+    worker waits until no new request has arrived for `debounce` seconds
+    and then runs `fetch(*args)` for the most recent one, so stepping
+    through coordinates does not start a download per step. get() returns
+    the result, queueing the fetch ahead of speculative ones (without
+    debounce) if it has not run yet, or waiting for a fetch in flight.
+    Results are kept per key in a small LRU; one Prefetcher is meant to be
+    shared by all sessions. A failed fetch stays failed, so reruns do not
+    hammer the source, until another key is requested or get() is called
+    with `retry`.
+    """
+
+    def __init__(self, fetch, debounce=DEFAULT_DEBOUNCE, max_entries=DEFAULT_MAX_ENTRIES):
+        self.fetch = fetch
+        self.debounce = debounce
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # Speculative request: (key, args, entry, time) of the latest one only
+        self._latest = None
+        # Key of the most recent request(), whether or not it is still pending
+        self._requested = None
+        # Requests someone is waiting for, served first and in order
+        self._urgent = deque()
+        self._condition = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name='prefetch', daemon=True)
+        self._worker.start()
+
+    def _entry(self, key, retry=False):
+        """Returns the entry of a key, creating a queued one (caller holds the lock).
+
+        A failed entry is only replaced with `retry`.
+        """
+        entry = self._entries.get(key)
+        if entry is None or (retry and entry.status == 'failed'):
+            entry = _Entry()
+        self._store(key, entry)
+        return entry
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        # Only finished entries are evicted; pending ones are still referenced by the queues
+        for old_key in [k for k, e in self._entries.items() if e.status in ('done', 'failed')]:
+            if len(self._entries) <= self.max_entries:
+                break
+            del self._entries[old_key]
+
+    def request(self, key, *args):
+        """Asks for a speculative fetch of `key`; supersedes older speculative requests.
+
+        Repeating the current key (e.g. on every rerun) neither restarts the
+        debounce timer nor retries a failed fetch.
+        """
+        with self._condition:
+            if key != self._requested:
+                # The superseded key is dropped if still pending (a waiting get() still
+                # holds its entry) or failed, so coming back to it fetches again
+                previous = self._entries.get(self._requested)
+                if previous is not None and previous.status in ('queued', 'failed'):
+                    del self._entries[self._requested]
+                self._requested = key
+            entry = self._entry(key)
+            if entry.status == 'queued' and (self._latest is None or self._latest[0] != key):
+                self._latest = (key, args, entry, time.monotonic())
+                self._condition.notify_all()
+            return entry.status
+
+    def status(self, key):
+        """Returns 'queued', 'running', 'done', 'failed' or None when never requested"""
+        with self._condition:
+            entry = self._entries.get(key)
+            return entry.status if entry is not None else None
+
+    def get(self, key, *args, timeout=None, retry=False):
+        """Returns the fetched value of `key`, fetching or waiting for it as needed.
+
+        Raises the fetch's exception if it failed (fetching again first with
+        `retry`), or TimeoutError.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            entry = self._entry(key, retry)
+            if entry.status == 'queued':
+                self._urgent.append((key, args, entry))
+                self._condition.notify_all()
+            while entry.status in ('queued', 'running'):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"Fetching {key} did not finish within {timeout}s")
+                self._condition.wait(remaining)
+            if entry.status == 'failed':
+                raise entry.error
+            return entry.value
+
+    def _next(self):
+        """Blocks until a request is due and returns it (caller holds the lock)"""
+        while True:
+            if self._urgent:
+                return self._urgent.popleft()
+            if self._latest is not None:
+                key, args, entry, requested = self._latest
+                wait = requested + self.debounce - time.monotonic()
+                if wait <= 0:
+                    self._latest = None
+                    return key, args, entry
+                self._condition.wait(wait)
+            else:
+                self._condition.wait()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                key, args, entry = self._next()
+                if entry.status != 'queued':
+                    # Already fetched for an earlier request
+                    continue
+                entry.status = 'running'
+
+            start = time.monotonic()
+            try:
+                value, error = self.fetch(*args), None
+            except Exception as e:
+                value, error = None, e
+            with self._condition:
+                entry.value = value
+                entry.error = error
+                entry.status = 'failed' if error is not None else 'done'
+                entry.elapsed = time.monotonic() - start
+                self._store(key, entry)
+                self._condition.notify_all()
@@ -0,0 +1,170 @@
+import os
+import math
+import shutil
+import tempfile
+from collections import namedtuple
+import numpy as np
+import tifffile
+
+from data_transfer import EARTH_ENGINE, EXPORT_SCALE, get_vis_params
+from fetch_scheduler import FetchTask, run_tasks
+from raster_store import create_raster, finish_raster, geographic_extratags
+from instrumentation import file_size, stage
+
+METERS_PER_DEGREE = 111320.0
+
+# Tile side in pixels; 1024 x 1024 x 3 float32 bands is 12 MiB, well under
+# Earth Engine's per-request download limits
+DEFAULT_TILE_PIXELS = 1024
+
+# Rows filled per block when initialising the mosaic
+BLOCK_ROWS = 1024
+
+# One request-sized piece of the output grid; y0/x0 are its offsets in the mosaic
+RegionTile = namedtuple('RegionTile', ['row', 'col', 'y0', 'x0', 'height', 'width', 'transform'])
+
+
+def ring_bounds(ring):
+    """Returns (west, south, east, north) of a [[lon, lat], ...] ring"""
+    lons = [point[0] for point in ring]
+    lats = [point[1] for point in ring]
+    return min(lons), min(lats), max(lons), max(lats)
+
+
+def _point_in_ring(x, y, ring):
+    """Even-odd rule point-in-polygon test"""
+    inside = False
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+
+def _segments_cross(a, b, c, d):
+    def orient(p, q, r):
+        return (q[0] - p[0]) * (r[1] - p[1]) - (q[1] - p[1]) * (r[0] - p[0])
+    return orient(a, b, c) * orient(a, b, d) < 0 and orient(c, d, a) * orient(c, d, b) < 0
+
+
+def box_intersects_ring(west, south, east, north, ring):
+    """Returns whether an axis-aligned box overlaps a polygon ring"""
+    corners = [(west, south), (east, south), (east, north), (west, north)]
+    if any(_point_in_ring(x, y, ring) for x, y in corners):
+        return True
+    if any(west <= x <= east and south <= y <= north for x, y in ring):
+        return True
+    edges = list(zip(corners, corners[1:] + corners[:1]))
+    return any(_segments_cross(a, b, c, d) for a, b in edges for c, d in zip(ring, ring[1:] + ring[:1]))
+
+
+def plan_tiles(bounds, scale=EXPORT_SCALE, tile_pixels=DEFAULT_TILE_PIXELS, ring=None):
+    """Splits a lon/lat box into request-sized tiles of one EPSG:4326 pixel grid.
+
+    Pixels are `scale` metres high and, at the box's mid-latitude, `scale`
+    metres wide. Every tile shares the grid, so tiles stitch without
+    resampling. With a polygon `ring`, tiles that do not touch it are
+    dropped. Returns (mosaic (height, width), grid transform, tiles).
+    """
+    west, south, east, north = bounds
+    step_y = scale / METERS_PER_DEGREE
+    step_x = step_y / max(math.cos(math.radians((south + north) / 2)), 1e-6)
+    height = max(1, math.ceil((north - south) / step_y))
+    width = max(1, math.ceil((east - west) / step_x))
+
+    tiles = []
+    for row, y0 in enumerate(range(0, height, tile_pixels)):
+        for col, x0 in enumerate(range(0, width, tile_pixels)):
+            tile_height = min(tile_pixels, height - y0)
+            tile_width = min(tile_pixels, width - x0)
+            tile_west = west + x0 * step_x
+            tile_north = north - y0 * step_y
+            if ring is not None and not box_intersects_ring(tile_west, tile_north - tile_height * step_y,
+                                                            tile_west + tile_width * step_x, tile_north, ring):
+                continue
+            transform = (step_x, 0.0, tile_west, 0.0, -step_y, tile_north)
+            tiles.append(RegionTile(row, col, y0, x0, tile_height, tile_width, transform))
+    return (height, width), (step_x, 0.0, west, 0.0, -step_y, north), tiles
+
+
+def _download_tile(backend, image, name, region, tile, directory, vis_params):
+    path = os.path.join(directory, f'tile_{tile.row}_{tile.col}.tif')
+    grid = {'crs': 'EPSG:4326', 'crs_transform': tile.transform, 'dimensions': (tile.width, tile.height)}
+    with stage('download_tile', sensor=name) as info:
+        backend.download(image, name, region, path, vis_params=vis_params, grid=grid)
+        info['bytes'] = file_size(path)
+    return path
+
+
+def export_region(image, name, path, bounds=None, ring=None, region=None, backend=EARTH_ENGINE,
+                  scale=EXPORT_SCALE, tile_pixels=DEFAULT_TILE_PIXELS, bands=3, rgb=False,
+                  max_workers=4, timeout=300, retries=2, on_progress=None):
+    """Exports an image over a large box or polygon as one memory-mappable GeoTIFF mosaic.
+
+    The area is split with plan_tiles() and the tiles are downloaded in
+    parallel with retries (fetch_scheduler.run_tasks). Each finished tile is
+    copied into its window of the memory-mapped mosaic and deleted right
+    away, so only tiles in flight are ever held on disk and one in memory.
+    Pixels of failed or skipped tiles stay NaN (0 for `rgb` mosaics).
+    Returns (path, results) with the FetchResult of every tile.
+    """
+    if bounds is None:
+        bounds = ring_bounds(ring)
+    shape, transform, tiles = plan_tiles(bounds, scale, tile_pixels, ring)
+    vis_params = get_vis_params(name) if rgb else None
+    dtype = np.uint8 if rgb else np.float32
+    step_x, _, west, _, step_y, north = transform
+
+    mosaic = create_raster(path, shape + (bands,), dtype, geographic_extratags(west, north, step_x, -step_y))
+    fill = 0 if rgb else np.nan
+    for start in range(0, shape[0], BLOCK_ROWS):
+        mosaic[start:start + BLOCK_ROWS] = fill
+
+    tile_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(path)))
+    tasks = [FetchTask(f'{name}/{tile.row}_{tile.col}', name, _download_tile,
+                       (backend, image, name, region, tile, tile_dir, vis_params)) for tile in tiles]
+    by_key = {task.key: tile for task, tile in zip(tasks, tiles)}
+
+    def stitch(result, done, total):
+        # Called from this thread as each tile finishes, so the mosaic needs no lock
+        if result.error is None:
+            tile = by_key[result.key]
+            with stage('stitch_tile', file_size(result.value), sensor=name):
+                data = tifffile.imread(result.value)
+                if data.ndim == 2:
+                    data = data[:, :, np.newaxis]
+                rows, cols = min(data.shape[0], tile.height), min(data.shape[1], tile.width)
+                mosaic[tile.y0:tile.y0 + rows, tile.x0:tile.x0 + cols] = data[:rows, :cols, :bands]
+            os.remove(result.value)
+        if on_progress is not None:
+            on_progress(result, done, total)
+
+    try:
+        results = run_tasks(tasks, max_workers=max_workers, timeout=timeout, retries=retries,
+                            on_progress=stitch)
+    finally:
+        shutil.rmtree(tile_dir, ignore_errors=True)
+    band_names = ('red', 'green', 'blue') if rgb else get_vis_params(name)['bands']
+    finish_raster(path, mosaic, band_names=band_names)
+    return path, results
+
+
+def fetch_region(name, start_date, end_date, output_dir, bounds=None, ring=None, backend=EARTH_ENGINE,
+                 composite='mosaic', **kwargs):
+    """Selects one sensor's composite over a box or polygon and exports it tiled.
+
+    'mosaic' is the default composite because a single least cloudy scene
+    rarely covers a city-scale area, and scenes are filtered by the whole
+    polygon so ones missing the centre still fill the edges. Returns
+    (mosaic path, tile results).
+    """
+    if ring is None:
+        west, south, east, north = bounds
+        ring = [[west, south], [east, south], [east, north], [west, north]]
+    west, south, east, north = ring_bounds(ring)
+    region = backend.polygon(ring)
+    # Scenes touching any part of the area, not just the ones over its centre
+    image = backend.select_image(name, (south + north) / 2, (west + east) / 2, region,
+                                 start_date, end_date, composite, footprint=region)
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f'{name}_{west:.4f}_{south:.4f}_{east:.4f}_{north:.4f}_mosaic.tif')
+    return export_region(image, name, path, ring=ring, region=region, backend=backend, **kwargs)
@@ -0,0 +1,119 @@
+import os
+import sys
+import shutil
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from tile_cache import content_hash
+
+DEFAULT_MEMORY_BYTES = 512 * 1024 ** 2
+
+# Streamlit serves files in this directory at app/static/ when
+# server.enableStaticServing is set (see .streamlit/config.toml)
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+
+def estimate_size(value):
+    """Approximate memory held by a cached value (arrays and buffers dominate)"""
+    if isinstance(value, np.ndarray):
+        # Memory maps and views do not own their pixels
+        return value.nbytes if value.base is None else sys.getsizeof(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class MemoryCache:
+    """Thread-safe in-memory LRU for values recomputed on every Streamlit rerun.
+
+    Entries are keyed by hashable tuples that include the upload's content
+    hash, so a cached value is never served for a different file. The least
+    recently used entries are evicted once their estimated size exceeds
+    `max_bytes`; values larger than the whole budget are returned uncached.
+    Cached arrays are made read-only so callers cannot mutate shared state.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MEMORY_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return value
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted
+        return value
+
+    def get_or_compute(self, key, compute):
+        """Returns the cached value for key, calling compute() on a miss"""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = self.put(key, compute())
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+
+def upload_hash(upload, cache):
+    """Returns the content hash of a Streamlit upload, hashing its bytes once per upload"""
+    file_id = getattr(upload, 'file_id', None)
+    if file_id is None:
+        return content_hash(upload.getbuffer())
+    return cache.get_or_compute(('upload_hash', file_id, upload.size),
+                                lambda: content_hash(upload.getbuffer()))
+
+
+def static_asset_url(path, static_dir=STATIC_DIR):
+    """Publishes a file in Streamlit's static directory and returns its URL.
+
+    The browser then downloads and caches the file once, instead of receiving
+    it inline as a base64 data URI with every rerun. The copy is refreshed
+    when the source file is newer.
+    """
+    name = os.path.basename(path)
+    target = os.path.join(static_dir, name)
+    if not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(path):
+        os.makedirs(static_dir, exist_ok=True)
+        tmp_path = target + '.tmp'
+        shutil.copy2(path, tmp_path)
+        os.replace(tmp_path, target)
+    return f"app/static/{name}"
@@ -0,0 +1,219 @@
+import os
+import math
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from raster import Raster, as_channels_last
+
+# SSIM parameters from Wang et al. (2004): 11x11 Gaussian window, sigma 1.5
+SSIM_WINDOW = 11
+SSIM_SIGMA = 1.5
+SSIM_K1 = 0.01
+SSIM_K2 = 0.03
+
+# MS-SSIM scale weights from Wang et al. (2003)
+MS_SSIM_WEIGHTS = (0.0448, 0.2856, 0.3001, 0.2363, 0.1333)
+
+# Output pixels per tile side; tiles are evaluated independently in threads
+TILE_SIZE = 1024
+
+# Pixels per row block for the streaming error and spectral-angle sums
+BLOCK_PIXELS = 1 << 20
+
+CHANNEL_NAMES = ('Red', 'Green', 'Blue')
+
+
+def _gaussian_kernel(size=SSIM_WINDOW, sigma=SSIM_SIGMA):
+    x = np.arange(size, dtype=np.float64) - (size - 1) / 2
+    kernel = np.exp(-x ** 2 / (2 * sigma ** 2))
+    return (kernel / kernel.sum()).astype(np.float32)
+
+
+GAUSSIAN = _gaussian_kernel()
+
+
+def _filter_valid(x, kernel=GAUSSIAN):
+    """Separable 'valid' convolution as two window-by-kernel matrix products"""
+    size = len(kernel)
+    tmp = sliding_window_view(x, size, axis=0) @ kernel
+    return sliding_window_view(tmp, size, axis=1) @ kernel
+
+
+def ssim_terms(x, y, data_range):
+    """Returns the per-pixel SSIM and contrast-structure maps of two 2-D tiles"""
+    c1 = (SSIM_K1 * data_range) ** 2
+    c2 = (SSIM_K2 * data_range) ** 2
+    x = x.astype(np.float32, copy=False)
+    y = y.astype(np.float32, copy=False)
+
+    mu_x = _filter_valid(x)
+    mu_y = _filter_valid(y)
+    sigma_xx = _filter_valid(x * x) - mu_x * mu_x
+    sigma_yy = _filter_valid(y * y) - mu_y * mu_y
+    sigma_xy = _filter_valid(x * y) - mu_x * mu_y
+
+    cs = (2 * sigma_xy + c2) / (sigma_xx + sigma_yy + c2)
+    luminance = (2 * mu_x * mu_y + c1) / (mu_x * mu_x + mu_y * mu_y + c1)
+    return luminance * cs, cs
+
+
+def _tiles(height, width, tile, halo):
+    """Yields (row, col) slices of input tiles whose valid outputs cover the image once"""
+    out_h, out_w = height - halo, width - halo
+    for r in range(0, max(out_h, 0), tile):
+        for c in range(0, max(out_w, 0), tile):
+            yield slice(r, min(r + tile, out_h) + halo), slice(c, min(c + tile, out_w) + halo)
+
+
+def _mean_ssim(x, y, data_range, tile, executor, mask=None):
+    """Tile-wise mean SSIM and mean contrast-structure of two 2-D arrays.
+
+    With a boolean `mask`, only windows centred on valid pixels are averaged.
+    """
+    halo = SSIM_WINDOW - 1
+    margin = halo // 2
+
+    def evaluate(rows, cols):
+        ssim_map, cs_map = ssim_terms(x[rows, cols], y[rows, cols], data_range)
+        if mask is None:
+            return ssim_map.sum(dtype=np.float64), cs_map.sum(dtype=np.float64), ssim_map.size
+        # Window centres of this tile's valid outputs
+        valid = mask[rows.start + margin:rows.stop - margin, cols.start + margin:cols.stop - margin]
+        return (ssim_map.sum(dtype=np.float64, where=valid), cs_map.sum(dtype=np.float64, where=valid),
+                np.count_nonzero(valid))
+
+    totals = np.zeros(3)
+    for result in executor.map(lambda t: evaluate(*t), _tiles(x.shape[0], x.shape[1], tile, halo)):
+        totals += result
+    if totals[2] == 0:
+        return float('nan'), float('nan')
+    return float(totals[0] / totals[2]), float(totals[1] / totals[2])
+
+
+def _downsample2(x):
+    """2x2 average pooling (drops an odd last row/column)"""
+    h, w = x.shape[0] // 2 * 2, x.shape[1] // 2 * 2
+    x = x[:h, :w].astype(np.float32, copy=False)
+    return (x[0::2, 0::2] + x[1::2, 0::2] + x[0::2, 1::2] + x[1::2, 1::2]) * 0.25
+
+
+def _downsample_mask(mask):
+    """2x2 pooling of a boolean mask; a pooled pixel is valid only if all four were"""
+    h, w = mask.shape[0] // 2 * 2, mask.shape[1] // 2 * 2
+    mask = mask[:h, :w]
+    return mask[0::2, 0::2] & mask[1::2, 0::2] & mask[0::2, 1::2] & mask[1::2, 1::2]
+
+
+def _ms_ssim(x, y, data_range, tile, executor, first_scale=None, mask=None):
+    """Multi-scale SSIM using as many of the five scales as the image size allows.
+
+    `first_scale` may hold the (ssim, cs) already computed at full resolution.
+    """
+    levels = len(MS_SSIM_WEIGHTS)
+    while levels > 1 and min(x.shape) / 2 ** (levels - 1) < SSIM_WINDOW:
+        levels -= 1
+    if min(x.shape) < SSIM_WINDOW:
+        return float('nan')
+    weights = np.array(MS_SSIM_WEIGHTS[:levels])
+    weights /= weights.sum()
+
+    values = []
+    for level in range(levels):
+        if level == 0 and first_scale is not None:
+            ssim, cs = first_scale
+        else:
+            ssim, cs = _mean_ssim(x, y, data_range, tile, executor, mask)
+        values.append(ssim if level == levels - 1 else cs)
+        if level < levels - 1:
+            x, y = _downsample2(x), _downsample2(y)
+            mask = None if mask is None else _downsample_mask(mask)
+    # Negative contrast-structure terms are clamped so the product stays real
+    values = np.maximum(np.array(values), 0.0)
+    return float(np.prod(values ** weights))
+
+
+def _block_rows(width, bands=1):
+    return max(1, BLOCK_PIXELS // (width * bands))
+
+
+def _squared_error(x, y, mask=None):
+    """Sum of squared differences (over `mask` pixels only), accumulated over row blocks"""
+    total = 0.0
+    rows = _block_rows(x.shape[1])
+    for r in range(0, x.shape[0], rows):
+        diff = np.subtract(x[r:r + rows], y[r:r + rows], dtype=np.float64)
+        if mask is None:
+            total += float(np.einsum('ij,ij->', diff, diff))
+        else:
+            np.square(diff, out=diff)
+            total += float(diff.sum(where=mask[r:r + rows]))
+    return total
+
+
+def spectral_angle(reference, test, mask=None):
+    """Mean spectral angle in degrees between per-pixel band vectors (of `mask` pixels)"""
+    angle_sum = 0.0
+    count = 0
+    rows = _block_rows(reference.shape[1], reference.shape[2])
+    for r in range(0, reference.shape[0], rows):
+        a = reference[r:r + rows].astype(np.float64)
+        b = test[r:r + rows].astype(np.float64)
+        dot = np.einsum('ijk,ijk->ij', a, b)
+        norms = np.sqrt(np.einsum('ijk,ijk->ij', a, a) * np.einsum('ijk,ijk->ij', b, b))
+        valid = norms > 0
+        if mask is not None:
+            valid &= mask[r:r + rows]
+        angles = np.arccos(np.clip(dot[valid] / norms[valid], -1.0, 1.0))
+        angle_sum += float(angles.sum())
+        count += int(valid.sum())
+    return math.degrees(angle_sum / count) if count else float('nan')
+
+
+def compute_metrics(reference, test, data_range=None, tile=TILE_SIZE, workers=None, ms_ssim=True, mask=None):
+    """Computes per-channel PSNR, SSIM, MS-SSIM and RMSE plus the spectral angle.
+
+    `reference` and `test` are arrays of the same (H, W) or (H, W, C) shape,
+    or Rasters of any layout (bands are then named after the reference's).
+    Band views are scored in place, never copied whole. Work is split into
+    tiles evaluated on a thread pool (NumPy releases the GIL), so memory
+    stays bounded by a few float32 tiles per worker. An (H, W) boolean
+    `mask` (e.g. from cloud_mask) restricts every metric to its True pixels
+    without copying the images.
+    Returns {'channels': [{'name', 'psnr', 'ssim', 'ms_ssim', 'rmse'}, ...], 'sam': degrees,
+    'valid_pixels': pixels scored}.
+    """
+    names = reference.band_names if isinstance(reference, Raster) else CHANNEL_NAMES
+    reference = as_channels_last(reference)
+    test = as_channels_last(test)
+    if reference.shape != test.shape:
+        raise ValueError(f"Shape mismatch: reference {reference.shape} vs test {test.shape}")
+    if mask is not None and mask.shape != reference.shape[:2]:
+        raise ValueError(f"Mask shape {mask.shape} does not match the images {reference.shape[:2]}")
+    pixels = reference.shape[0] * reference.shape[1] if mask is None else np.count_nonzero(mask)
+    if reference.ndim == 2:
+        reference = reference[:, :, np.newaxis]
+        test = test[:, :, np.newaxis]
+    if data_range is None:
+        if reference.dtype == np.uint8:
+            data_range = 255.0
+        else:
+            data_range = float(max(reference.max(), test.max()) - min(reference.min(), test.min())) or 1.0
+
+    channels = []
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for band in range(reference.shape[2]):
+            x = reference[:, :, band]
+            y = test[:, :, band]
+            mse = _squared_error(x, y, mask) / pixels if pixels else float('nan')
+            ssim, cs = _mean_ssim(x, y, data_range, tile, executor, mask)
+            channels.append({
+                'name': names[band] if band < len(names) else f'Band {band + 1}',
+                'psnr': float('inf') if mse == 0 else 10 * math.log10(data_range ** 2 / mse),
+                'ssim': ssim,
+                'ms_ssim': _ms_ssim(x, y, data_range, tile, executor, (ssim, cs), mask) if ms_ssim else float('nan'),
+                'rmse': math.sqrt(mse),
+            })
+
+    sam = spectral_angle(reference, test, mask) if reference.shape[2] > 1 else float('nan')
+    return {'channels': channels, 'sam': sam, 'valid_pixels': int(pixels)}
@@ -0,0 +1,375 @@
+import os
+import json
+import math
+import time
+import uuid
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+
+from batch_compare import PREVIEW_SIZE, load_rgb
+from cloud_mask import open_mask
+from coregistration import align_to_reference
+from data_transfer import COLLECTION_IDS, fetch_reference, non_interactive
+from histograms import compute_histograms
+from sr_metrics import compute_metrics
+from tile_cache import TileCache
+from worker_pool import process_pool
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Decoded references (and masks) kept per worker process
+REFERENCE_CACHE_SIZE = 8
+
+# Jobs waiting or running before new submissions are refused with 503
+MAX_PENDING = 10000
+
+# Finished jobs kept for polling; the oldest are forgotten first
+JOB_HISTORY = 10000
+
+# Bins of the histograms returned with a score
+HISTOGRAM_BINS = 64
+
+# Longest a request may block with ?wait=
+MAX_WAIT = 300
+
+OPERATIONS = ('reference', 'score')
+
+
+class QueueFull(Exception):
+    """Raised when MAX_PENDING jobs are already waiting"""
+
+
+@lru_cache(maxsize=REFERENCE_CACHE_SIZE)
+def _load_reference(path, mtime, mask_path=None, mask_mtime=None):
+    """Decodes a reference and its mask once per worker; mtimes key out stale entries"""
+    reference, _, geo = load_rgb(path)
+    mask = np.array(open_mask(mask_path)) if mask_path else None
+    return reference, geo, mask
+
+
+def _json_safe(value):
+    """Returns `value` with NumPy scalars/arrays converted and NaN/inf floats as None"""
+    if isinstance(value, dict):
+        return {key: _json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return _json_safe(value.tolist())
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def score_image(image, reference, mask=None, preview_size=PREVIEW_SIZE, histograms=False):
+    """Aligns and scores one SR image file against a reference file.
+
+    Runs in a warm worker: the reference (and its cloud `mask`) is decoded
+    once per process and reused by every later job. Returns a JSON-ready
+    dict with the metrics, the alignment, timings and, with `histograms`,
+    HISTOGRAM_BINS-bin histograms and stats of both images.
+    """
+    started = time.perf_counter()
+    reference_array, reference_geo, mask_array = _load_reference(
+        reference, os.path.getmtime(reference), mask, os.path.getmtime(mask) if mask else None)
+    arr, (height, width), geo = load_rgb(image, preview_size)
+    decoded = time.perf_counter()
+    aligned, transform = align_to_reference(reference_array, arr, reference_geo, geo)
+    aligned_at = time.perf_counter()
+    # Parallelism comes from the pool, one image per worker
+    result = {
+        'image': image,
+        'reference': reference,
+        'width': width,
+        'height': height,
+        'metrics': compute_metrics(reference_array, aligned, workers=1, mask=mask_array),
+        'alignment': {'method': transform['method'], 'shift': list(transform['shift'])},
+    }
+    if histograms:
+        pair = compute_histograms(aligned, reference_array, mask=mask_array)
+        result['histograms'] = {
+            'bins': HISTOGRAM_BINS,
+            'sr': pair.coarse(HISTOGRAM_BINS),
+            'reference': pair.coarse(HISTOGRAM_BINS, reference=True),
+            'sr_stats': pair.stats(),
+            'reference_stats': pair.stats(reference=True),
+        }
+    scored = time.perf_counter()
+    result['timings'] = {'decode_s': round(decoded - started, 4), 'align_s': round(aligned_at - decoded, 4),
+                         'score_s': round(scored - aligned_at, 4), 'total_s': round(scored - started, 4)}
+    return _json_safe(result)
+
+
+def _fetch_reference_job(cache, params):
+    """Runs one reference fetch job; missing credentials fail the job instead of prompting on the server"""
+    with non_interactive():
+        return fetch_reference(cache=cache, **params)
+
+
+def _score_params(params):
+    """Validates the parameters of one score job"""
+    for name in ('image', 'reference'):
+        if not isinstance(params.get(name), str) or not os.path.isfile(params[name]):
+            raise ValueError(f"'{name}' must be the path of an existing file")
+    if params.get('mask') and not os.path.isfile(params['mask']):
+        raise ValueError("'mask' must be the path of an existing file")
+    try:
+        preview_size = int(params.get('preview_size', PREVIEW_SIZE))
+    except (TypeError, ValueError):
+        raise ValueError("'preview_size' must be an integer") from None
+    return {'image': params['image'], 'reference': params['reference'], 'mask': params.get('mask'),
+            'preview_size': preview_size, 'histograms': bool(params.get('histograms', False))}
+
+
+def _reference_params(params):
+    """Validates the parameters of one reference fetch job"""
+    try:
+        lat, lon = float(params['lat']), float(params['lon'])
+        start_date, end_date = str(params['start_date']), str(params['end_date'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("'lat', 'lon', 'start_date' and 'end_date' are required") from None
+    sensor = params.get('sensor', 'SENTINEL_2')
+    if sensor not in COLLECTION_IDS:
+        raise ValueError(f"'sensor' must be one of {', '.join(COLLECTION_IDS)}")
+    return {'lat': lat, 'lon': lon, 'start_date': start_date, 'end_date': end_date, 'sensor': sensor}
+
+
+class JobQueue:
+    """Runs reference fetches and scores on long-lived pools and keeps results for polling.
+
+    Scores run in `workers` processes that stay up between jobs, so imports
+    and decoded references are reused; fetches are I/O bound and run in a
+    few threads sharing one TileCache. Jobs are plain dicts with 'id',
+    'operation', 'status' ('queued', 'running', 'done' or 'failed'),
+    'params', 'result', 'error' and timestamps.
+    """
+
+    def __init__(self, workers=None, fetch_workers=2, max_pending=MAX_PENDING, history=JOB_HISTORY):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.history = history
+        self._scorers = process_pool(self.workers)
+        self._fetchers = ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix='fetch')
+        self._cache = TileCache()
+        self._jobs = OrderedDict()
+        self._futures = {}
+        self._condition = threading.Condition()
+        # Start every worker now rather than on the first request
+        for future in [self._scorers.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    def submit(self, operation, params):
+        """Queues one job; raises ValueError for bad parameters and QueueFull when saturated"""
+        return self.submit_many(operation, [params])[0]
+
+    def submit_many(self, operation, params_list):
+        """Queues several jobs, all or none.
+
+        Every job's parameters are validated and the queue capacity checked
+        before any job is queued, so a bad entry never leaves part of a
+        batch running. Raises ValueError or QueueFull like submit().
+        """
+        if operation == 'score':
+            validate = _score_params
+        elif operation == 'reference':
+            validate = _reference_params
+        else:
+            raise ValueError(f"Unknown operation {operation!r}")
+        params_list = [validate(params) for params in params_list]
+        jobs = []
+        with self._condition:
+            if len(self._futures) + len(params_list) > self.max_pending:
+                raise QueueFull(f"{len(self._futures)} jobs pending")
+            for params in params_list:
+                job = {'id': uuid.uuid4().hex, 'operation': operation, 'status': 'queued', 'params': params,
+                       'result': None, 'error': None, 'submitted': time.time(), 'finished': None}
+                if operation == 'score':
+                    future = self._scorers.submit(score_image, **params)
+                else:
+                    future = self._fetchers.submit(_fetch_reference_job, self._cache, params)
+                self._jobs[job['id']] = job
+                self._futures[job['id']] = future
+                jobs.append((job, future))
+        for job, future in jobs:
+            future.add_done_callback(lambda future, job=job: self._finish(job, future))
+        return [self.view(job['id']) for job, _ in jobs]
+
+    def _finish(self, job, future):
+        with self._condition:
+            try:
+                job['result'] = future.result()
+                job['status'] = 'done'
+            except Exception as e:
+                job['error'] = f'{type(e).__name__}: {e}'
+                job['status'] = 'failed'
+            job['finished'] = time.time()
+            self._futures.pop(job['id'], None)
+            # Forget the oldest finished jobs beyond the history limit
+            while len(self._jobs) - len(self._futures) > self.history:
+                oldest = next(key for key in self._jobs if key not in self._futures)
+                del self._jobs[oldest]
+            self._condition.notify_all()
+
+    def view(self, job_id, wait=0.0):
+        """Returns a copy of a job, waiting up to `wait` seconds (None: forever) for it to finish.
+
+        Returns None for unknown (or forgotten) jobs.
+        """
+        deadline = None if wait is None else time.monotonic() + wait
+        with self._condition:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if job['status'] in ('done', 'failed') or (remaining is not None and remaining <= 0):
+                    break
+                self._condition.wait(remaining)
+            job = dict(job)
+            future = self._futures.get(job_id)
+            if future is not None and future.running():
+                job['status'] = 'running'
+            return job
+
+    def stats(self):
+        """Returns the worker count and the number of jobs per status"""
+        with self._condition:
+            counts = {'pending': len(self._futures), 'finished': len(self._jobs) - len(self._futures)}
+        return {'workers': self.workers, **counts}
+
+    def close(self):
+        self._scorers.shutdown(cancel_futures=True)
+        self._fetchers.shutdown(cancel_futures=True)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """JSON API over a JobQueue (self.server.queue).
+
+    GET  /health                  worker and job counts
+    POST /reference               {lat, lon, start_date, end_date[, sensor]} -> job
+    POST /score                   {image | images, reference[, mask, histograms, preview_size]} -> job(s)
+    GET  /jobs/<id>[?wait=SEC]    job status and result
+    POST accepts ?wait=SEC too, returning the finished job instead of 202.
+    """
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _wait(self, query):
+        """Returns the ?wait= seconds, capped at MAX_WAIT; raises ValueError when not a number"""
+        try:
+            wait = float(query.get('wait', ['0'])[0])
+        except ValueError:
+            wait = math.nan
+        if not wait >= 0:
+            raise ValueError("'wait' must be a non-negative number of seconds")
+        return min(wait, MAX_WAIT)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        queue = self.server.queue
+        if url.path == '/health':
+            self._send(200, {'status': 'ok', **queue.stats()})
+        elif url.path.startswith('/jobs/'):
+            try:
+                wait = self._wait(parse_qs(url.query))
+            except ValueError as e:
+                self._send(400, {'error': str(e)})
+                return
+            job = queue.view(url.path[len('/jobs/'):], wait)
+            self._send(404, {'error': 'unknown job'}) if job is None else self._send(200, job)
+        else:
+            self._send(404, {'error': f'unknown path {url.path}'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        operation = url.path.strip('/')
+        if operation not in OPERATIONS:
+            self._send(404, {'error': f'unknown path {url.path}'})
+            return
+        queue = self.server.queue
+        try:
+            params = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            wait = self._wait(parse_qs(url.query))
+            if operation == 'score' and 'images' in params:
+                images = params.pop('images')
+                if not isinstance(images, list) or not images:
+                    raise ValueError("'images' must be a non-empty list of paths")
+                # One job per image, all against the same reference; none is queued if any is invalid
+                jobs = queue.submit_many('score', [{**params, 'image': image} for image in images])
+                self._send(202, {'jobs': [queue.view(job['id'], wait) for job in jobs]})
+                return
+            job = queue.submit(operation, params)
+        except (ValueError, AttributeError) as e:
+            self._send(400, {'error': str(e)})
+            return
+        except QueueFull as e:
+            self._send(503, {'error': str(e)})
+            return
+        job = queue.view(job['id'], wait)
+        self._send(200 if job['status'] in ('done', 'failed') else 202, job)
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None):
+    """Runs the JSON API until interrupted"""
+    queue = JobQueue(workers)
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.queue = queue
+    print(f"SR Hub service on http://{host}:{port} with {queue.workers} worker(s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        queue.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Headless SR Hub: fetch references and score SR images")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', help="Run the local HTTP/JSON API")
+    serve_parser.add_argument('--host', default=DEFAULT_HOST)
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument('--workers', type=int, default=None, help="Scoring processes (default: CPU count)")
+    fetch_parser = commands.add_parser('fetch', help="Fetch a reference chip and print its files")
+    fetch_parser.add_argument('lat', type=float)
+    fetch_parser.add_argument('lon', type=float)
+    fetch_parser.add_argument('start_date')
+    fetch_parser.add_argument('end_date')
+    fetch_parser.add_argument('--sensor', choices=list(COLLECTION_IDS), default='SENTINEL_2')
+    score_parser = commands.add_parser('score', help="Score SR images, printing one JSON line per image")
+    score_parser.add_argument('reference', help="Reference image (e.g. a fetched _rgb.tif)")
+    score_parser.add_argument('images', nargs='+', help="SR images")
+    score_parser.add_argument('--mask', default=None, help="Cloud mask of the reference (_mask.tif)")
+    score_parser.add_argument('--histograms', action='store_true', help="Include histograms in the output")
+    score_parser.add_argument('--workers', type=int, default=None, help="Scoring processes (default: CPU count)")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args.host, args.port, args.workers)
+    elif args.command == 'fetch':
+        print(json.dumps(fetch_reference(args.lat, args.lon, args.start_date, args.end_date, args.sensor,
+                                         cache=TileCache()), indent=1))
+    else:
+        job_queue = JobQueue(min(args.workers or os.cpu_count() or 1, len(args.images)))
+        try:
+            jobs = job_queue.submit_many('score', [{'image': image, 'reference': args.reference, 'mask': args.mask,
+                                                    'histograms': args.histograms} for image in args.images])
+            for job in jobs:
+                print(json.dumps(job_queue.view(job['id'], wait=None)))
+        finally:
+            job_queue.close()
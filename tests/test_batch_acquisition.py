@@ -0,0 +1,41 @@
+import json
+
+from batch_acquisition import METERS_PER_DEGREE, aoi_id, dedupe_aois, run_batch
+from fetch_scheduler import FetchResult
+
+
+def aoi(lat, lon, start='2024-01-01', end='2024-12-31'):
+    return {'lat': lat, 'lon': lon, 'start_date': start, 'end_date': end}
+
+
+def test_dedupe_uses_the_shared_area():
+    buffer = 1000
+    step = buffer / METERS_PER_DEGREE
+    base = aoi(0.0, 0.0)
+    # Offset by 0.9 box widths on one axis: 55% shared, a duplicate
+    near = aoi(0.0, 0.9 * step)
+    # Offset by 0.6 box widths on both axes: 0.7 * 0.7 = 49% shared, kept
+    diagonal = aoi(0.6 * step, 0.6 * step)
+    other_dates = aoi(0.0, 0.0, start='2023-01-01')
+    kept, duplicates = dedupe_aois([base, near, diagonal, other_dates], buffer)
+    assert kept == [base, diagonal, other_dates]
+    assert duplicates == {aoi_id(near): aoi_id(base)}
+
+
+def test_manifest_records_what_covers_each_duplicate(tmp_path):
+    input_path = tmp_path / 'aois.jsonl'
+    step = 1000 / METERS_PER_DEGREE
+    rows = [aoi(10.0, 20.0), aoi(10.0, 20.0 + 0.1 * step)]
+    input_path.write_text(''.join(json.dumps(row) + '\n' for row in rows))
+
+    def fetch_aoi(lat, lon, start_date, end_date, output_dir):
+        return {'SENTINEL_2': None}, {'SENTINEL_2': FetchResult('SENTINEL_2', 'SENTINEL_2', {}, None, 1, 0.0)}
+
+    output = tmp_path / 'out'
+    for _ in range(2):
+        summary = run_batch(str(input_path), str(output), fetch_aoi, 1000)
+    records = [json.loads(line) for line in (output / 'manifest.jsonl').read_text().splitlines()]
+    duplicates = [record for record in records if record['status'] == 'duplicate']
+    # Recorded once, not again on the resumed run
+    assert duplicates == [{'aoi_id': aoi_id(rows[1]), 'status': 'duplicate', 'covered_by': aoi_id(rows[0])}]
+    assert summary['aois_duplicate'] == 1 and summary['aois_skipped'] == 1
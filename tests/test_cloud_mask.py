@@ -0,0 +1,39 @@
+import numpy as np
+
+from cloud_mask import decode_mask, decode_qa_pixel, decode_scl, valid_fraction
+
+# Landsat Collection 2 QA_PIXEL words: clear land and clear water (bit 7),
+# with high-confidence bits (8-15) that must not invalidate a pixel on their own
+CLEAR_LAND = 21824
+CLEAR_WATER = 21952
+
+
+def test_qa_pixel_flags_fill_cloud_shadow_dilated_and_cirrus_bits():
+    invalid = [CLEAR_LAND | 1 << bit for bit in (0, 1, 2, 3, 4)]
+    qa = np.array([[CLEAR_LAND, CLEAR_WATER, 1 << 6, 0] + invalid], dtype=np.uint16)
+    assert decode_qa_pixel(qa).tolist() == [[True, True, True, True] + [False] * 5]
+    # Only cloud (3) and shadow (4) when dilation and cirrus are tolerated
+    assert decode_qa_pixel(qa, invalid_bits=(3, 4)).tolist() == [[True] * 7 + [False, False]]
+
+
+def test_qa_pixel_float_export_treats_nan_as_invalid():
+    qa = np.array([float(CLEAR_LAND), float(CLEAR_LAND | 1 << 3), np.nan], dtype=np.float32)
+    out = np.empty(3, dtype=bool)
+    result = decode_qa_pixel(qa, out=out)
+    assert result is out
+    assert out.tolist() == [True, False, False]
+
+
+def test_scl_flags_shadow_cloud_and_cirrus_classes():
+    # 4 vegetation, 5 bare soil, 6 water, 7 unclassified, 11 snow stay valid
+    scl = np.array([[4, 5, 6, 7, 11], [3, 8, 9, 10, 0]], dtype=np.uint8)
+    assert decode_scl(scl).tolist() == [[True] * 5, [False] * 5]
+    assert decode_scl(np.array([3.0, 8.0, 9.0, 10.0, 4.0, np.nan])).tolist() == [False] * 4 + [True, False]
+    assert decode_scl(scl, invalid_classes=(8, 9)).tolist() == [[True] * 5, [True, False, False, True, True]]
+
+
+def test_decode_mask_picks_the_sensor_band():
+    qa = np.array([CLEAR_LAND, CLEAR_LAND | 1 << 4], dtype=np.uint16)
+    assert decode_mask(qa, 'LANDSAT_8').tolist() == [True, False]
+    assert decode_mask(np.array([4, 9], dtype=np.uint8), 'SENTINEL_2').tolist() == [True, False]
+    assert valid_fraction(decode_mask(qa, 'LANDSAT_9')) == 0.5
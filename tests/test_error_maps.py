@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from error_maps import (COLOR_LUT, DIVERGING_LUT, ERROR_SATURATION, MASKED_COLOR, legend,
+                        render_error_map)
+
+
+def render(reference, test, kind, **kwargs):
+    out = np.zeros(reference.shape[:2] + (3,), dtype=np.uint8)
+    return render_error_map(reference, test, out, kind, **kwargs)
+
+
+def test_abs_error_saturates_at_the_configured_share():
+    reference = np.zeros((8, 8, 3), dtype=np.uint8)
+    test = reference.copy()
+    test[:, 4:] = 255
+    test[:, 2:4] = round(255 * ERROR_SATURATION / 2)
+    result = render(reference, test, 'abs_error')
+    assert (result[:, :2] == COLOR_LUT[0]).all()
+    assert (result[:, 2:4] == COLOR_LUT[128]).all()
+    assert (result[:, 4:] == COLOR_LUT[255]).all()
+
+
+def test_signed_error_keeps_the_sign_around_the_middle():
+    reference = np.full((4, 6, 3), 128, dtype=np.uint8)
+    test = reference.copy()
+    test[:, :2] = 0
+    test[:, 4:] = 255
+    result = render(reference, test, 'signed_error')
+    assert (result[:, :2] == DIVERGING_LUT[0]).all()
+    assert (result[:, 2:4] == DIVERGING_LUT[128]).all()
+    assert (result[:, 4:] == DIVERGING_LUT[255]).all()
+    assert (legend('signed_error')[0] == DIVERGING_LUT).all()
+
+
+def test_ssim_map_is_coolest_for_identical_images():
+    rng = np.random.default_rng(0)
+    reference = rng.integers(0, 256, (40, 30, 3), dtype=np.uint8)
+    result = render(reference, reference.copy(), 'ssim')
+    assert result.shape == (40, 30, 3) and (result == COLOR_LUT[0]).all()
+    noisy = render(reference, 255 - reference, 'ssim')
+    assert not (noisy == COLOR_LUT[0]).all(axis=2).any()
+
+
+def test_band_selection_and_masked_pixels():
+    reference = np.zeros((6, 6, 3), dtype=np.uint8)
+    test = reference.copy()
+    test[:, :, 1] = 255
+    mask = np.ones((6, 6), dtype=bool)
+    mask[0] = False
+    assert (render(reference, test, 'abs_error', band=0)[1:] == COLOR_LUT[0]).all()
+    assert (render(reference, test, 'abs_error', band=1)[1:] == COLOR_LUT[255]).all()
+    # The band mean of a full-range error in one of three bands is 1/3 of the range
+    mean = render(reference, test, 'abs_error', mask=mask)
+    assert (mean[1:] == COLOR_LUT[255]).all()
+    assert (mean[0] == MASKED_COLOR).all()
+
+
+def test_rejects_unknown_kinds_and_shape_mismatches():
+    image = np.zeros((4, 4, 3), dtype=np.uint8)
+    with pytest.raises(ValueError):
+        render(image, image, 'relative_error')
+    with pytest.raises(ValueError):
+        render(image, image[:2], 'abs_error')
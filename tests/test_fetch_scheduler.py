@@ -0,0 +1,127 @@
+import os
+import time
+import threading
+
+from fetch_scheduler import FetchTask, run_tasks
+from data_transfer import COLLECTION_IDS, fetch_all_sensors
+from local_backend import LocalBackend
+
+
+def flaky(failures):
+    """Returns a task function that raises `failures` times, then returns its call count"""
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise ConnectionError("flaky")
+        return len(calls)
+    return func
+
+
+class HangingBackend(LocalBackend):
+    """LocalBackend whose first `hangs` downloads block until `release` is set"""
+
+    def __init__(self, hangs, **kwargs):
+        super().__init__(**kwargs)
+        self.hangs = hangs
+        self.release = threading.Event()
+
+    def download(self, *args, **kwargs):
+        with self._lock:
+            hang = self.hangs > 0
+            self.hangs -= 1
+        if hang:
+            self.release.wait()
+        return super().download(*args, **kwargs)
+
+
+def test_tasks_succeed_and_report_progress():
+    progress = []
+    tasks = [FetchTask(f'task{i}', 'group', lambda i=i: i * 2, ()) for i in range(5)]
+    results = run_tasks(tasks, max_workers=2, on_progress=lambda result, done, total: progress.append((done, total)))
+    assert {key: result.value for key, result in results.items()} == {f'task{i}': i * 2 for i in range(5)}
+    assert all(result.error is None and result.attempts == 1 for result in results.values())
+    assert progress == [(done, 5) for done in range(1, 6)]
+
+
+def test_failed_attempts_are_retried():
+    results = run_tasks([FetchTask('ok', 'g', flaky(2), ()), FetchTask('broken', 'g', flaky(10), ())],
+                        retries=2, backoff=0.01)
+    assert results['ok'].value == 3 and results['ok'].attempts == 3
+    assert isinstance(results['broken'].error, ConnectionError) and results['broken'].attempts == 3
+
+
+def test_hung_attempts_time_out_without_blocking_retries_or_other_tasks():
+    release = threading.Event()
+    tasks = [FetchTask(f'hung{i}', 'g', release.wait, ()) for i in range(2)] + [FetchTask('quick', 'g', lambda: 1, ())]
+    started = time.monotonic()
+    try:
+        results = run_tasks(tasks, max_workers=2, timeout=0.5, retries=1, backoff=0.01)
+    finally:
+        release.set()
+    # Two attempts of 0.5 s each per hung task, not a wait for the hung threads
+    assert time.monotonic() - started < 3
+    for key in ('hung0', 'hung1'):
+        assert isinstance(results[key].error, TimeoutError) and results[key].attempts == 2
+    assert results['quick'].value == 1
+
+
+def test_retry_after_timeout_succeeds():
+    release = threading.Event()
+    attempts = []
+
+    def hang_once():
+        attempts.append(1)
+        if len(attempts) == 1:
+            release.wait()
+        return 'done'
+
+    try:
+        results = run_tasks([FetchTask('task', 'g', hang_once, ())], timeout=0.3, retries=1, backoff=0.01)
+    finally:
+        release.set()
+    assert results['task'].value == 'done' and results['task'].attempts == 2
+
+
+def test_fetch_all_sensors_against_stub_backend(tmp_path):
+    backend = LocalBackend(size=16)
+    rgb_paths, results = fetch_all_sensors(1.0, 2.0, '2024-01-01', '2024-12-31', str(tmp_path), backend=backend)
+    assert set(rgb_paths) == set(COLLECTION_IDS)
+    assert all(os.path.exists(path) for path in rgb_paths.values())
+    assert all(result.error is None for result in results.values())
+    # Staging directories are gone once the files are in place
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('.attempt_')]
+
+
+def test_fetch_all_sensors_retries_failed_downloads(tmp_path):
+    backend = LocalBackend(size=16, failure_rate=0.5, seed=3)
+    rgb_paths, results = fetch_all_sensors(1.0, 2.0, '2024-01-01', '2024-12-31', str(tmp_path),
+                                           backend=backend, retries=10, backoff=0.01)
+    assert backend.failures > 0
+    assert all(result.error is None for result in results.values())
+    assert all(os.path.exists(path) for path in rgb_paths.values())
+
+
+def test_fetch_all_sensors_times_out_hung_downloads(tmp_path):
+    backend = HangingBackend(hangs=1, size=16)
+    try:
+        rgb_paths, results = fetch_all_sensors(1.0, 2.0, '2024-01-01', '2024-12-31', str(tmp_path),
+                                               backend=backend, timeout=0.5, retries=1, backoff=0.01)
+    finally:
+        backend.release.set()
+    # The hung attempt timed out and its retry wrote the files
+    assert all(result.error is None for result in results.values())
+    assert sorted(result.attempts for result in results.values()) == [1, 1, 2]
+    assert all(os.path.exists(path) for path in rgb_paths.values())
+
+
+def test_fetch_all_sensors_reports_timeouts(tmp_path):
+    backend = HangingBackend(hangs=100, size=16)
+    try:
+        rgb_paths, results = fetch_all_sensors(1.0, 2.0, '2024-01-01', '2024-12-31', str(tmp_path),
+                                               backend=backend, timeout=0.2, retries=1, backoff=0.01)
+    finally:
+        backend.release.set()
+    assert all(isinstance(result.error, TimeoutError) for result in results.values())
+    assert all(path is None for path in rgb_paths.values())
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from histograms import compute_histograms, histograms_of_file
+from normalization import JOINT_BINS, HistogramAccumulator, normalize_array
+
+
+def test_exact_counts_match_np_histogram():
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (300, 200, 3), dtype=np.uint8)
+    histograms = compute_histograms(image, block_rows=64)
+    for band in range(3):
+        expected, _ = np.histogram(image[:, :, band], bins=256, range=(0, 256))
+        assert np.array_equal(histograms.counts[band], expected)
+    assert histograms.stats()[0]['min'] == image[:, :, 0].min()
+    assert histograms.cdf()[:, -1].tolist() == [1.0, 1.0, 1.0]
+
+
+def test_paired_counts_reference_and_joint_with_mask():
+    rng = np.random.default_rng(1)
+    reference = rng.integers(0, 65536, (64, 64), dtype=np.uint16)
+    image = reference.copy()
+    mask = np.ones(image.shape, dtype=bool)
+    mask[:8] = False
+    pair = compute_histograms(image, reference, block_rows=16, mask=mask)
+    assert pair.paired and pair.counts.sum() == pair.reference_counts.sum() == mask.sum()
+    # Identical images only fill the diagonal of the joint histogram
+    joint = pair.joint[0]
+    assert joint.shape == (JOINT_BINS, JOINT_BINS) and joint.sum() == np.trace(joint)
+    with pytest.raises(ValueError):
+        compute_histograms(image.astype(np.float32))
+
+
+def test_merged_partial_histograms_equal_one_pass(tmp_path):
+    rng = np.random.default_rng(2)
+    image = rng.integers(-1000, 1000, (5000, 4, 2), dtype=np.int16)
+    path = str(tmp_path / 'image.npy')
+    np.save(path, image)
+    parallel = histograms_of_file(path, workers=2)
+    assert np.array_equal(parallel.counts, compute_histograms(image).counts)
+
+
+def test_percentile_stretch_still_uses_the_accumulator():
+    values = np.arange(1000, dtype=np.float32).reshape(40, 25)
+    lo, hi = HistogramAccumulator(np.float32, 1, (0.0, 999.0)).update(values).percentiles(2, 98)
+    assert lo == pytest.approx(20, abs=1) and hi == pytest.approx(980, abs=1)
+    assert normalize_array(values, mode='percentile').max() == 255
@@ -0,0 +1,22 @@
+import threading
+import tracemalloc
+
+from instrumentation import Run, stage
+
+
+def test_run_started_in_another_thread_can_be_stopped_here():
+    runs = []
+
+    def rerun():
+        # Like a Streamlit rerun that ends with st.stop() before reaching run.stop()
+        run = Run('interrupted', log_path=None, trace_memory=True).start()
+        with stage('work'):
+            bytearray(1024)
+        runs.append(run)
+
+    thread = threading.Thread(target=rerun)
+    thread.start()
+    thread.join()
+    run = runs[0].stop()
+    assert run.elapsed is not None and not tracemalloc.is_tracing()
+    assert [row['stage'] for row in run.summary()] == ['work']
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from local_render import stretch_to_uint8
+from data_transfer import get_vis_params
+
+
+def ee_visualize(bands, vmin, vmax, gamma=1.0):
+    """Earth Engine's visualize() in float64: normalize, clamp, gamma, round halves up"""
+    scaled = np.clip((np.asarray(bands, dtype=np.float64) - vmin) / (vmax - vmin), 0.0, 1.0)
+    scaled = np.nan_to_num(scaled, nan=0.0) ** (1.0 / gamma)
+    return np.floor(scaled * 255.0 + 0.5).astype(np.uint8), scaled * 255.0
+
+
+@pytest.mark.parametrize('gamma', [1.0, 1.4])
+def test_matches_ee_visualize_over_reflectance_range(gamma):
+    bands = np.linspace(-0.05, 0.35, 40001)
+    expected, levels = ee_visualize(bands, 0.0, 0.3, gamma)
+    got = stretch_to_uint8(bands, 0.0, 0.3, gamma)
+    # Exact halves may land either side in float32; everything else must agree exactly
+    tie = np.abs(levels - np.floor(levels) - 0.5) < 1e-3
+    assert np.array_equal(got[~tie], expected[~tie])
+    assert np.abs(got[tie].astype(int) - expected[tie]).max(initial=0) <= 1
+
+
+def test_clips_at_min_and_max():
+    got = stretch_to_uint8(np.array([-1.0, 0.0, 0.3, 0.31, 5.0, np.nan]), 0.0, 0.3)
+    assert got.tolist() == [0, 0, 255, 255, 255, 0]
+
+
+def test_rounds_halves_up_at_the_edges():
+    # With a 0-255 range the levels are exact, so every .5 is a tie
+    bands = np.array([0.49, 0.5, 1.5, 127.5, 253.5, 254.49, 254.5, 255.0], dtype=np.float32)
+    assert stretch_to_uint8(bands, 0, 255).tolist() == [0, 1, 2, 128, 254, 254, 255, 255]
+
+
+def test_per_band_ranges_and_output_buffer():
+    bands = np.full((2, 2, 3), 0.2, dtype=np.float32)
+    out = np.zeros((2, 2, 3), dtype=np.uint8)
+    result = stretch_to_uint8(bands, [0.0, 0.1, 0.25], [0.3, 0.4, 0.3], out=out)
+    assert result is out
+    assert out.reshape(-1, 3).tolist() == [[170, 85, 0]] * 4
+
+
+@pytest.mark.parametrize('sensor', ['LANDSAT_8', 'SENTINEL_2'])
+def test_sensor_vis_params_use_the_reflectance_stretch(sensor):
+    params = get_vis_params(sensor)
+    assert params['min'] == 0 and params['max'] == 0.3
+    got = stretch_to_uint8(np.array([0.0, 0.15, 0.3]), params['min'], params['max'], params.get('gamma', 1.0))
+    assert got.tolist() == ee_visualize([0.0, 0.15, 0.3], params['min'], params['max'],
+                                        params.get('gamma', 1.0))[0].tolist()
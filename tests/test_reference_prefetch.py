@@ -0,0 +1,95 @@
+import time
+import threading
+
+import pytest
+
+import data_transfer
+from reference_prefetch import Prefetcher
+
+
+class Recorder:
+    """Fetch function that records its calls and fails while `fail` is set"""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def __call__(self, *args):
+        self.calls.append((time.monotonic(), args))
+        if self.fail:
+            raise ConnectionError("offline")
+        return args
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_repeated_requests_do_not_restart_the_debounce():
+    fetch = Recorder()
+    prefetcher = Prefetcher(fetch, debounce=0.3)
+    started = time.monotonic()
+    # Reruns keep asking for the same key more often than the debounce
+    while time.monotonic() - started < 0.6 and not fetch.calls:
+        prefetcher.request('a', 1)
+        time.sleep(0.05)
+    assert fetch.calls and fetch.calls[0][0] - started < 0.5
+
+
+def test_failures_are_kept_until_the_key_changes():
+    fetch = Recorder(fail=True)
+    prefetcher = Prefetcher(fetch, debounce=0.01)
+    prefetcher.request('a', 1)
+    wait_for(lambda: prefetcher.status('a') == 'failed')
+    for _ in range(5):
+        assert prefetcher.request('a', 1) == 'failed'
+        time.sleep(0.02)
+    assert len(fetch.calls) == 1
+    with pytest.raises(ConnectionError):
+        prefetcher.get('a', 1, timeout=1)
+    assert len(fetch.calls) == 1
+
+    # Another key, then back: the old failure is forgotten
+    fetch.fail = False
+    prefetcher.request('b', 2)
+    assert prefetcher.status('a') is None
+    assert prefetcher.get('a', 1, timeout=1) == (1,)
+
+
+def test_get_with_retry_fetches_a_failed_key_again():
+    fetch = Recorder(fail=True)
+    prefetcher = Prefetcher(fetch, debounce=0.01)
+    with pytest.raises(ConnectionError):
+        prefetcher.get('a', 1, timeout=1)
+    fetch.fail = False
+    assert prefetcher.get('a', 1, timeout=1, retry=True) == (1,)
+    assert len(fetch.calls) == 2
+
+
+def test_non_interactive_initialization_fails_instead_of_prompting(monkeypatch):
+    class FakeEE:
+        def Initialize(self):
+            raise Exception("no credentials")
+
+        def Authenticate(self, **kwargs):
+            raise AssertionError("prompted for authentication")
+
+    monkeypatch.setattr(data_transfer, 'ee', FakeEE())
+    monkeypatch.setattr(data_transfer, '_initialized', False)
+    errors = []
+
+    def background():
+        with data_transfer.non_interactive():
+            try:
+                data_transfer.ensure_initialized()
+            except RuntimeError as e:
+                errors.append(e)
+
+    thread = threading.Thread(target=background)
+    thread.start()
+    thread.join(2)
+    assert not thread.is_alive() and len(errors) == 1
+    assert not data_transfer._init_lock.locked()
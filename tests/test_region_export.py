@@ -0,0 +1,23 @@
+from local_backend import LocalBackend
+from region_export import fetch_region
+
+
+class RecordingBackend(LocalBackend):
+    """LocalBackend remembering the keyword arguments of every select_image call"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.selects = []
+
+    def select_image(self, *args, **kwargs):
+        self.selects.append(kwargs)
+        return super().select_image(*args, **kwargs)
+
+
+def test_fetch_region_filters_scenes_by_the_region_polygon(tmp_path):
+    ring = [[10.0, 50.0], [10.02, 50.0], [10.02, 50.02], [10.0, 50.02]]
+    backend = RecordingBackend(size=16)
+    path, results = fetch_region('SENTINEL_2', '2024-01-01', '2024-12-31', str(tmp_path), ring=ring,
+                                 backend=backend, tile_pixels=128, max_workers=2)
+    assert backend.selects[0]['footprint'] == backend.polygon(ring)
+    assert results and all(result.error is None for result in results.values())
@@ -0,0 +1,19 @@
+import numpy as np
+
+from raster_store import create_raster, finish_raster, open_raster
+from sr_inference import ResampleUpscaler, upscale_file
+
+
+def test_pooled_tiles_match_a_single_pass(tmp_path):
+    rng = np.random.default_rng(0)
+    source = str(tmp_path / 'source.tif')
+    data = create_raster(source, (100, 90, 3), np.uint8)
+    data[...] = rng.integers(0, 256, data.shape, dtype=np.uint8)
+    finish_raster(source, data, band_names=('red', 'green', 'blue'))
+    del data
+
+    upscaler = ResampleUpscaler('bicubic', 2)
+    pooled = upscale_file(source, str(tmp_path / 'pooled.tif'), upscaler, tile_size=40, overlap=16, workers=2)
+    single = upscale_file(source, str(tmp_path / 'single.tif'), upscaler, tile_size=40, overlap=16, workers=1)
+    assert open_raster(pooled).shape == (200, 180, 3)
+    assert np.array_equal(open_raster(pooled), open_raster(single))
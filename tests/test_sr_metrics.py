@@ -0,0 +1,64 @@
+import math
+
+import numpy as np
+import pytest
+
+from sr_metrics import compute_metrics
+
+
+def test_tiled_metrics_equal_whole_image():
+    rng = np.random.default_rng(0)
+    reference = rng.integers(0, 256, (90, 70, 3), dtype=np.uint8)
+    test = np.clip(reference + rng.normal(0, 8, reference.shape), 0, 255).astype(np.uint8)
+    tiled = compute_metrics(reference, test, tile=16, workers=4)
+    whole = compute_metrics(reference, test, tile=4096, workers=1)
+    for a, b in zip(tiled['channels'], whole['channels']):
+        assert a['psnr'] == pytest.approx(b['psnr'], rel=1e-9)
+        assert a['ssim'] == pytest.approx(b['ssim'], rel=1e-5)
+        assert a['ms_ssim'] == pytest.approx(b['ms_ssim'], rel=1e-5)
+    assert tiled['sam'] == pytest.approx(whole['sam'])
+
+
+def test_psnr_at_known_noise_level():
+    reference = np.full((64, 64), 0.5, dtype=np.float32)
+    # A +-0.1 checkerboard has a mean squared error of exactly 0.01, i.e. 20 dB at range 1
+    noise = np.where(np.indices(reference.shape).sum(axis=0) % 2, 0.1, -0.1).astype(np.float32)
+    result = compute_metrics(reference, reference + noise, data_range=1.0, ms_ssim=False)
+    channel = result['channels'][0]
+    assert channel['psnr'] == pytest.approx(20.0, abs=1e-4)
+    assert channel['rmse'] == pytest.approx(0.1, rel=1e-5)
+    assert math.isnan(result['sam'])
+
+
+def test_identical_images_score_perfectly():
+    rng = np.random.default_rng(1)
+    image = rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)
+    result = compute_metrics(image, image.copy())
+    for channel in result['channels']:
+        assert channel['ssim'] == pytest.approx(1.0)
+        assert channel['ms_ssim'] == pytest.approx(1.0)
+        assert channel['psnr'] == float('inf') and channel['rmse'] == 0.0
+    assert result['sam'] == pytest.approx(0.0, abs=1e-4)
+    assert result['valid_pixels'] == 64 * 64
+
+
+def test_masked_pixels_are_excluded():
+    rng = np.random.default_rng(2)
+    reference = rng.integers(0, 256, (80, 64, 3), dtype=np.uint8)
+    test = np.clip(reference + rng.normal(0, 4, reference.shape), 0, 255).astype(np.uint8)
+    mask = np.ones(reference.shape[:2], dtype=bool)
+    mask[:40] = False
+    # Corrupt rows that no SSIM window centred on a valid pixel reaches
+    corrupted = test.copy()
+    corrupted[:30] = 255 - corrupted[:30]
+
+    clean = compute_metrics(reference, test, mask=mask, ms_ssim=False)
+    masked = compute_metrics(reference, corrupted, mask=mask, ms_ssim=False)
+    assert masked['valid_pixels'] == mask.sum()
+    for a, b in zip(masked['channels'], clean['channels']):
+        assert a['psnr'] == pytest.approx(b['psnr'])
+        assert a['ssim'] == pytest.approx(b['ssim'])
+    assert masked['sam'] == pytest.approx(clean['sam'])
+    assert compute_metrics(reference, corrupted, ms_ssim=False)['channels'][0]['psnr'] < masked['channels'][0]['psnr']
+    with pytest.raises(ValueError):
+        compute_metrics(reference, test, mask=mask[:10])
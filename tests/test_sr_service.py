@@ -0,0 +1,89 @@
+import os
+import json
+import threading
+from http.server import ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+import data_transfer
+from sr_service import JobQueue, ServiceHandler
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'satellite_images_20250408_220231')
+REFERENCE = os.path.join(SAMPLE_DIR, 'SENTINEL_2_12.9716_77.5946_rgb.tif')
+IMAGE = os.path.join(SAMPLE_DIR, 'LANDSAT_8_12.9716_77.5946_rgb.tif')
+
+
+@pytest.fixture(scope='module')
+def service(tmp_path_factory):
+    cwd = os.getcwd()
+    # The job queue's TileCache lives under the working directory
+    os.chdir(tmp_path_factory.mktemp('service'))
+    queue = JobQueue(workers=1)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ServiceHandler)
+    server.queue = queue
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}', queue
+    finally:
+        server.shutdown()
+        server.server_close()
+        queue.close()
+        os.chdir(cwd)
+
+
+def call(url, body=None):
+    data = None if body is None else json.dumps(body).encode('utf-8')
+    try:
+        with urlopen(Request(url, data=data, method='GET' if data is None else 'POST'), timeout=30) as response:
+            return response.status, json.loads(response.read())
+    except HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+@pytest.mark.parametrize('wait', ['abc', '-1', 'nan'])
+def test_bad_wait_is_a_400(service, wait):
+    url, _ = service
+    assert call(f'{url}/jobs/unknown?wait={wait}')[0] == 400
+    assert call(f'{url}/score?wait={wait}', {'image': IMAGE, 'reference': REFERENCE})[0] == 400
+
+
+def test_null_preview_size_is_a_400(service):
+    url, _ = service
+    status, payload = call(f'{url}/score', {'image': IMAGE, 'reference': REFERENCE, 'preview_size': None})
+    assert status == 400 and 'preview_size' in payload['error']
+
+
+def test_batch_with_one_bad_image_queues_nothing(service):
+    url, queue = service
+    before = queue.stats()
+    status, _ = call(f'{url}/score', {'images': [IMAGE, 'missing.tif'], 'reference': REFERENCE})
+    assert status == 400
+    assert queue.stats() == before
+
+
+def test_valid_batch_is_scored(service):
+    url, _ = service
+    status, payload = call(f'{url}/score?wait=120', {'images': [IMAGE, IMAGE], 'reference': REFERENCE})
+    assert status == 202 and len(payload['jobs']) == 2
+    assert all(job['status'] == 'done' for job in payload['jobs'])
+
+
+def test_reference_job_fails_instead_of_prompting(service, monkeypatch):
+    class FakeEE:
+        def Initialize(self):
+            raise Exception("no credentials")
+
+        def Authenticate(self, **kwargs):
+            raise AssertionError("prompted for authentication")
+
+    monkeypatch.setattr(data_transfer, 'ee', FakeEE())
+    monkeypatch.setattr(data_transfer, '_initialized', False)
+    url, _ = service
+    status, job = call(f'{url}/reference?wait=30',
+                       {'lat': 1.0, 'lon': 2.0, 'start_date': '2024-01-01', 'end_date': '2024-12-31'})
+    assert status == 200 and job['status'] == 'failed'
+    assert 'not authenticated' in job['error']
@@ -0,0 +1,73 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from tile_cache import TileCache
+
+
+def index_last_used(cache, key):
+    with open(cache.index_path) as f:
+        return json.load(f)[key]['last_used']
+
+
+def test_hits_defer_index_writes_until_flush(tmp_path):
+    source = tmp_path / 'a.tif'
+    source.write_bytes(b'data')
+    cache = TileCache(str(tmp_path / 'cache'), flush_interval=3600)
+    cache.put('ab12', {'rgb': str(source)})
+    written = index_last_used(cache, 'ab12')
+
+    for _ in range(100):
+        assert cache.get('ab12')['rgb'].endswith('a.tif')
+    assert index_last_used(cache, 'ab12') == written
+
+    cache.flush()
+    assert index_last_used(cache, 'ab12') > written
+
+
+def test_recency_survives_reopening_for_eviction(tmp_path):
+    root = str(tmp_path / 'cache')
+    cache = TileCache(root, max_bytes=10, flush_interval=3600)
+    for key in ('k1', 'k2'):
+        path = tmp_path / f'{key}.tif'
+        path.write_bytes(b'12345')
+        cache.put(key, {'rgb': str(path)})
+    # k1 becomes the most recently used, but only in memory until the next put
+    cache.get('k1')
+    path = tmp_path / 'k3.tif'
+    path.write_bytes(b'12345')
+    cache.put('k3', {'rgb': str(path)})
+    assert set(TileCache(root, max_bytes=10)._entries) == {'k1', 'k3'}
+
+
+def test_caches_sharing_a_root_keep_each_others_entries(tmp_path):
+    root = str(tmp_path / 'cache')
+    first = TileCache(root, max_bytes=12, flush_interval=3600)
+    second = TileCache(root, max_bytes=12, flush_interval=3600)
+    for cache, key in ((first, 'k1'), (second, 'k2'), (first, 'k3')):
+        path = tmp_path / f'{key}.tif'
+        path.write_bytes(b'12345')
+        cache.put(key, {'rgb': str(path)})
+
+    # Both caches count every entry towards max_bytes, so k1 was evicted once
+    with open(first.index_path) as f:
+        assert set(json.load(f)) == {'k2', 'k3'}
+    assert not os.path.exists(os.path.join(root, 'k1', 'k1'))
+    assert second.get('k3') is not None
+    assert second.get('k1') is None
+
+
+def test_concurrent_puts_of_one_key(tmp_path):
+    cache = TileCache(str(tmp_path / 'cache'))
+    sources = []
+    for i in range(8):
+        path = tmp_path / f'src{i}' / 'a.tif'
+        path.parent.mkdir()
+        path.write_bytes(b'data')
+        sources.append(str(path))
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda path: cache.put('ab12', {'rgb': path}), sources))
+
+    assert len({result['rgb'] for result in results}) == 1
+    assert open(results[0]['rgb'], 'rb').read() == b'data'
+    assert [name for name in os.listdir(cache.root) if name.startswith('.put_')] == []
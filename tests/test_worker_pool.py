@@ -0,0 +1,43 @@
+import sys
+import types
+
+import numpy as np
+
+from histograms import compute_histograms, histograms_of_file
+from worker_pool import skip_main_in_workers
+
+PAGE = '''
+import os
+# Runs whenever a worker re-imports this script
+open(os.path.join({marker_dir!r}, str(os.getpid())), 'w').close()
+'''
+
+
+def run_as_main(tmp_path, skip):
+    """Counts the page runs while histogram workers start under a guard-less __main__ script"""
+    marker_dir = tmp_path / f'runs_{skip}'
+    marker_dir.mkdir()
+    script = tmp_path / f'page_{skip}.py'
+    script.write_text(PAGE.format(marker_dir=str(marker_dir)))
+    # What Streamlit does: a fresh __main__ module with a file and no spec
+    page = types.ModuleType('__main__')
+    page.__file__ = str(script)
+    if skip:
+        skip_main_in_workers(vars(page))
+
+    image = np.random.default_rng(0).integers(0, 256, (5000, 8, 3), dtype=np.uint8)
+    path = str(tmp_path / f'image_{skip}.npy')
+    np.save(path, image)
+    main = sys.modules['__main__']
+    sys.modules['__main__'] = page
+    try:
+        histograms = histograms_of_file(path, workers=2)
+    finally:
+        sys.modules['__main__'] = main
+    assert np.array_equal(histograms.counts, compute_histograms(image).counts)
+    return len(list(marker_dir.iterdir()))
+
+
+def test_workers_rerun_a_guardless_script_unless_skipped(tmp_path):
+    assert run_as_main(tmp_path, skip=False) == 2
+    assert run_as_main(tmp_path, skip=True) == 0
@@ -0,0 +1,170 @@
+import math
+import numpy as np
+import tifffile
+
+from normalization import HistogramAccumulator, compute_range_blocks, normalize_block
+from coregistration import read_georeference
+from raster import Raster
+from raster_store import read_index
+from instrumentation import stage
+
+# Approximate compressed bytes read from the file per decode batch
+SEGMENT_BUFFER_BYTES = 4 * 1024 * 1024
+
+
+def _open(fileobj):
+    """Opens a path or a seekable file object (e.g. a Streamlit upload) from its start"""
+    if hasattr(fileobj, 'seek'):
+        fileobj.seek(0)
+    return tifffile.TiffFile(fileobj)
+
+
+def _pick_page(tif, max_size):
+    """Returns the smallest pyramid level that is still at least max_size wide/high"""
+    series = tif.series[0]
+    page = series.pages[0]
+    if max_size is None:
+        return page
+    for level in series.levels[1:]:
+        candidate = level.pages[0]
+        if max(candidate.shaped[2], candidate.shaped[3]) < max_size:
+            break
+        page = candidate
+    return page
+
+
+def iter_blocks(page, step=1):
+    """Decodes a TIFF page strip by strip (or tile by tile).
+
+    Yields (y, x, sample, block) where block is a (rows, cols, samples) view of
+    the decoded segment, cropped to the image and subsampled every `step`
+    pixels, and (y, x) is its position in the subsampled output grid. Only one
+    decoded segment is held in memory at a time.
+    """
+    _, _, height, width, _ = page.shaped
+    # Keep the read-ahead small so compressed bytes are not buffered wholesale
+    for segment, index, _ in page.segments(buffersize=SEGMENT_BUFFER_BYTES):
+        if segment is None:
+            continue
+        sample, depth, y0, x0, _ = index
+        if depth != 0:
+            continue
+        block = segment[0]
+        # Edge tiles are padded to the full tile size
+        block = block[:height - y0, :width - x0]
+        if step > 1:
+            row_start = (-y0) % step
+            col_start = (-x0) % step
+            block = block[row_start::step, col_start::step]
+            if block.size == 0:
+                continue
+            yield (y0 + row_start) // step, (x0 + col_start) // step, sample, block
+        else:
+            yield y0, x0, sample, block
+
+
+def file_nodata(page):
+    """Returns the GDAL_NODATA value of a page, or None when the tag is absent"""
+    if page.tags.get(42113) is None:
+        return None
+    return page.nodata
+
+
+def read_tiff_uint8(fileobj, max_size=None, mode='minmax', low=2.0, high=98.0, per_band=False, out=None):
+    """Streams a TIFF into a preallocated uint8 array normalized to 0-255.
+
+    Non-uint8 data is normalized chunk by chunk (see normalization.py for the
+    modes), so peak memory is the output plus one decoded strip or tile.
+    Pixels equal to the file's GDAL_NODATA value are ignored and written as 0.
+    With `max_size`, only a downsampled preview whose longest side is about
+    max_size is produced, using a pyramid level from the file when there is one.
+    `out` may be a preallocated (rows, cols, samples) uint8 array (e.g. a
+    memory map) to decode into; it is filled and returned as given.
+    """
+    with _open(fileobj) as tif:
+        page = _pick_page(tif, max_size)
+        separate, _, height, width, contig = page.shaped
+        step = 1
+        if max_size is not None and max(height, width) > max_size:
+            step = math.ceil(max(height, width) / max_size)
+
+        shape = (-(-height // step), -(-width // step), separate * contig)
+        squeeze = out is None and shape[2] == 1
+        if out is None:
+            out = np.zeros(shape, dtype=np.uint8)
+        elif out.shape != shape:
+            raise ValueError(f"Output shape {out.shape} does not match {shape}")
+
+        nodata = file_nodata(page)
+        stretch = page.dtype != np.uint8 or mode != 'minmax'
+        if stretch:
+            def blocks():
+                return ((sample * contig, block) for _, _, sample, block in iter_blocks(page))
+            with stage('stretch_range', mode=mode):
+                lo, hi = compute_range_blocks(blocks, page.dtype, separate * contig,
+                                              mode, low, high, per_band, nodata)
+            lo = np.broadcast_to(np.asarray(lo, dtype=np.float32), (separate * contig,))
+            hi = np.broadcast_to(np.asarray(hi, dtype=np.float32), (separate * contig,))
+
+        with stage('tiff_decode', out.nbytes):
+            for y, x, sample, block in iter_blocks(page, step):
+                rows, cols, samples = block.shape
+                bands = slice(sample * contig, sample * contig + samples)
+                target = out[y:y + rows, x:x + cols, bands]
+                if stretch:
+                    normalize_block(block, lo[bands], hi[bands], target, nodata)
+                else:
+                    target[...] = block
+
+    if squeeze:
+        return out[:, :, 0]
+    return out
+
+
+def read_tiff_histograms(fileobj):
+    """Returns the HistogramAccumulator of a TIFF's native 8/16-bit values.
+
+    The file is decoded strip by strip (or tile by tile), so images larger
+    than RAM are counted with one decoded segment in memory.
+    """
+    with _open(fileobj) as tif:
+        page = tif.series[0].pages[0]
+        separate, _, _, _, contig = page.shaped
+        histograms = HistogramAccumulator(page.dtype, separate * contig)
+        for _, _, sample, block in iter_blocks(page):
+            histograms.update(block, band_start=sample * contig)
+    return histograms
+
+
+def read_tiff_info(fileobj):
+    """Returns (height, width, samples, dtype) of the first image without decoding it"""
+    with _open(fileobj) as tif:
+        separate, _, height, width, contig = tif.series[0].pages[0].shaped
+        return height, width, separate * contig, tif.series[0].pages[0].dtype
+
+
+def read_tiff_raster(fileobj):
+    """Returns a whole TIFF as a Raster in the layout the file stores it in.
+
+    Uncompressed files on disk (e.g. raster_store outputs) are memory-mapped
+    rather than decoded, and planar files stay (bands, H, W), so nothing is
+    copied or transposed. Band names and scale/offset come from the
+    raster_store sidecar index when there is one.
+    """
+    index = read_index(fileobj) if isinstance(fileobj, str) else None
+    with _open(fileobj) as tif:
+        page = tif.series[0].pages[0]
+        layout = 'byx' if page.shaped[0] > 1 else 'yxb'
+        nodata = file_nodata(page)
+        data = None
+        if isinstance(fileobj, str):
+            try:
+                data = tifffile.memmap(fileobj, mode='r')
+            except ValueError:
+                pass
+        if data is None:
+            data = page.asarray()
+    if index is None:
+        return Raster(data, layout, nodata=nodata, georeference=read_georeference(fileobj))
+    return Raster(data, layout, index['bands'], index.get('nodata', nodata), index.get('scale'),
+                  index.get('offset'), index.get('georeference'))
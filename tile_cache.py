@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import atexit
+import shutil
+import hashlib
+import weakref
+import tempfile
+import threading
+import contextlib
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows: processes cannot share a cache directory safely
+    fcntl = None
+
+DEFAULT_CACHE_DIR = os.path.join('.sr_cache', 'tiles')
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# Seconds between index writes caused only by cache hits. Recency is kept in
+# memory and flushed at most this often (and at exit), so a crash can only
+# lose some LRU order, never an entry
+INDEX_FLUSH_INTERVAL = 30.0
+
+# Every live cache, flushed once at interpreter exit
+_open_caches = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_open_caches():
+    for cache in list(_open_caches):
+        cache.flush()
+
+
+def content_hash(data):
+    """Returns a short hash of a bytes-like object (e.g. an upload's getbuffer())"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def make_cache_key(**params):
+    """Returns a stable content hash for a set of export parameters"""
+    payload = json.dumps(params, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class TileCache:
+    """Persistent on-disk LRU cache for exported GeoTIFF/PNG files.
+
+    Entries live in `<root>/<key[:2]>/<key>/` and are tracked in a single
+    `index.json`, so lookups are a dict access instead of a directory walk.
+    The least recently used entries are evicted once `max_bytes` is exceeded.
+    Hits only update access times in memory; they reach the index on the
+    next put(), at most every `flush_interval` seconds, or via flush().
+
+    Several processes may share a root (the dashboards, sr_service and the
+    CLIs): every index write re-reads the index under a lock on `index.lock`
+    and merges this process's changes into it, and put() moves a fully
+    staged entry directory into place with one rename.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, flush_interval=INDEX_FLUSH_INTERVAL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.index_path = os.path.join(root, 'index.json')
+        self.lock_path = os.path.join(root, 'index.lock')
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._entries = self._load_index()
+        # Changes not yet merged into the index: new entries, hit times, stale keys
+        self._added = {}
+        self._touched = {}
+        self._removed = set()
+        self._saved_at = time.monotonic()
+        _open_caches.add(self)
+
+    @contextlib.contextmanager
+    def _index_lock(self):
+        """Holds the inter-process lock on the index and entry directories"""
+        with open(self.lock_path, 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return OrderedDict()
+        # Oldest access first, so the front of the dict is the next eviction
+        return OrderedDict(sorted(entries.items(), key=lambda item: item[1]['last_used']))
+
+    def _merged_index(self):
+        """Returns the on-disk index with this process's pending changes applied"""
+        entries = self._load_index()
+        for key in self._removed:
+            entry = entries.get(key)
+            # Keep the key when another process has stored it again since
+            if entry is not None and not _files_exist(entry):
+                del entries[key]
+        entries.update(self._added)
+        for key, last_used in self._touched.items():
+            if key in entries:
+                entries[key]['last_used'] = max(entries[key]['last_used'], last_used)
+        return OrderedDict(sorted(entries.items(), key=lambda item: item[1]['last_used']))
+
+    def _save_index(self):
+        """Merges pending changes into the index, evicts and writes it; needs _index_lock()"""
+        entries = self._merged_index()
+        for key in self._removed:
+            if key not in entries:
+                shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+        self._evict(entries)
+        self._write_index(entries)
+
+    def _write_index(self, entries):
+        tmp_path = f'{self.index_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.index_path)
+        self._entries = entries
+        self._added.clear()
+        self._touched.clear()
+        self._removed.clear()
+        self._saved_at = time.monotonic()
+
+    def flush(self):
+        """Writes access times of recent hits to the index"""
+        with self._lock:
+            if self._touched:
+                with self._index_lock():
+                    self._save_index()
+
+    @property
+    def total_bytes(self):
+        return sum(entry['size'] for entry in self._entries.values())
+
+    def get(self, key):
+        """Returns the cached {kind: path} dict for a key, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                # Another process may have stored it since the index was read
+                self._entries = self._merged_index()
+                entry = self._entries.get(key)
+                if entry is None:
+                    return None
+            if not _files_exist(entry):
+                # Files were removed behind our back
+                del self._entries[key]
+                self._added.pop(key, None)
+                self._touched.pop(key, None)
+                self._removed.add(key)
+                with self._index_lock():
+                    self._save_index()
+                return None
+            entry['last_used'] = time.time()
+            self._entries.move_to_end(key)
+            self._touched[key] = entry['last_used']
+            if time.monotonic() - self._saved_at >= self.flush_interval:
+                with self._index_lock():
+                    self._save_index()
+            return dict(entry['files'])
+
+    def put(self, key, files):
+        """Stores {kind: path} files under a key and returns the cached paths"""
+        entry_dir = self._entry_dir(key)
+        staging = tempfile.mkdtemp(prefix='.put_', dir=self.root)
+        try:
+            names = {}
+            size = 0
+            for kind, path in files.items():
+                target = os.path.join(staging, os.path.basename(path))
+                # Hard links are free; fall back to a copy across file systems
+                try:
+                    os.link(path, target)
+                except OSError:
+                    shutil.copy2(path, target)
+                names[kind] = os.path.basename(path)
+                size += os.path.getsize(target)
+            cached = {kind: os.path.join(entry_dir, name) for kind, name in names.items()}
+
+            with self._lock, self._index_lock():
+                current = self._merged_index().get(key)
+                if current is not None and current['files'] == cached and _files_exist(current):
+                    # Stored concurrently by another thread or process
+                    self._touched[key] = time.time()
+                else:
+                    # Whatever is left of an old or interrupted entry goes
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                    os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+                    os.replace(staging, entry_dir)
+                    self._removed.discard(key)
+                    self._added[key] = {'files': cached, 'size': size, 'last_used': time.time()}
+                self._save_index()
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return cached
+
+    def _evict(self, entries):
+        """Drops the oldest entries of a merged index until it fits in max_bytes"""
+        total = sum(entry['size'] for entry in entries.values())
+        while total > self.max_bytes and len(entries) > 1:
+            oldest, entry = entries.popitem(last=False)
+            total -= entry['size']
+            shutil.rmtree(self._entry_dir(oldest), ignore_errors=True)
+
+    def clear(self):
+        """Removes every cached entry"""
+        with self._lock, self._index_lock():
+            for key in set(self._merged_index()) | set(self._entries):
+                shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            self._write_index(OrderedDict())
+
+
+def _files_exist(entry):
+    return all(os.path.exists(path) for path in entry['files'].values())
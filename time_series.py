@@ -0,0 +1,172 @@
+import os
+import json
+import shutil
+import tempfile
+from datetime import datetime, timezone
+import numpy as np
+
+from data_transfer import (BUFFER_METERS, CLOUD_THRESHOLD, COLLECTION_IDS, cloud_property, ee,
+                           ensure_initialized, export_geotiff, filter_collection, get_vis_params,
+                           scale_bands, staged_export)
+from fetch_scheduler import FetchTask, run_tasks
+from raster_store import open_raster
+from instrumentation import stage
+
+# Scenes stacked per copy block when the stack is grown
+COPY_SCENES = 8
+
+
+def series_paths(output_dir, name, lat, lon):
+    """Returns the (stack .npy, index .json) paths of one sensor's time series"""
+    base = os.path.join(output_dir, f"{name}_{lat:.4f}_{lon:.4f}_series")
+    return base + '.npy', base + '.json'
+
+
+def load_series_index(index_path):
+    """Returns the index of a stored time series, or None when there is none yet"""
+    try:
+        with open(index_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def list_scenes(point, start_date, end_date, names=tuple(COLLECTION_IDS), cloud_threshold=CLOUD_THRESHOLD):
+    """Lists every acceptable scene of each sensor with a single getInfo call.
+
+    Returns {name: [{'id', 'time_start', 'date', 'cloud'}, ...]} sorted by
+    acquisition time. Only scene metadata is transferred, no pixels.
+    """
+    columns = {}
+    for name in names:
+        collection = ee.ImageCollection(COLLECTION_IDS[name])
+        filtered = filter_collection(collection, name, point, start_date, end_date, cloud_threshold)
+        columns[name] = filtered.sort('system:time_start').reduceColumns(
+            ee.Reducer.toList(3), ['system:index', 'system:time_start', cloud_property(name)]).get('list')
+
+    # One round trip for every sensor instead of one per image
+    with stage('list_scenes'):
+        rows = ee.Dictionary(columns).getInfo()
+    scenes = {}
+    for name in names:
+        scenes[name] = [{
+            'id': f"{COLLECTION_IDS[name]}/{index}",
+            'time_start': int(time_start),
+            'date': datetime.fromtimestamp(time_start / 1000, tz=timezone.utc).strftime('%Y-%m-%d'),
+            'cloud': float(cloud),
+        } for index, time_start, cloud in rows.get(name) or []]
+    return scenes
+
+
+def _export_scene(scene, name, region, base_filename):
+    image = scale_bands(ee.Image(scene['id']), name).clip(region)
+    return staged_export(export_geotiff, image, name, region, base_filename)
+
+
+def _append_to_stack(stack_path, index, scenes, tif_paths):
+    """Writes a new (T, H, W, bands) stack holding the stored scenes plus new ones.
+
+    Existing scenes are copied a few at a time from the old memory map and
+    each new scene is copied from its mapped GeoTIFF, so the stack never has
+    to fit in memory. New scenes are cropped or NaN-padded to the stack grid.
+    """
+    old = np.load(stack_path, mmap_mode='r') if index is not None and os.path.exists(stack_path) else None
+    first = open_raster(tif_paths[0])
+    grid = old.shape[1:] if old is not None else (first.shape if first.ndim == 3 else first.shape + (1,))
+    stored = old.shape[0] if old is not None else 0
+
+    tmp_path = stack_path + '.tmp.npy'
+    stack = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32,
+                                      shape=(stored + len(scenes),) + tuple(grid))
+    for start in range(0, stored, COPY_SCENES):
+        stack[start:start + COPY_SCENES] = old[start:start + COPY_SCENES]
+    for offset, path in enumerate(tif_paths):
+        raster = open_raster(path)
+        if raster.ndim == 2:
+            raster = raster[:, :, np.newaxis]
+        rows, cols, bands = (min(a, b) for a, b in zip(raster.shape, grid))
+        target = stack[stored + offset]
+        target[...] = np.nan
+        target[:rows, :cols, :bands] = raster[:rows, :cols, :bands]
+    stack.flush()
+    del stack, old
+    os.replace(tmp_path, stack_path)
+    return grid
+
+
+def fetch_time_series(lat, lon, start_date, end_date, output_dir, names=tuple(COLLECTION_IDS),
+                      max_workers=4, timeout=300, retries=2, on_progress=None):
+    """Downloads every acceptable scene per sensor into one stacked array file.
+
+    Each sensor gets `<name>_<lat>_<lon>_series.npy`, a float32 reflectance
+    stack of shape (time, height, width, bands), and a `.json` index with the
+    scene ids, acquisition dates, cloud cover and band names. On re-runs only
+    scenes acquired after the newest stored one are fetched and appended.
+    Scenes are downloaded on a bounded pool via fetch_scheduler.run_tasks.
+    Returns {name: number of scenes added}.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    ensure_initialized()
+    point = ee.Geometry.Point([lon, lat])
+    region = point.buffer(BUFFER_METERS).bounds()
+
+    indexes = {name: load_series_index(series_paths(output_dir, name, lat, lon)[1]) for name in names}
+    # Incremental runs start at the newest stored acquisition
+    starts = {name: indexes[name]['scenes'][-1]['date'] if indexes[name] and indexes[name]['scenes']
+              else start_date for name in names}
+    earliest = min(starts.values())
+    listed = list_scenes(point, earliest, end_date, names)
+
+    new_scenes = {}
+    for name in names:
+        known = {scene['id'] for scene in indexes[name]['scenes']} if indexes[name] else set()
+        newest = indexes[name]['scenes'][-1]['time_start'] if indexes[name] and indexes[name]['scenes'] else None
+        new_scenes[name] = [scene for scene in listed[name] if scene['id'] not in known
+                            and (newest is None or scene['time_start'] > newest)]
+
+    download_dir = tempfile.mkdtemp(dir=output_dir)
+    try:
+        tasks = []
+        for name in names:
+            for scene in new_scenes[name]:
+                base_filename = os.path.join(download_dir, scene['id'].replace('/', '_'))
+                tasks.append(FetchTask(scene['id'], name, _export_scene, (scene, name, region, base_filename)))
+        results = run_tasks(tasks, max_workers=max_workers, timeout=timeout, retries=retries,
+                            on_progress=on_progress)
+
+        added = {}
+        for name in names:
+            failed = [scene['time_start'] for scene in new_scenes[name] if results[scene['id']].error is not None]
+            # Keep the stack in time order: scenes after a failed one wait for the next run
+            fetched = [scene for scene in new_scenes[name] if not failed or scene['time_start'] < min(failed)]
+            added[name] = len(fetched)
+            if not fetched:
+                continue
+
+            stack_path, index_path = series_paths(output_dir, name, lat, lon)
+            with stage('append_stack', sensor=name):
+                grid = _append_to_stack(stack_path, indexes[name], fetched,
+                                        [results[scene['id']].value['tif'] for scene in fetched])
+            index = indexes[name] or {
+                'collection': COLLECTION_IDS[name],
+                'lat': lat,
+                'lon': lon,
+                'bands': get_vis_params(name)['bands'],
+                'shape': None,
+                'scenes': [],
+            }
+            index['scenes'].extend(fetched)
+            index['shape'] = [len(index['scenes'])] + list(grid)
+            tmp_path = index_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(index, f, indent=1)
+            os.replace(tmp_path, index_path)
+    finally:
+        shutil.rmtree(download_dir, ignore_errors=True)
+    return added
+
+
+def open_time_series(output_dir, name, lat, lon):
+    """Returns (read-only (T, H, W, bands) memory map, index) of a stored series"""
+    stack_path, index_path = series_paths(output_dir, name, lat, lon)
+    return np.load(stack_path, mmap_mode='r'), load_series_index(index_path)
@@ -0,0 +1,31 @@
+import importlib.machinery
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Workers are spawned rather than forked: pools are created from threaded
+# servers (the Streamlit dashboard, sr_service), and a forked child starts
+# with a copy of every lock another thread happened to hold
+_SPAWN = multiprocessing.get_context('spawn')
+
+
+def process_pool(max_workers, initializer=None, initargs=()):
+    """Returns a ProcessPoolExecutor with spawned workers.
+
+    Worker functions must live in importable modules; scripts without a
+    `__main__` guard (Streamlit pages) call skip_main_in_workers() first.
+    """
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=_SPAWN, initializer=initializer,
+                               initargs=initargs)
+
+
+def skip_main_in_workers(script_globals):
+    """Keeps spawned workers from re-running a script that has no `__main__` guard.
+
+    A spawned worker re-imports the parent's `__main__` as `__mp_main__`, so
+    functions defined there can be unpickled. Streamlit runs each page as
+    `__main__` with no guard, so every worker would run the whole page
+    again. Called with the page's globals(), this names its module spec
+    '__main__', which multiprocessing skips instead of re-importing.
+    """
+    if script_globals.get('__spec__') is None:
+        script_globals['__spec__'] = importlib.machinery.ModuleSpec('__main__', None)